@@ -7,20 +7,46 @@
 # Release Note: "QUESTRADE" supply the SEC data
 
 from waitress import serve
-from flask import Flask, request, jsonify, render_template
-import ta as ta_lib
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context, url_for
 import os
+import io
+import sys
+import atexit
+import copy
+import logging
+import random
+import uuid
+import socket
+import struct
+import hashlib
 import json
+import hmac
+import cProfile
+import pstats
+import math
 import requests
 import pandas as pd
 import pandas_ta as ta
 import numpy as np
 import re
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 from pathlib import Path
 import time
-from threading import Lock
+from threading import Condition, Event, Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from logging.handlers import QueueHandler, QueueListener
+from contextvars import ContextVar
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import tempfile
+try:
+    import fcntl
+except ImportError:  # Windows: token lock is process-local only
+    fcntl = None
 
 # Load environment variables
 load_dotenv()
@@ -30,27 +56,402 @@ FINANCIAL_API_KEY = os.getenv('FINANCIAL_API_KEY')
 XAI_API_KEY = os.getenv('XAI_API_KEY')
 QUESTRADE_TOKEN = os.getenv('QUESTRADE_TOKEN')
 
-# Global token state
+# Logging: records are handed to a bounded queue and written by a QueueListener thread,
+# so request threads never wait on stdout / app.log. LOG_FORMAT=json writes one JSON
+# object per line (extra= fields included); DEBUG records are sampled at LOG_DEBUG_SAMPLE.
+# When the queue is full, records are dropped and counted rather than blocking.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_DEBUG_SAMPLE = float(os.getenv('LOG_DEBUG_SAMPLE', '0.05'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+request_id_var = ContextVar("request_id", default="-")
+log = logging.getLogger("app")
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request ID and samples DEBUG records."""
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and random.random() >= LOG_DEBUG_SAMPLE:
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage()
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in LOG_RECORD_FIELDS)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    dropped = 0
+
+    def prepare(self, record):
+        # QueueHandler.prepare folds the traceback into msg and clears exc_info/exc_text;
+        # keep the message and the formatted traceback apart so JsonFormatter can emit "exc"
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            DroppingQueueHandler.dropped += 1
+
+def setup_logging():
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+    handler = DroppingQueueHandler(Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.addFilter(RequestContextFilter())
+    log.addHandler(handler)
+    log.setLevel(LOG_LEVEL)
+    log.propagate = False
+    listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # flush what is queued on shutdown
+
+setup_logging()
+
+# Per-host upstream limits: token bucket (rate/s, burst), concurrency ceiling, wait queue.
+# Hosts starting with "." match as a suffix (Questrade hands out apiNN.iq.questrade.com).
+UPSTREAM_LIMITS = {
+    "default":             {"rate": 5,  "burst": 10, "concurrency": 8},
+    ".iq.questrade.com":   {"rate": 15, "burst": 20, "concurrency": 10},
+    "login.questrade.com": {"rate": 1,  "burst": 2,  "concurrency": 1},
+    "api.financialdatasets.ai": {"rate": 5, "burst": 10, "concurrency": 5},
+    "api.x.ai":            {"rate": 2,  "burst": 5,  "concurrency": 4},
+}
+UPSTREAM_LIMITS.update(json.loads(os.getenv('UPSTREAM_LIMITS', '{}')))
+UPSTREAM_MAX_QUEUE = int(os.getenv('UPSTREAM_MAX_QUEUE', '50'))      # waiters per host
+UPSTREAM_MAX_WAIT = float(os.getenv('UPSTREAM_MAX_WAIT', '30'))      # seconds
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '3'))   # on 429
+JOB_UPSTREAM_MAX_WAIT = float(os.getenv('JOB_UPSTREAM_MAX_WAIT', '300'))  # seconds, background job requests
+
+# True on threads doing background work (chart jobs): their requests wait behind interactive ones
+upstream_background_var = ContextVar("upstream_background", default=False)
+
+class UpstreamBusy(requests.exceptions.RequestException):
+    """Raised when a host's wait queue is full or the wait would exceed UPSTREAM_MAX_WAIT."""
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    """Raised without sending anything while a host's circuit breaker is open."""
+
+# Circuit breaker per host: BREAKER_FAILURES errors in a row (5xx, network errors) fail that
+# host's requests fast for BREAKER_COOLDOWN seconds; then one trial request decides whether
+# it closes again or stays open for another cooldown. 429s have their own backoff.
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '30'))   # seconds
+
+class HostLimiter:
+    """
+    Token bucket plus an AIMD concurrency limit for one upstream host.
+    The concurrency limit grows by ~1 per limit's worth of successes and halves
+    (at most once per second) on 429s, 5xx and network errors. Background requests
+    (upstream_background_var) leave one slot free and wait while an interactive
+    request is queued.
+    """
+    def __init__(self, host, rate, burst, concurrency, min_concurrency=1):
+        self.host = host
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_concurrency = float(concurrency)
+        self.min_concurrency = float(min_concurrency)
+        self.limit = float(concurrency)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self.waiting = 0
+        self.waiting_interactive = 0
+        self.failures = 0            # errors in a row
+        self.open_until = 0.0
+        self.trial = False           # a half-open trial request is in flight
+        self.cond = Condition()
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "rejected": 0, "short_circuited": 0,
+                      "wait_total": 0.0, "wait_max": 0.0}
+
+    def acquire(self):
+        start = time.monotonic()
+        background = upstream_background_var.get()
+        max_wait = JOB_UPSTREAM_MAX_WAIT if background else UPSTREAM_MAX_WAIT
+        with self.cond:
+            if self.waiting >= UPSTREAM_MAX_QUEUE:
+                self.stats["rejected"] += 1
+                raise UpstreamBusy(f"Too many queued requests for {self.host}")
+            self.waiting += 1
+            if not background:
+                self.waiting_interactive += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.breaker(now) != "closed" and (now < self.open_until or self.trial):
+                        self.stats["short_circuited"] += 1
+                        raise UpstreamUnavailable(f"{self.host} is failing; not retrying for {max(self.open_until - now, 0):.0f}s")
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    delay = self.blocked_until - now
+                    slots = int(self.limit)
+                    if background:
+                        slots = 0 if self.waiting_interactive else max(slots - 1, 1)
+                    if delay <= 0 and self.in_flight < slots:
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            self.in_flight += 1
+                            self.trial = self.failures >= BREAKER_FAILURES   # half-open: this request decides
+                            break
+                        delay = (1 - self.tokens) / self.rate
+                    remaining = start + max_wait - now
+                    if remaining <= 0:
+                        self.stats["rejected"] += 1
+                        raise UpstreamBusy(f"Timed out waiting for a {self.host} request slot")
+                    # delay <= 0 here means we wait for a release() to free a slot
+                    self.cond.wait(min(delay, remaining) if delay > 0 else remaining)
+            finally:
+                self.waiting -= 1
+                if not background:
+                    self.waiting_interactive -= 1
+                    self.cond.notify_all()   # background waiters may go now
+            waited = time.monotonic() - start
+            self.stats["requests"] += 1
+            self.stats["wait_total"] += waited
+            self.stats["wait_max"] = max(self.stats["wait_max"], waited)
+
+    def breaker(self, now=None):
+        if self.failures < BREAKER_FAILURES:
+            return "closed"
+        return "open" if (now or time.monotonic()) < self.open_until else "half-open"
+
+    def release(self, outcome):
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == "error":
+                self.failures += 1
+                if self.failures >= BREAKER_FAILURES:
+                    if self.breaker(now) != "open":
+                        log.warning("Circuit breaker for %s open for %ss after %s errors in a row", self.host, BREAKER_COOLDOWN, self.failures)
+                    self.open_until = now + BREAKER_COOLDOWN
+            elif outcome == "ok":
+                if self.failures >= BREAKER_FAILURES:
+                    log.info("Circuit breaker for %s closed", self.host)
+                self.failures = 0
+            self.trial = False
+            if outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            else:
+                self.stats["throttled" if outcome == "throttled" else "errors"] += 1
+                if now - self.last_decrease >= 1:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self.last_decrease = now
+            self.cond.notify_all()
+
+    def backoff(self, seconds):
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def snapshot(self):
+        with self.cond:
+            requests_done = self.stats["requests"]
+            return {
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.limit),
+                "tokens": round(self.tokens, 2),
+                "blocked_for": round(max(self.blocked_until - time.monotonic(), 0), 2),
+                "requests": requests_done,
+                "throttled": self.stats["throttled"],
+                "errors": self.stats["errors"],
+                "rejected": self.stats["rejected"],
+                "breaker": self.breaker(),
+                "short_circuited": self.stats["short_circuited"],
+                "wait_avg": round(self.stats["wait_total"] / requests_done, 4) if requests_done else 0.0,
+                "wait_max": round(self.stats["wait_max"], 4),
+            }
+
+_limiters = {}
+_limiters_lock = Lock()
+
+def host_limiter(url):
+    host = urlparse(url).hostname or ""
+    with _limiters_lock:
+        if host not in _limiters:
+            conf = UPSTREAM_LIMITS.get(host)
+            if conf is None:
+                conf = next((v for k, v in UPSTREAM_LIMITS.items() if k.startswith(".") and host.endswith(k)),
+                            UPSTREAM_LIMITS["default"])
+            _limiters[host] = HostLimiter(host, **conf)
+        return _limiters[host]
+
+# Helper function to read a Retry-After header (delta-seconds or HTTP-date)
+def retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+# Helper function to hold a limiter slot while a streamed body is read: released once, when
+# the caller closes the response
+def release_on_close(response, limiter, outcome):
+    close = response.close
+    released = []
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released:
+                released.append(True)
+                limiter.release(outcome)
+    response.close = close_and_release
+
+def upstream_request(method, url, **kwargs):
+    """
+    requests.request() behind the per-host limiter.
+    429s (and 503s carrying Retry-After) pause the whole host for the advertised
+    time and are retried up to UPSTREAM_MAX_RETRIES; the last response is returned.
+    Raises UpstreamBusy if no slot frees up within UPSTREAM_MAX_WAIT.
+    With stream=True the slot is held until the caller closes the response.
+    """
+    limiter = host_limiter(url)
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        limiter.acquire()
+        outcome = "error"
+        response = None
+        try:
+            response = requests.request(method, url, **kwargs)
+            if response.status_code == 429 or (response.status_code == 503 and "Retry-After" in response.headers):
+                outcome = "throttled"
+            elif response.status_code < 500:
+                outcome = "ok"
+        finally:
+            if response is not None and kwargs.get("stream") and outcome != "throttled":
+                release_on_close(response, limiter, outcome)
+            else:
+                limiter.release(outcome)
+        if outcome != "throttled" or attempt == UPSTREAM_MAX_RETRIES:
+            return response
+        delay = retry_after_seconds(response.headers.get("Retry-After"))
+        if delay is None:
+            delay = min(2 ** attempt, 30)
+        if delay > UPSTREAM_MAX_WAIT:
+            return response
+        log.warning("%s throttled (%s); retrying in %.1fs", limiter.host, response.status_code, delay)
+        limiter.backoff(delay)
+        response.close()
+    return response
+
+# Helper function to tell rate-limit failures apart from other upstream errors
+def upstream_throttled(e):
+    response = getattr(e, "response", None)
+    return isinstance(e, UpstreamBusy) or (response is not None and response.status_code == 429)
+
+def upstream_get(url, **kwargs):
+    return upstream_request("GET", url, **kwargs)
+
+def upstream_post(url, **kwargs):
+    return upstream_request("POST", url, **kwargs)
+
+QUESTRADE_TOKEN_STATE = os.getenv('QUESTRADE_TOKEN_STATE', '.questrade_token.json')
+QUESTRADE_REFRESH_AHEAD = int(os.getenv('QUESTRADE_REFRESH_AHEAD', '300'))  # seconds before expiry
+
+# Global token state. Request threads only read _token (one tuple, swapped atomically);
+# the background refresher is the only writer.
 _token_lock = Lock()
-_access_token = None
-_token_expires_at = 0          # unix timestamp
-_api_server = None
+_token = (None, None, 0)       # (access_token, api_server, expires_at unix timestamp)
+_token_wakeup = Event()
+_token_refresher = None
+_token_error = None            # (message, retry_at) of the refresher's last failure; None after a success
 _current_refresh_token = QUESTRADE_TOKEN
 
+# Helper function to replace a file's contents atomically (temp file + rename)
+def write_atomic(path, text):
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent or ".", prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        binary = isinstance(text, bytes)
+        with os.fdopen(fd, "wb" if binary else "w", encoding=None if binary else "utf-8") as tmp:
+            tmp.write(text)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        if path.exists():
+            os.chmod(tmp_path, path.stat().st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+# Cross-process lock around the shared token state file (POSIX flock; process-local elsewhere)
+@contextmanager
+def token_file_lock():
+    with _token_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f"{QUESTRADE_TOKEN_STATE}.lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def load_token_state():
+    """
+    Adopts the token another worker process wrote to the shared state file.
+    Returns True if the current token is not yet expired.
+    """
+    global _token, _current_refresh_token
+    try:
+        state = json.loads(Path(QUESTRADE_TOKEN_STATE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return time.time() < _token[2]
+    if state.get("refresh_token"):
+        _current_refresh_token = state["refresh_token"]
+    if state.get("access_token") and state.get("expires_at", 0) > _token[2]:
+        _token = (state["access_token"], state["api_server"], state["expires_at"])
+    return time.time() < _token[2]
+
 def refresh_questrade_token(force=False):
     """
     Refreshes access_token if expired or force=True.
-    Updates globals + .env with new refresh_token.
+    Runs on the background refresher; holds the cross-process token lock so only
+    one worker performs the OAuth POST, then publishes the result to the state
+    file and .env with atomic renames.
     Returns (access_token, api_server) or raises exception.
     """
-    global _access_token, _token_expires_at, _api_server, _current_refresh_token
-    with _token_lock:
+    global _token, _current_refresh_token
+    with token_file_lock():
+        # Another process may have refreshed (and rotated the refresh token) already
+        load_token_state()
         now = time.time()
-        if not force and _access_token and now < _token_expires_at - 300:  # 5 min buffer
-            return _access_token, _api_server
-        print("Refreshing Questrade token...")
+        if not force and _token[0] and now < _token[2] - QUESTRADE_REFRESH_AHEAD:
+            return _token[0], _token[1]
+        log.info("Refreshing Questrade token...")
         try:
-            resp = requests.post(  # ← use POST (more correct than GET for token endpoint)
+            resp = upstream_post(  # ← use POST (more correct than GET for token endpoint)
                 "https://login.questrade.com/oauth2/token",
                 data={
                     "grant_type": "refresh_token",
@@ -64,12 +465,17 @@ def refresh_questrade_token(force=False):
             new_refresh = data["refresh_token"]
             expires_in = int(data["expires_in"])          # usually 1800
             new_api_server = data["api_server"]
+            # Publish to the other workers first; the old refresh token is now dead
+            write_atomic(QUESTRADE_TOKEN_STATE, json.dumps({
+                "access_token": new_access,
+                "api_server": new_api_server,
+                "expires_at": now + expires_in,
+                "refresh_token": new_refresh
+            }))
             # Update globals
-            _access_token = new_access
-            _api_server = new_api_server
-            _token_expires_at = now + expires_in
+            _token = (new_access, new_api_server, now + expires_in)
             _current_refresh_token = new_refresh   # rotation!
-            # Update .env (atomic-ish replace)
+            # Update .env
             env_path = Path(".env")
             if env_path.exists():
                 content = env_path.read_text(encoding="utf-8")
@@ -79,9 +485,9 @@ def refresh_questrade_token(force=False):
                     content,
                     flags=re.MULTILINE | re.IGNORECASE
                 )
-                env_path.write_text(new_content, encoding="utf-8")
-                print("Updated .env with new refresh_token")
-            print(f"Token refreshed. Expires in {expires_in}s")
+                write_atomic(env_path, new_content)
+                log.info("Updated .env with new refresh_token")
+            log.info("Token refreshed. Expires in %ss", expires_in)
             return new_access, new_api_server
         except requests.exceptions.HTTPError as e:
             if e.response.status_code in (400, 401):
@@ -91,6 +497,55 @@ def refresh_questrade_token(force=False):
         except Exception as e:
             raise RuntimeError(f"Token refresh failed: {str(e)}") from e
 
+# Background loop: renew the token QUESTRADE_REFRESH_AHEAD seconds before it expires
+def questrade_token_refresher():
+    global _token_error
+    retry_delay = 5
+    while True:
+        try:
+            refresh_questrade_token()
+            _token_error = None
+            retry_delay = 5
+            wait = max(_token[2] - QUESTRADE_REFRESH_AHEAD - time.time(), 1)
+        except Exception as e:
+            log.error("Background token refresh failed: %s", e)
+            wait = retry_delay
+            retry_delay = min(retry_delay * 2, 300)
+            _token_error = (str(e), time.time() + wait)
+        _token_wakeup.wait(wait)
+        _token_wakeup.clear()
+
+def start_questrade_token_refresher():
+    global _token_refresher
+    if _token_refresher is None and QUESTRADE_TOKEN:
+        _token_refresher = Thread(target=questrade_token_refresher, name="questrade-token", daemon=True)
+        _token_refresher.start()
+
+def questrade_token(timeout=20):
+    """
+    Returns the current (access_token, api_server) for request threads.
+    Never performs the OAuth refresh itself: it only picks up a newer token
+    from the shared state file, or wakes the background refresher and waits.
+    While the refresher is backing off after a failure, raises that failure
+    instead of waiting.
+    """
+    access_token, api_server, expires_at = _token
+    if access_token and time.time() < expires_at:
+        return access_token, api_server
+    start_questrade_token_refresher()
+    error = _token_error
+    if error and time.time() < error[1] and not load_token_state():
+        raise RuntimeError(f"Questrade token refresh failed, next attempt in {error[1] - time.time():.0f}s: {error[0]}")
+    _token_wakeup.set()
+    deadline = time.time() + timeout
+    while not load_token_state():
+        if _token_error is not None and _token_error is not error:
+            raise RuntimeError(f"Questrade token refresh failed: {_token_error[0]}")
+        if time.time() >= deadline:
+            raise RuntimeError("Questrade access token is not available yet")
+        time.sleep(0.1)
+    return _token[0], _token[1]
+
 
 #QUESTRADE_TOKEN = os.getenv('QUESTRADE_TOKEN')
 #TOKEN_RESPONSE = requests.get(f"https://login.questrade.com/oauth2/token?grant_type=refresh_token&refresh_token={QUESTRADE_TOKEN}").json()
@@ -106,18 +561,28 @@ def refresh_questrade_token(force=False):
 
 # Function to fetch tickers from API
 def fetch_tickers(url):
+    if not url:
+        return []
     try:
         response = requests.get(url)
         response.raise_for_status()
         data = response.json()
         return data.get("tickers", [])
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching tickers from {url}: {e}")
+        log.error("Error fetching tickers from %s: %s", url, e)
         return []
 
-# Fetch tickers
-SEC_tickers = fetch_tickers(SEC_URL)
-CRYPTO_tickers = fetch_tickers(CRYPTO_URL)
+# Ticker lists, filled by load_tickers() when the app starts rather than on import, so the
+# batch/backfill/stream tools can import this module without network access
+SEC_tickers = []
+CRYPTO_tickers = []
+# Hash sets for request validation; an empty list (ticker source down) disables the check
+KNOWN_TICKERS = {"SEC": frozenset(), "CRYPTO": frozenset()}
+
+def load_tickers():
+    SEC_tickers[:] = fetch_tickers(SEC_URL)
+    CRYPTO_tickers[:] = fetch_tickers(CRYPTO_URL)
+    KNOWN_TICKERS.update(SEC=frozenset(SEC_tickers), CRYPTO=frozenset(CRYPTO_tickers))
 
 # HTML Template with Indicators Dropdown
 index_html_template = """
@@ -408,6 +873,73 @@ index_html_template = """
             color: #4f46e5; /* indigo-600 */
         }}
     </style>
+    <script id="chart-worker" type="text/js-worker">
+        // Chart worker: fetches /prices, decodes the JSON and builds typed column arrays off the main thread.
+        // Columns and signal indexes go back as transferables, so handing them over costs no copy.
+        // Heavy requests come back 202 with a chart job: poll its result URL until the chart is ready
+        async function fetchChart(url, onJob) {{
+            let response = await fetch(url);
+            while (response.status === 202) {{
+                const job = await response.json();
+                onJob(job);
+                await new Promise(resolve => setTimeout(resolve, 1500));
+                response = await fetch(new URL(job.result, url).href);
+            }}
+            return response;
+        }}
+        self.onmessage = async event => {{
+            const {{ seq, url, fields, signalFields }} = event.data;
+            try {{
+                const response = await fetchChart(url, job => self.postMessage({{ seq, job }}));
+                if (!response.ok) {{
+                    let message = `HTTP error! status: ${{response.status}}`;
+                    try {{
+                        const err = await response.json();
+                        if (err.error) message = err.error;
+                    }} catch (e) {{ /* not JSON */ }}
+                    self.postMessage({{ seq, ok: false, error: message }});
+                    return;
+                }}
+                let data = (await response.json()) || [];
+                if (response.headers.get('X-Series-Order') !== 'ascending') {{
+                    const keyed = data.map(d => [Date.parse(d.time), d]);
+                    keyed.sort((a, b) => a[0] - b[0]);
+                    data = keyed.map(k => k[1]);
+                }}
+                const n = data.length;
+                // Plotly draws dates in the exchange's wall-clock time and ignores offsets,
+                // so times are sent as that wall-clock time in epoch milliseconds
+                const cols = {{ time: new Float64Array(n) }};
+                fields.forEach(f => cols[f] = new Float64Array(n));
+                const idx = {{}}, when = {{}};
+                signalFields.forEach(f => {{ idx[f] = []; when[f] = []; }});
+                for (let i = 0; i < n; i++) {{
+                    const d = data[i];
+                    cols.time[i] = Date.parse(d.time.slice(0, 19) + 'Z');
+                    for (const f of fields) {{
+                        const v = d[f];
+                        cols[f][i] = v === null || v === undefined ? NaN : v;
+                    }}
+                    for (const f of signalFields) {{
+                        if (d[f] !== null && d[f] !== undefined) {{
+                            idx[f].push(i);
+                            when[f].push(new Date(d.time).toLocaleString());
+                        }}
+                    }}
+                }}
+                cols.volume = cols.volume.map(v => v || 0);
+                const signals = {{}};
+                signalFields.forEach(f => signals[f] = {{ idx: Int32Array.from(idx[f]), when: when[f] }});
+                const transfer = Object.values(cols).map(c => c.buffer)
+                    .concat(Object.values(signals).map(s => s.idx.buffer));
+                const stale = response.headers.get('X-Stale') ? Number(response.headers.get('Age')) : null;
+                const truncated = response.headers.get('X-Truncated-At');
+                self.postMessage({{ seq, ok: true, cols, signals, stale, truncated }}, transfer);
+            }} catch (e) {{
+                self.postMessage({{ seq, ok: false, error: e.message }});
+            }}
+        }};
+    </script>
     <script>
         var tickers = {{
             "SEC": {SEC_tickers},
@@ -464,7 +996,7 @@ index_html_template = """
             aiBtn.disabled = true;
         
             try {{
-                const response = await fetch('/analyze_ai', {{
+                const response = await fetch('/analyze_ai/stream', {{
                     method: 'POST',
                     headers: {{'Content-Type': 'application/json'}},
                     body: JSON.stringify({{
@@ -478,13 +1010,37 @@ index_html_template = """
                     throw new Error(errorData.error || `Server error: ${{response.status}}`);
                 }}
                 
-                const data = await response.json();
-        
-                if (data.error) {{
-                    text.textContent = "Error: " + data.error;
-                }} else {{
-                    title.textContent = `${{data.ticker}} (${{data.category}})`;
-                    text.textContent = data.analysis || "No analysis returned.";
+                // Render tokens as they arrive instead of waiting for the full completion
+                title.textContent = "";
+                text.textContent = "";
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = "";
+                let received = false;
+                while (true) {{
+                    const {{ value, done }} = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, {{ stream: true }});
+                    const events = buffer.split("\\n\\n");
+                    buffer = events.pop();  // keep the incomplete tail for the next chunk
+                    for (const evt of events) {{
+                        if (!evt.startsWith("data:")) continue;
+                        const msg = JSON.parse(evt.slice(5));
+                        if (msg.type === "meta") {{
+                            title.textContent = `${{msg.ticker}} (${{msg.category}})`;
+                            loading.classList.add('hidden');
+                            result.classList.remove('hidden');
+                        }} else if (msg.type === "delta") {{
+                            text.textContent += msg.text;
+                            received = true;
+                        }} else if (msg.type === "error") {{
+                            text.textContent += (received ? "\\n\\n" : "") + "Error: " + msg.error;
+                            received = true;
+                        }}
+                    }}
+                }}
+                if (!received) {{
+                    text.textContent = "No analysis returned.";
                 }}
         
                 loading.classList.add('hidden');
@@ -597,6 +1153,210 @@ index_html_template = """
         function openFearandGreed() {{
             window.open('https://coinmarketcap.com/charts/fear-and-greed-index/', '_blank', 'width=1024,height=768,toolbar=no,location=no,status=no,menubar=no,resizable=yes');
         }}
+        // Columns the chart reads from /prices rows
+        const CHART_FIELDS = ['open', 'high', 'low', 'close', 'volume',
+            'MACD_12_26_9', 'MACDs_12_26_9', 'MACDh_12_26_9', 'BBU_10_2.0', 'BBL_10_2.0',
+            'EMA_10', 'EMA_20', 'EMA_50', 'SMA_20', 'RSI_14', 'STOCHk_14_3_3', 'STOCHd_14_3_3', 'Close_Signal_Price'];
+        const SIGNAL_FIELDS = ['Buy_Signal_Price', 'Sell_Signal_Price', 'Close_Signal_Price'];
+
+        // One pass over the rows: column arrays for every trace plus the row indexes of each signal
+        function buildColumns(data, sorted) {{
+            if (!sorted) {{
+                // Parse each timestamp once instead of inside the comparator
+                const keyed = data.map(d => [Date.parse(d.time), d]);
+                keyed.sort((a, b) => a[0] - b[0]);
+                data = keyed.map(k => k[1]);
+            }}
+            const n = data.length;
+            const cols = {{ time: new Array(n) }};
+            CHART_FIELDS.forEach(f => cols[f] = new Array(n));
+            const signals = {{}};
+            SIGNAL_FIELDS.forEach(f => signals[f] = {{ idx: [], when: [] }});
+            for (let i = 0; i < n; i++) {{
+                const d = data[i];
+                cols.time[i] = d.time;
+                for (const f of CHART_FIELDS) {{
+                    const v = d[f];
+                    cols[f][i] = v === undefined ? null : v;
+                }}
+                for (const f of SIGNAL_FIELDS) {{
+                    if (d[f] !== null && d[f] !== undefined) {{
+                        signals[f].idx.push(i);
+                        signals[f].when.push(new Date(d.time).toLocaleString());
+                    }}
+                }}
+            }}
+            cols.volume = cols.volume.map(v => v || 0);
+            return {{ cols, signals }};
+        }}
+
+        // One shared chart worker; falls back to decoding on the main thread where workers are unavailable
+        let chartWorker = null;
+        let chartWorkerSeq = 0;
+        const chartWorkerPending = {{}};
+        function getChartWorker() {{
+            if (chartWorker === null) {{
+                try {{
+                    const source = document.getElementById('chart-worker').textContent;
+                    chartWorker = new Worker(URL.createObjectURL(new Blob([source], {{ type: 'text/javascript' }})));
+                    chartWorker.onmessage = event => {{
+                        const {{ seq, ok, error, cols, signals, stale, truncated, job }} = event.data;
+                        if (job) {{
+                            if (chartWorkerPending[seq]) chartWorkerPending[seq].onJob(job);
+                            return;
+                        }}
+                        const pending = chartWorkerPending[seq];
+                        delete chartWorkerPending[seq];
+                        if (!pending) return;
+                        if (ok) pending.resolve({{ cols, signals, stale, truncated }});
+                        else pending.reject(new Error(error));
+                    }};
+                    chartWorker.onerror = event => {{
+                        Object.keys(chartWorkerPending).forEach(seq => {{
+                            chartWorkerPending[seq].reject(new Error(event.message || "Chart worker failed"));
+                            delete chartWorkerPending[seq];
+                        }});
+                    }};
+                }} catch (e) {{
+                    console.warn("Chart worker unavailable, decoding on the main thread:", e);
+                    chartWorker = false;
+                }}
+            }}
+            return chartWorker || null;
+        }}
+
+        // Resolves to {{ cols, signals, stale, truncated }} for a /prices URL (stale: age in seconds of data
+        // served while the server refreshes it, else null; truncated: time after which the data provider
+        // returned no bars, else null); onJob gets the job status while a heavy request runs
+        function loadChartColumns(url, onJob) {{
+            const worker = getChartWorker();
+            if (!worker) {{
+                const poll = response => {{
+                    if (response.status !== 202) return response;
+                    return response.json().then(job => {{
+                        onJob(job);
+                        return new Promise(resolve => setTimeout(resolve, 1500))
+                            .then(() => fetch(job.result)).then(poll);
+                    }});
+                }};
+                return fetch(url).then(poll)
+                    .then(response => {{
+                        if (!response.ok) {{
+                            return response.json().then(err => {{ throw new Error(err.error || `HTTP error! status: ${{response.status}}`); }});
+                        }}
+                        // The server marks responses it already returns in time order
+                        const sorted = response.headers.get('X-Series-Order') === 'ascending';
+                        const stale = response.headers.get('X-Stale') ? Number(response.headers.get('Age')) : null;
+                        const truncated = response.headers.get('X-Truncated-At');
+                        return response.json().then(data => Object.assign(buildColumns(data || [], sorted), {{ stale, truncated }}));
+                    }});
+            }}
+            const seq = ++chartWorkerSeq;
+            return new Promise((resolve, reject) => {{
+                chartWorkerPending[seq] = {{ resolve, reject, onJob }};
+                // Blob workers have no base URL, so send an absolute one
+                worker.postMessage({{ seq, url: new URL(url, location.href).href,
+                                     fields: CHART_FIELDS, signalFields: SIGNAL_FIELDS }});
+            }});
+        }}
+
+        // Traces and layout from column arrays; line traces use WebGL (scattergl)
+        function buildChart(cols, signals, selectedIndicators, selectedTicker, uirevision) {{
+            const x = cols.time;
+            const pick = (idx, arr, scale) => Array.from(idx, i => arr[i] * scale);
+            const line = (y, name, color, yaxis, extra) => Object.assign({{
+                x, y, type: 'scattergl', mode: 'lines', name, line: {{ color }}, yaxis
+            }}, extra || {{}});
+
+            let traces = [
+                {{ x, open: cols.open, high: cols.high, low: cols.low, close: cols.close,
+                  type: 'candlestick', name: 'Price', yaxis: 'y' }},
+                {{ x, y: cols.volume, type: 'bar', name: 'Volume',
+                  marker: {{ color: 'rgba(128,128,128,0.5)' }}, yaxis: 'y2' }},
+                line(cols['MACD_12_26_9'], 'MACD', 'blue', 'y3'),
+                line(cols['MACDs_12_26_9'], 'MACD Signal', 'orange', 'y3'),
+                {{ x, y: cols['MACDh_12_26_9'], type: 'bar', name: 'MACD Histogram',
+                  marker: {{ color: 'green' }}, yaxis: 'y3' }},
+                line(cols['BBU_10_2.0'], 'Upper Band', 'rgba(255,0,0,0.5)', 'y', {{ hoverinfo: 'none' }}),
+                line(cols['BBL_10_2.0'], 'Lower Band', 'rgba(0,0,255,0.5)', 'y', {{ hoverinfo: 'none' }})
+            ];
+
+            // signal.idx: row indexes, signal.when: display time of each signal
+            const markers = (signal, y, symbol, color, label, name) => ({{
+                x: Array.from(signal.idx, i => x[i]), y, type: 'scattergl', mode: 'markers',
+                marker: {{ symbol, size: 12, color }},
+                hovertext: signal.when.map(when => `${{label}} AT ${{when}}`),
+                hoverinfo: 'text', name, yaxis: 'y'
+            }});
+            const buy = signals['Buy_Signal_Price'];
+            if (buy.idx.length > 0) {{
+                traces.push(markers(buy, pick(buy.idx, cols['BBL_10_2.0'], 0.97), 'triangle-up', 'green', 'BUY', 'Buy Signal'));
+            }}
+            const sell = signals['Sell_Signal_Price'];
+            if (sell.idx.length > 0) {{
+                traces.push(markers(sell, pick(sell.idx, cols['BBU_10_2.0'], 1.03), 'triangle-down', 'red', 'SELL', 'Sell Signal'));
+            }}
+            const closeSignal = signals['Close_Signal_Price'];
+            if (closeSignal.idx.length > 0) {{
+                traces.push(markers(closeSignal, pick(closeSignal.idx, cols['Close_Signal_Price'], 1), 'circle', 'black', 'CLOSE', 'Close Signal'));
+            }}
+
+            // Define layout with fixed subplot order: Price → Volume → MACD
+            let layout = {{
+                title: `${{selectedTicker}} Price with Indicators`,
+                xaxis: {{ type: 'date', rangeslider: {{ visible: false }}, domain: [0, 1] }},
+                yaxis: {{ title: 'Price (USD)', domain: [0.4, 1] }},      // Main chart (Price, Bollinger Bands)
+                yaxis2: {{ title: 'Volume', domain: [0.3, 0.4], anchor: 'x' }},  // Volume subplot
+                yaxis3: {{ title: 'MACD', domain: [0.2, 0.3], anchor: 'x' }},    // MACD subplot
+                margin: {{ t: 50, b: 50, l: 50, r: 50 }},
+                showlegend: true,
+                legend: {{ x: 1, y: 1 }},
+                uirevision  // keep zoom/pan when only the indicator selection changes
+            }};
+
+            // Counter for additional y-axes
+            let yAxisCounter = 4;
+
+            const overlays = [['EMA_10', 'EMA_10', 'gold'], ['EMA_20', 'EMA_20', 'cyan'],
+                              ['EMA_50', 'EMA_50', 'indigo'], ['sma', 'SMA_20', 'magenta']];
+            overlays.forEach(([key, field, color]) => {{
+                if (selectedIndicators.includes(key)) {{
+                    traces.push(line(cols[field], key === 'sma' ? 'SMA' : key, color, 'y', {{ hoverinfo: 'none' }}));
+                }}
+            }});
+
+            // Add RSI if selected
+            if (selectedIndicators.includes('rsi')) {{
+                traces.push(line(cols['RSI_14'], 'RSI', 'purple', `y${{yAxisCounter}}`));
+                layout[`yaxis${{yAxisCounter}}`] = {{ title: 'RSI', domain: [0.1, 0.2], anchor: 'x', range: [0, 100] }};
+                yAxisCounter++;
+            }}
+
+            // Add STOCH if selected
+            if (selectedIndicators.includes('stoch')) {{
+                traces.push(line(cols['STOCHk_14_3_3'], 'Stochastic %K', 'blue', `y${{yAxisCounter}}`));
+                traces.push(line(cols['STOCHd_14_3_3'], 'Stochastic %D', 'red', `y${{yAxisCounter}}`));
+                layout[`yaxis${{yAxisCounter}}`] = {{ title: 'Stochastic', domain: [0.0, 0.1], anchor: 'x', range: [0, 100] }};
+                yAxisCounter++;
+            }}
+            return {{ traces, layout }};
+        }}
+
+        // Draw with Plotly.react so repeated submits update the existing plot in place
+        function renderChart(traces, layout) {{
+            const chart = document.getElementById('chart');
+            if (!chart.data) {{
+                chart.innerHTML = ""; // drop any "No data" text before the first plot
+            }}
+            Plotly.react(chart, traces, layout);
+        }}
+
+        function clearChart(message) {{
+            const chart = document.getElementById('chart');
+            Plotly.purge(chart);
+            chart.innerHTML = message || "";
+        }}
+        let chartLoad = 0;  // only the latest submit may draw
         function OHLCprices() {{
             // Ensure sidebar is hidden and content is full-screen on mobile
             if (isMobileDevice()) {{
@@ -671,289 +1431,34 @@ index_html_template = """
             
             const endpoint = selectedCategory === "CRYPTO" ? "/crypto/prices" : "/prices";
             resultArea.innerHTML = "Loading...";
-            document.getElementById('chart').innerHTML = ""; // Clear the chart while loading
-            fetch(`${{endpoint}}?ticker=${{selectedTicker}}&category=${{selectedCategory}}&interval=${{interval}}&interval_multiplier=${{intervalMultiplier}}&start_date=${{startDate}}&end_date=${{endDate}}&bollinger_delta_window=${{bollingerDeltaWindow}}&indicators=${{selectedIndicators.join(',')}}`)
-                .then(response => {{
-                    if (!response.ok) {{
-                        return response.json().then(err => {{ throw new Error(err.error || `HTTP error! status: ${{response.status}}`); }});
-                    }}
-                    return response.json();
+            const uirevision = [selectedTicker, interval, intervalMultiplier, startDate, endDate].join('|');
+            const load = ++chartLoad;
+            loadChartColumns(`${{endpoint}}?ticker=${{selectedTicker}}&category=${{selectedCategory}}&interval=${{interval}}&interval_multiplier=${{intervalMultiplier}}&start_date=${{startDate}}&end_date=${{endDate}}&bollinger_delta_window=${{bollingerDeltaWindow}}&indicators=${{selectedIndicators.join(',')}}`,
+                job => {{
+                    if (load !== chartLoad) return;
+                    const fetched = job.chunks ? ` (${{job.chunks_done}}/${{job.chunks}} pages)` : "";
+                    resultArea.innerHTML = `Loading... large request running in the background: ${{job.stage}}${{fetched}}`;
                 }})
-                .then(data => {{
-                    resultArea.innerHTML = ""; // Clear the loading message
-                    if (!data || data.length === 0) {{
-                        document.getElementById('chart').innerHTML = "No data available.";
-                        return;
-                    }}
-                    data.sort((a, b) => new Date(a.time) - new Date(b.time));
-                    
-                    // Candlestick trace
-                    const traceCandles = {{
-                        x: data.map(d => d.time),
-                        open: data.map(d => d.open),
-                        high: data.map(d => d.high),
-                        low: data.map(d => d.low),
-                        close: data.map(d => d.close),
-                        type: 'candlestick',
-                        name: 'Price',
-                        yaxis: 'y'
-                    }};
-
-                    // Volume trace (subplot)
-                    const traceVolume = {{
-                        x: data.map(d => d.time),
-                        y: data.map(d => d.volume || 0),
-                        type: 'bar',
-                        name: 'Volume',
-                        marker: {{ color: 'rgba(128,128,128,0.5)' }},
-                        yaxis: 'y2'
-                    }};
-
-                    // MACD traces
-                    const traceMACD = {{
-                        x: data.map(d => d.time),
-                        y: data.map(d => d['MACD_12_26_9']),
-                        mode: 'lines',
-                        name: 'MACD',
-                        line: {{ color: 'blue' }},
-                        yaxis: 'y3'
-                    }};
-                    const traceMACDSignal = {{
-                        x: data.map(d => d.time),
-                        y: data.map(d => d['MACDs_12_26_9']),
-                        mode: 'lines',
-                        name: 'MACD Signal',
-                        line: {{ color: 'orange' }},
-                         yaxis: 'y3'
-                    }};
-                    const traceMACDHist = {{
-                        x: data.map(d => d.time),
-                        y: data.map(d => d['MACDh_12_26_9']),
-                        type: 'bar',
-                        name: 'MACD Histogram',
-                        marker: {{ color: 'green' }},
-                         yaxis: 'y3'
-                    }};
-
-                    // Add Bollinger Bands traces
-                    const traceUpper = {{
-                        x: data.map(d => d.time),
-                        y: data.map(d => d['BBU_10_2.0']),
-                        mode: 'lines',
-                        name: 'Upper Band',
-                        line: {{ color: 'rgba(255,0,0,0.5)' }},
-                        yaxis: 'y',
-                        hoverinfo: 'none' // Disable tooltip
-                    }};
-                    const traceLower = {{
-                        x: data.map(d => d.time),
-                        y: data.map(d => d['BBL_10_2.0']),
-                        mode: 'lines',
-                        name: 'Lower Band',
-                        line: {{ color: 'rgba(0,0,255,0.5)' }},
-                        yaxis: 'y',
-                        hoverinfo: 'none' // Disable tooltip
-                    }};
-
-                    // Initialize traces array with guaranteed traces
-                    let traces = [
-                        traceCandles,
-                        traceVolume,
-                        traceMACD,
-                        traceMACDSignal,
-                        traceMACDHist,
-                        traceUpper,
-                        traceLower
-                    ];
-
-                    // Buy Signals
-                    const buySignals = data.filter(d => d.Buy_Signal_Price !== null && d.Buy_Signal_Price !== undefined);
-                    if (buySignals.length > 0) {{
-                        const traceBuy = {{
-                            x: buySignals.map(d => d.time),
-                            y: buySignals.map(d => d['BBL_10_2.0'] * 0.97),
-                            mode: 'markers',
-                            marker: {{
-                                symbol: 'triangle-up',
-                                size: 12,
-                                color: 'green'
-                            }},
-                            hovertext: buySignals.map(d => `BUY AT ${{new Date(d.time).toLocaleString()}}`),
-                            hoverinfo: 'text',
-                            name: 'Buy Signal',
-                            yaxis: 'y'
-                        }};
-                        traces.push(traceBuy);
-                    }}
-
-                    // Sell Signals
-                    const sellSignals = data.filter(d => d.Sell_Signal_Price !== null && d.Sell_Signal_Price !== undefined);
-                    if (sellSignals.length > 0) {{
-                        const traceSell = {{
-                            x: sellSignals.map(d => d.time),
-                            y: sellSignals.map(d => d['BBU_10_2.0'] * 1.03),
-                            mode: 'markers',
-                            marker: {{
-                                symbol: 'triangle-down',
-                                size: 12,
-                                color: 'red'
-                            }},
-                            hovertext: sellSignals.map(d => `SELL AT ${{new Date(d.time).toLocaleString()}}`),
-                            hoverinfo: 'text',
-                            name: 'Sell Signal',
-                            yaxis: 'y'
-                        }};
-                        traces.push(traceSell);
-                    }}
-
-                    // Close Signals
-                    const closeSignals = data.filter(d => d.Close_Signal_Price !== null && d.Close_Signal_Price !== undefined);
-                    if (closeSignals.length > 0) {{
-                        const traceClose = {{
-                            x: closeSignals.map(d => d.time),
-                            y: closeSignals.map(d => d.Close_Signal_Price),
-                            mode: 'markers',
-                            marker: {{
-                                symbol: 'circle',
-                                size: 12,
-                                color: 'black'
-                            }},
-                            hovertext: closeSignals.map(d => `CLOSE AT ${{new Date(d.time).toLocaleString()}}`),
-                            hoverinfo: 'text',
-                            name: 'Close Signal',
-                            yaxis: 'y'
-                        }};
-                        traces.push(traceClose);
-                    }}
-                    
-                    // Define layout with fixed subplot order: Price → Volume → MACD
-                    let layout = {{
-                        title: `${{selectedTicker}} Price with Indicators`,
-                        xaxis: {{ type: 'date', rangeslider: {{ visible: false }}, domain: [0, 1] }},
-                        yaxis: {{ title: 'Price (USD)', domain: [0.4, 1] }},      // Main chart (Price, Bollinger Bands)
-                        yaxis2: {{ title: 'Volume', domain: [0.3, 0.4], anchor: 'x' }},  // Volume subplot
-                        yaxis3: {{ title: 'MACD', domain: [0.2, 0.3], anchor: 'x' }},    // MACD subplot
-                        margin: {{ t: 50, b: 50, l: 50, r: 50 }},
-                        showlegend: true,
-                        legend: {{ x: 1, y: 1 }}
-                    }};
-                    
-                    // Counter for additional y-axes
-                    let yAxisCounter = 4;
-
-                    // Add EMA_10 if selected
-                    if (selectedIndicators.includes('EMA_10')) {{
-                        const traceEMA_10 = {{
-                            x: data.map(d => d.time),
-                            y: data.map(d => d['EMA_10']),
-                            mode: 'lines',
-                            name: 'EMA_10',
-                            line: {{ color: 'gold' }},
-                            yaxis: 'y',
-                            hoverinfo: 'none' // Disable tooltip
-                        }};
-                        traces.push(traceEMA_10);
+                .then(({{ cols, signals, stale, truncated }}) => {{
+                    if (load !== chartLoad) return; // a newer submit is already loading
+                    // Clear the loading message; note when the data provider was slow and cached data was used
+                    resultArea.innerHTML = stale === null || stale === undefined ? ""
+                        : `⚠️ Showing data from ${{Math.max(Math.round(stale / 60), 1)}} min ago while it refreshes; submit again for the latest bars.`;
+                    if (truncated) {{
+                        resultArea.innerHTML += `${{resultArea.innerHTML ? "<br>" : ""}}⚠️ The data provider returned no bars after ${{new Date(truncated).toLocaleString()}}; narrow the date range or use a longer interval for the rest.`;
                     }}
-                    
-                    // Add EMA_20 if selected
-                    if (selectedIndicators.includes('EMA_20')) {{
-                        const traceEMA_20 = {{
-                            x: data.map(d => d.time),
-                            y: data.map(d => d['EMA_20']),
-                            mode: 'lines',
-                            name: 'EMA_20',
-                            line: {{ color: 'cyan' }},
-                            yaxis: 'y',
-                            hoverinfo: 'none' // Disable tooltip
-                        }};
-                        traces.push(traceEMA_20);
-                    }}
-                    
-                    // Add EMA_50 if selected
-                    if (selectedIndicators.includes('EMA_50')) {{
-                        const traceEMA_50 = {{
-                            x: data.map(d => d.time),
-                            y: data.map(d => d['EMA_50']),
-                            mode: 'lines',
-                            name: 'EMA_50',
-                            line: {{ color: 'indigo' }},
-                            yaxis: 'y',
-                            hoverinfo: 'none' // Disable tooltip
-                        }};
-                        traces.push(traceEMA_50);
-                    }}
-                    
-                    // Add SMA if selected
-                    if (selectedIndicators.includes('sma')) {{
-                        const traceSMA = {{
-                            x: data.map(d => d.time),
-                            y: data.map(d => d['SMA_20']),
-                            mode: 'lines',
-                            name: 'SMA',
-                            line: {{ color: 'magenta' }},
-                            yaxis: 'y',
-                            hoverinfo: 'none' // Disable tooltip
-                        }};
-                        traces.push(traceSMA);
-                    }}
-
-                    // Add RSI if selected
-                    if (selectedIndicators.includes('rsi')) {{
-                        const traceRSI = {{
-                            x: data.map(d => d.time),
-                            y: data.map(d => d['RSI_14']),
-                            mode: 'lines',
-                            name: 'RSI',
-                            line: {{ color: 'purple' }},
-                            yaxis: `y${{yAxisCounter}}`
-                        }};
-                        traces.push(traceRSI);
-                        layout[`yaxis${{yAxisCounter}}`] = {{
-                            title: 'RSI',
-                            domain: [0.1, 0.2],
-                            anchor: 'x',
-                            range: [0, 100]
-                        }};
-                        yAxisCounter++;
-                    }}
-
-                    // Add STOCH if selected
-                    if (selectedIndicators.includes('stoch')) {{
-                        const traceStochK = {{
-                            x: data.map(d => d.time),
-                            y: data.map(d => d['STOCHk_14_3_3']),
-                            mode: 'lines',
-                            name: 'Stochastic %K',
-                            line: {{ color: 'blue' }},
-                            yaxis: `y${{yAxisCounter}}`
-                        }};
-                        const traceStochD = {{
-                            x: data.map(d => d.time),
-                            y: data.map(d => d['STOCHd_14_3_3']),
-                            mode: 'lines',
-                            name: 'Stochastic %D',
-                            line: {{ color: 'red' }},
-                            yaxis: `y${{yAxisCounter}}`
-                        }};
-                        traces.push(traceStochK, traceStochD);
-                        layout[`yaxis${{yAxisCounter}}`] = {{
-                            title: 'Stochastic',
-                            //domain: [yAxisCounter === 4 ? 0.0 : (layout[`yaxis${{yAxisCounter-1}}`].domain[0] - 0.1), yAxisCounter === 4 ? 0.1 : layout[`yaxis${{yAxisCounter-1}}`].domain[0]],
-                            domain: [0.0, 0.1],
-                            anchor: 'x',
-                            range: [0, 100]
-                        }};
-                        yAxisCounter++;
+                    if (cols.time.length === 0) {{
+                        clearChart("No data available.");
+                        return;
                     }}
-
-                    // Plot the chart
-                    document.getElementById('chart').innerHTML = "";
-                    Plotly.newPlot('chart', traces, layout);
+                    const {{ traces, layout }} = buildChart(cols, signals, selectedIndicators, selectedTicker, uirevision);
+                    renderChart(traces, layout);
                 }})
                 .catch(error => {{
+                    if (load !== chartLoad) return;
                     console.error("Error fetching OHLC data:", error);
                     resultArea.innerHTML = "❌ " + error.message;
-                    document.getElementById('chart').innerHTML = ""; // Clear the chart on error
+                    clearChart(); // Clear the chart on error
                 }});
         }}
     </script>
@@ -1071,56 +1576,654 @@ index_html_template = """
 </html>
 """
 
-# Generate index.html
-index_html = index_html_template.format(
-    SEC_tickers=json.dumps(SEC_tickers),
-    CRYPTO_tickers=json.dumps(CRYPTO_tickers)
-)
+app = Flask(__name__)
+app.secret_key = os.urandom(24)  # For session security
 
-# Write the file
-with open("./templates/index.html", "w", encoding="utf-8") as file:
-    file.write(index_html)
+# Generate templates/index.html with the current ticker lists
+def write_index_html():
+    index_html = index_html_template.format(
+        SEC_tickers=json.dumps(SEC_tickers),
+        CRYPTO_tickers=json.dumps(CRYPTO_tickers)
+    )
+    folder = os.path.join(app.root_path, app.template_folder)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "index.html"), "w", encoding="utf-8") as file:
+        file.write(index_html)
+    log.info("index.html file has been created successfully.")
 
-print("index.html file has been created successfully.")
+_started = False
+_started_lock = Lock()
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # For session security
+def start_app():
+    """Loads the ticker lists and writes index.html; runs once, from __main__ or on the first request."""
+    global _started
+    with _started_lock:
+        if not _started:
+            load_tickers()
+            write_index_html()
+            _started = True
+
+# Under a WSGI server __main__ never runs, so the first request does the startup work
+@app.before_request
+def ensure_started():
+    start_app()
+
+# Upstream page sizes and bar lengths used to split long ranges into chunks
+QUESTRADE_MAX_CANDLES = int(os.getenv('QUESTRADE_MAX_CANDLES', '2000'))
+CRYPTO_MAX_BARS = int(os.getenv('CRYPTO_MAX_BARS', '5000'))
+FETCH_CONCURRENCY = int(os.getenv('FETCH_CONCURRENCY', '4'))   # parallel chunk requests per chart
+QUESTRADE_INTERVAL_SECONDS = {
+    "OneMinute": 60, "TwoMinutes": 120, "ThreeMinutes": 180, "FourMinutes": 240,
+    "FiveMinutes": 300, "TenMinutes": 600, "FifteenMinutes": 900, "TwentyMinutes": 1200,
+    "HalfHour": 1800, "OneHour": 3600, "TwoHours": 7200, "FourHours": 14400,
+    "OneDay": 86400, "OneWeek": 604800, "OneMonth": 2592000, "OneYear": 31536000
+}
+CRYPTO_UNIT_SECONDS = {"second": 1, "minute": 60, "day": 86400, "week": 604800, "month": 2592000, "year": 31536000}
+
+def bar_seconds(category, interval, interval_multiplier):
+    if category == "SEC":
+        return QUESTRADE_INTERVAL_SECONDS.get(interval, 86400)
+    return CRYPTO_UNIT_SECONDS.get(interval, 86400) * int(interval_multiplier)
+
+# Regular SEC session length, used to turn intraday warm-up bars into trading days
+SEC_SESSION_SECONDS = 6.5 * 3600
+
+def warmup_bars(indicators, bollinger_delta_window, families=None):
+    """
+    Bars of history needed before the first displayed bar so every requested
+    indicator (and everything the chart and signal engine depend on) already
+    has a value there.
+    """
+    context = {"bollinger_delta_window": bollinger_delta_window}
+    bars = max(INDICATORS[name]["warmup"](context, **INDICATORS[name]["params"])
+               for name in resolve_indicators(indicators))
+    for family, lengths in (families or {}).items():
+        bars = max([bars] + [FAMILIES[family]["warmup"](length) for length in lengths])
+    return bars
+
+def warmup_days(category, interval, interval_multiplier, bars):
+    """Calendar days that cover `bars` bars of the given interval."""
+    secs = bar_seconds(category, interval, interval_multiplier)
+    if category == "CRYPTO":  # trades around the clock
+        return math.ceil(bars * secs / 86400) + 1
+    if secs >= 604800:  # weekly and longer bars span weekends already
+        return math.ceil(bars * secs / 86400) + 7
+    trading_days = bars if secs >= 86400 else math.ceil(bars / math.ceil(SEC_SESSION_SECONDS / secs))
+    return math.ceil(trading_days * 7 / 5) + 4  # weekends + market holidays
+
+def estimate_bars(category, interval, interval_multiplier, start_dt, end_dt):
+    """Rough bar count of [start_dt, end_dt] plus indicator warm-up, the inverse of warmup_days."""
+    secs = bar_seconds(category, interval, interval_multiplier)
+    days = (end_dt - start_dt).days + 1
+    if category == "CRYPTO" or secs >= 604800:
+        return int(days * 86400 / secs)
+    trading_days = days * 5 / 7
+    return int(trading_days * 86400 / secs if secs >= 86400 else trading_days * math.ceil(SEC_SESSION_SECONDS / secs))
+
+def plan_fetch_chunks(start_date, end_date, bar_secs, max_bars):
+    """
+    Splits the inclusive [start_date, end_date] range (YYYY-MM-DD) into
+    consecutive date ranges that each fit in one upstream page of max_bars.
+    Chunks are whole days; a day with more than max_bars bars is paged
+    through by fetch_pages.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    days_per_chunk = max(int(max_bars * bar_secs * 0.9 // 86400), 1)  # 10% headroom
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=days_per_chunk - 1), end)
+        chunks.append((start.strftime("%Y-%m-%d"), chunk_end.strftime("%Y-%m-%d")))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+# Helper function to fetch one chunk page by page: fetch_page(start) returns at most max_bars
+# bars from `start` (the chunk's own start, then to_start(time) of the second after the previous
+# page's last bar) through the chunk's end. Returns (Candles, truncated_at), truncated_at being
+# the last bar before bars that could not be fetched (the upstream ignored the page start), or None.
+def fetch_pages(fetch_page, start, max_bars, to_start):
+    pages = []
+    while True:
+        page = fetch_page(start)
+        if pages and len(page) and page.time[-1] <= pages[-1].time[-1]:
+            truncated_at = int(pages[-1].time[-1])
+            log.warning("Upstream page limit of %s bars reached and paging did not advance; bars after %s are missing",
+                        max_bars, iso_times([truncated_at], "UTC")[0])
+            return Candles.concat(pages), truncated_at
+        pages.append(page)
+        if len(page) < max_bars:
+            return Candles.concat(pages), None
+        start = to_start(int(page.time[-1]) + 1)
+
+# Helper function to run one fetch per chunk, at most FETCH_CONCURRENCY at a time
+def fetch_chunks(fetch_one, chunks):
+    job = job_var.get()
+    job_progress(job, chunks=len(chunks))
+    if len(chunks) == 1:
+        result = fetch_one(*chunks[0])
+        job_progress(job, chunks_done=1)
+        return [result]
+    request_id, background = request_id_var.get(), upstream_background_var.get()
+    def fetch(chunk):
+        request_id_var.set(request_id)  # pool threads log under the calling request's ID
+        upstream_background_var.set(background)
+        result = fetch_one(*chunk)
+        job_progress(job, chunks_done=1)
+        return result
+    with ThreadPoolExecutor(max_workers=min(FETCH_CONCURRENCY, len(chunks)), thread_name_prefix="fetch") as pool:
+        return list(pool.map(fetch, chunks))
+
+# Closing price field names seen across upstream price feeds
+CLOSE_FIELDS = ['close', 'price', 'last_price', 'close_price', 'value']
+CANDLE_COLUMNS = ("open", "high", "low", "close", "volume")
+TIME_FIELDS = ['time', 'timestamp', 'datetime', 'date', 'start']
+
+def to_epoch_seconds(times):
+    """Vectorized ISO-8601 strings / datetimes -> int64 unix seconds."""
+    index = pd.DatetimeIndex(pd.to_datetime(times, utc=True))
+    return np.asarray((index - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1), dtype=np.int64)
+
+def iso_times(epochs, tz):
+    return [t.isoformat() for t in pd.to_datetime(epochs, unit="s", utc=True).tz_convert(tz)]
+
+class Candles:
+    """
+    Time-ordered OHLCV bars as parallel NumPy columns: `time` holds int64 unix
+    seconds, the price/volume columns float64. `tz` is the market timezone used
+    for date slicing and for rendering timestamps.
+    """
+    __slots__ = ("time", "open", "high", "low", "close", "volume", "tz")
+
+    def __init__(self, time, open, high, low, close, volume, tz="UTC"):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self.tz = tz
+
+    @classmethod
+    def empty(cls, tz="UTC"):
+        return cls(*([[]] * 6), tz=tz)
+
+    @classmethod
+    def from_records(cls, records, tz="UTC", time_key="time"):
+        """Builds columns straight from upstream JSON bars; non-numeric prices become NaN."""
+        if not records:
+            return cls.empty(tz)
+        close_key = next((key for key in CLOSE_FIELDS if key in records[0]), None)
+        if close_key is None:
+            raise ValueError(f"Missing closing price column. Expected one of {CLOSE_FIELDS}")
+        def column(key):
+            return pd.to_numeric(pd.Series([bar.get(key) for bar in records], dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        candles = cls(
+            to_epoch_seconds([bar[time_key] for bar in records]),
+            column("open"), column("high"), column("low"), column(close_key),
+            np.nan_to_num(column("volume")), tz=tz
+        )
+        return candles.sorted()
+
+    @classmethod
+    def concat(cls, parts, tz=None):
+        """Merges pages into one series ordered by time; a later page wins on duplicate timestamps."""
+        parts = [part for part in parts if part is not None]
+        tz = tz or (parts[0].tz if parts else "UTC")
+        if not parts:
+            return cls.empty(tz)
+        merged = cls(*(np.concatenate([getattr(part, col) for part in parts]) for col in ("time",) + CANDLE_COLUMNS), tz=tz)
+        # np.unique keeps the first occurrence, so search the reversed series
+        _, last = np.unique(merged.time[::-1], return_index=True)
+        return merged.take(len(merged) - 1 - last)
+
+    @classmethod
+    def from_frame(cls, df, tz="UTC"):
+        """
+        Builds Candles from a DataFrame of OHLCV columns (names matched
+        case-insensitively). Naive timestamps are read as `tz` local time;
+        numeric times as unix seconds, or milliseconds when that is clearly the unit.
+        """
+        columns = {str(col).strip().lower(): col for col in df.columns}
+        time_key = next((columns[key] for key in TIME_FIELDS if key in columns), None)
+        close_key = next((columns[key] for key in CLOSE_FIELDS if key in columns), None)
+        if time_key is None:
+            raise ValueError(f"Missing time column. Expected one of {TIME_FIELDS}")
+        if close_key is None:
+            raise ValueError(f"Missing closing price column. Expected one of {CLOSE_FIELDS}")
+        times = df[time_key]
+        if pd.api.types.is_numeric_dtype(times):
+            epochs = times.to_numpy(dtype=np.int64)
+            if len(epochs) and np.abs(epochs).max() > 10**11:
+                epochs = epochs // 1000
+        else:
+            index = pd.DatetimeIndex(pd.to_datetime(times))
+            if index.tz is None:
+                index = index.tz_localize(tz, ambiguous=np.zeros(len(index), dtype=bool), nonexistent="shift_forward")
+            epochs = to_epoch_seconds(index)
+        def column(name):
+            key = columns.get(name)
+            if key is None:
+                return np.full(len(df), np.nan)
+            return pd.to_numeric(df[key], errors="coerce").to_numpy(dtype=np.float64)
+        return cls(epochs, column("open"), column("high"), column("low"),
+                   pd.to_numeric(df[close_key], errors="coerce").to_numpy(dtype=np.float64),
+                   np.nan_to_num(column("volume")), tz=tz).sorted()
+
+    def __len__(self):
+        return len(self.time)
+
+    def take(self, index):
+        return Candles(*(getattr(self, col)[index] for col in ("time",) + CANDLE_COLUMNS), tz=self.tz)
+
+    def sorted(self):
+        if len(self) < 2 or np.all(self.time[1:] > self.time[:-1]):
+            return self
+        return Candles.concat([self])
+
+    def day_start(self, date):
+        """Unix seconds of local midnight of YYYY-MM-DD in this series' timezone."""
+        return int(pd.Timestamp(date).tz_localize(self.tz).timestamp())
+
+    def slice_dates(self, start_date, end_date):
+        """Bars whose local date is within [start_date, end_date]; zero-copy views."""
+        end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+        lo = np.searchsorted(self.time, self.day_start(start_date), side="left")
+        hi = np.searchsorted(self.time, int(end.tz_localize(self.tz).timestamp()), side="left")
+        return Candles(*(getattr(self, col)[lo:hi] for col in ("time",) + CANDLE_COLUMNS), tz=self.tz)
+
+    def to_frame(self):
+        return pd.DataFrame({"time": self.time, **{col: getattr(self, col) for col in CANDLE_COLUMNS}}, copy=False)
+
+# Shared cache: a chain of tiers tried in order (CACHE_TIERS, e.g. "memory,disk,redis").
+# A hit in a lower tier is copied into the tiers above it, writes go to every tier, so
+# nodes behind a load balancer share the disk/Redis copies instead of each calling the
+# upstream. TTLs are per namespace (CACHE_TTLS JSON overrides the defaults below; 0
+# disables a namespace). Values are encoded by encode_cache_value().
+CACHE_TIERS = [tier.strip() for tier in os.getenv('CACHE_TIERS', 'memory').split(',') if tier.strip()]
+CACHE_MEMORY_MAX_BYTES = int(os.getenv('CACHE_MEMORY_MAX_BYTES', str(256 * 2**20)))
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0')
+CACHE_REDIS_TIMEOUT = float(os.getenv('CACHE_REDIS_TIMEOUT', '0.5'))   # seconds
+CACHE_PREFIX = os.getenv('CACHE_PREFIX', 'ohlc')
+CACHE_TTLS = {"symbols": 7 * 86400, "missing": 3600, "candles": 86400, "grok": 900, "jobs": 900, "default": 3600}
+CACHE_TTLS.update(json.loads(os.getenv('CACHE_TTLS', '{}')))
+CACHE_MAGIC = b"OC1\n"
+
+class CacheUnavailable(Exception):
+    pass
+
+def _encode_part(value, buffers):
+    # JSON header for one value; array data is appended to `buffers` as raw bytes
+    if isinstance(value, dict):
+        return {"kind": "dict", "items": {str(key): _encode_part(item, buffers) for key, item in value.items()}}
+    if isinstance(value, Candles):
+        header, columns = {"kind": "candles", "tz": value.tz}, [(col, getattr(value, col)) for col in ("time",) + CANDLE_COLUMNS]
+    elif isinstance(value, pd.DataFrame):
+        header, columns = {"kind": "frame"}, [(str(col), value[col].to_numpy()) for col in value.columns]
+    elif isinstance(value, np.ndarray):
+        header, columns = {"kind": "array"}, [("", value)]
+    else:
+        return {"kind": "json", "value": value}
+    header["columns"] = []
+    for name, array in columns:
+        if array.dtype == object:  # strings, timestamps: small enough to ride in the header
+            header["columns"].append({"name": name, "values": array.tolist()})
+            continue
+        array = np.ascontiguousarray(array)
+        header["columns"].append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape)})
+        buffers.append(memoryview(array).cast("B"))
+    return header
+
+def _decode_part(header, view, offset):
+    kind = header["kind"]
+    if kind == "json":
+        return header["value"], offset
+    if kind == "dict":
+        items = {}
+        for key, item in header["items"].items():
+            items[key], offset = _decode_part(item, view, offset)
+        return items, offset
+    columns = {}
+    for column in header["columns"]:
+        if "values" in column:
+            columns[column["name"]] = np.array(column["values"], dtype=object)
+            continue
+        dtype, count = np.dtype(column["dtype"]), int(np.prod(column["shape"]))
+        columns[column["name"]] = np.frombuffer(view, dtype=dtype, count=count, offset=offset).reshape(column["shape"])
+        offset += count * dtype.itemsize
+    if kind == "candles":
+        return Candles(**columns, tz=header["tz"]), offset
+    if kind == "frame":
+        return pd.DataFrame(columns, copy=False), offset
+    return columns[""], offset
+
+def encode_cache_value(value):
+    """
+    Candles, DataFrames and NumPy arrays (also inside dicts) become raw column
+    bytes behind a JSON header; anything else is stored as JSON. Decoded arrays
+    are read-only views over the cached bytes.
+    """
+    buffers = []
+    head = json.dumps(_encode_part(value, buffers), default=str).encode()
+    head += b" " * (-(len(CACHE_MAGIC) + 4 + len(head)) % 8)  # keep column data 8-byte aligned
+    return b"".join([CACHE_MAGIC, len(head).to_bytes(4, "little"), head, *buffers])
+
+def decode_cache_value(blob):
+    if blob[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+        raise ValueError("Not an encoded cache value")
+    start = len(CACHE_MAGIC) + 4
+    size = int.from_bytes(blob[len(CACHE_MAGIC):start], "little")
+    return _decode_part(json.loads(blob[start:start + size]), memoryview(blob), start + size)[0]
+
+class MemoryTier:
+    """In-process LRU of encoded values, bounded by CACHE_MEMORY_MAX_BYTES."""
+    name = "memory"
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, blob, expires_at):
+        with self.lock:
+            self._drop(key)
+            if len(blob) > self.max_bytes:
+                return
+            self.entries[key] = (blob, expires_at)
+            self.size += len(blob)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def delete(self, key):
+        with self.lock:
+            self._drop(key)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= len(entry[0])
+
+class DiskTier:
+    """One file per key under CACHE_DIR: 8-byte expiry time, then the encoded value."""
+    name = "disk"
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.writes = 0
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return self.directory / digest[:2] / digest
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        expires_at = struct.unpack("<d", data[:8])[0]
+        if expires_at <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return data[8:], expires_at
+
+    def set(self, key, blob, expires_at):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, struct.pack("<d", expires_at) + blob)
+        self.writes += 1
+        if self.writes % 256 == 0:
+            self.sweep()
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def sweep(self):
+        # Expired files are otherwise only removed when read
+        now = time.time()
+        for path in self.directory.glob("*/*"):
+            try:
+                with open(path, "rb") as file:
+                    if struct.unpack("<d", file.read(8))[0] <= now:
+                        path.unlink(missing_ok=True)
+            except (OSError, struct.error):
+                continue
+
+class RedisTier:
+    """
+    Minimal RESP client (GET / SET PX / DEL) for Redis or anything speaking its
+    protocol. After a connection failure the tier is skipped for a few seconds so
+    an unreachable server costs one timeout, not one per request.
+    """
+    name = "redis"
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or "127.0.0.1", parsed.port or 6379)
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.idle = Queue()
+        self.down_until = 0
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=CACHE_REDIS_TIMEOUT)
+        conn = (sock, sock.makefile("rb"))
+        try:
+            if self.password:
+                self._call(conn, "AUTH", self.password)
+            if self.db:
+                self._call(conn, "SELECT", self.db)
+        except (OSError, ConnectionError, CacheUnavailable):
+            sock.close()
+            raise
+        return conn
+
+    def _call(self, conn, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, (bytes, memoryview)) else str(arg).encode()
+            parts += [b"$%d\r\n" % len(data), data, b"\r\n"]
+        conn[0].sendall(b"".join(parts))
+        return self._reply(conn[1])
+
+    def _reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise CacheUnavailable(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else reader.read(size + 2)[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self._reply(reader) for _ in range(size)]
+        raise ConnectionError(f"Unexpected Redis reply {line[:32]!r}")
+
+    def command(self, *args):
+        if time.monotonic() < self.down_until:
+            return None   # skipped: reads miss, writes are dropped
+        try:
+            conn = self.idle.get_nowait()
+        except Empty:
+            conn = None
+        try:
+            conn = conn or self._connect()
+            result = self._call(conn, *args)
+        except CacheUnavailable:
+            # An error reply leaves the connection in sync, so it goes back to the pool
+            if conn:
+                self.idle.put(conn)
+            raise
+        except (OSError, ConnectionError) as e:
+            if conn:
+                conn[0].close()
+            self.down_until = time.monotonic() + 5
+            raise CacheUnavailable(str(e))
+        self.idle.put(conn)
+        return result
+
+    def get(self, key):
+        data = self.command("GET", key)
+        if data is None:
+            return None
+        return data[8:], struct.unpack("<d", data[:8])[0]
+
+    def set(self, key, blob, expires_at):
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            self.command("SET", key, struct.pack("<d", expires_at) + blob, "PX", ttl_ms)
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+class TieredCache:
+    """get/set/delete by (namespace, key) across the configured tiers."""
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.stats = {"hits": {tier.name: 0 for tier in tiers}, "misses": 0, "errors": 0}
+
+    def _tiers(self, local):
+        # local=False skips the memory tier for values that already have their own in-process cache
+        return self.tiers if local else [tier for tier in self.tiers if tier.name != "memory"]
+
+    def _failed(self, tier, action, e):
+        self.stats["errors"] += 1
+        log.warning("Cache %s %s failed: %s", tier.name, action, e)
+
+    def get(self, namespace, key, local=True):
+        full_key = f"{CACHE_PREFIX}:{namespace}:{key}"
+        tiers = self._tiers(local)
+        for depth, tier in enumerate(tiers):
+            try:
+                found = tier.get(full_key)
+            except Exception as e:
+                self._failed(tier, "get", e)
+                continue
+            if found is None:
+                continue
+            self.stats["hits"][tier.name] += 1
+            for upper in tiers[:depth]:
+                try:
+                    upper.set(full_key, *found)
+                except Exception as e:
+                    self._failed(upper, "set", e)
+            try:
+                return decode_cache_value(found[0])
+            except ValueError as e:
+                self._failed(tier, "decode", e)
+                return None
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, namespace, key, value, ttl=None, local=True):
+        ttl = CACHE_TTLS.get(namespace, CACHE_TTLS["default"]) if ttl is None else ttl
+        tiers = self._tiers(local)
+        if ttl <= 0 or not tiers:
+            return
+        full_key = f"{CACHE_PREFIX}:{namespace}:{key}"
+        blob, expires_at = encode_cache_value(value), time.time() + ttl
+        for tier in tiers:
+            try:
+                tier.set(full_key, blob, expires_at)
+            except Exception as e:
+                self._failed(tier, "set", e)
+
+    def delete(self, namespace, key):
+        for tier in self.tiers:
+            try:
+                tier.delete(f"{CACHE_PREFIX}:{namespace}:{key}")
+            except Exception as e:
+                self._failed(tier, "delete", e)
+
+def build_cache(names):
+    factories = {
+        "memory": lambda: MemoryTier(CACHE_MEMORY_MAX_BYTES),
+        "disk": lambda: DiskTier(CACHE_DIR),
+        "redis": lambda: RedisTier(CACHE_REDIS_URL)
+    }
+    unknown = [name for name in names if name not in factories]
+    if unknown:
+        raise ValueError(f"Unknown CACHE_TIERS {unknown}; expected any of {list(factories)}")
+    return TieredCache([factories[name]() for name in names])
+
+cache = build_cache(CACHE_TIERS)
 
 # Helper function to fetch OHLC prices
 def OHLC_PRICES(category, ticker, interval, interval_multiplier, start_date, end_date):
     if category == "SEC":
-        access_token, api_server = refresh_questrade_token()
+        access_token, api_server = questrade_token()
         api_server = api_server.rstrip('/')
-        print(api_server)
         url = f"{api_server}/v1/symbols/search?prefix={ticker}"
-        print(url)
+        log.debug("Questrade symbol search: %s", url)
         headers = {"Authorization": f"Bearer {access_token}"}
-        symbol_response = requests.get(url,headers=headers).json()
-        symbolId = symbol_response['symbols'][0]['symbolId']
-        url = f"{api_server}/v1/markets/candles/{symbolId}?startTime={start_date}T00:00:00-05:00&endTime={end_date}T23:59:59-05:00&interval={interval}"
-        print(f"Questrade candles request: {url} ")
+        symbolId = cache.get("symbols", f"SEC:{ticker}")
+        if symbolId is None:
+            try:
+                symbol_response = upstream_get(url,headers=headers)
+                symbol_response.raise_for_status()
+                symbols = symbol_response.json().get('symbols') or []
+            except (requests.exceptions.RequestException, ValueError) as e:
+                log.warning("Symbol search for %s failed: %s", ticker, e)
+                if upstream_throttled(e):
+                    return {"error": "Data provider is busy. Please try again shortly.", "status": 429}
+                if isinstance(e, UpstreamUnavailable):
+                    return {"error": "Data provider is unavailable right now. Please try again shortly.", "status": 503}
+                return {"error": f"Symbol search for {ticker} failed", "status": 502}
+            # The search is by prefix; prefer the exact symbol
+            match = next((symbol for symbol in symbols if symbol.get('symbol') == ticker), symbols[0] if symbols else None)
+            if match is None:
+                cache.set("missing", f"SEC:{ticker}", True)
+                return {"error": f"Ticker {ticker} data does not exist"}
+            symbolId = match['symbolId']
+            cache.set("symbols", f"SEC:{ticker}", symbolId)
+
+        def fetch_candles(chunk_start, chunk_end):
+            def fetch_page(start):
+                url = f"{api_server}/v1/markets/candles/{symbolId}?startTime={start}&endTime={chunk_end}T23:59:59-05:00&interval={interval}"
+                log.debug("Questrade candles request: %s", url)
+                response = upstream_get(url, headers=headers)
+                response.raise_for_status()
+                log.debug("API response status: %s", response.status_code, extra={"upstream_status": response.status_code})
+                return Candles.from_records(response.json().get("candles") or [], tz=SEC_TIMEZONE, time_key="start")
+            candles, _ = fetch_pages(fetch_page, f"{chunk_start}T00:00:00-05:00", QUESTRADE_MAX_CANDLES,
+                                     lambda start: iso_times([start], SEC_TIMEZONE)[0])
+            return candles
+
+        chunks = plan_fetch_chunks(start_date, end_date, bar_seconds(category, interval, interval_multiplier), QUESTRADE_MAX_CANDLES)
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            print(f"API response status: {response.status_code}")
-            data = response.json()
-            # print(f"API response: {data}")
+            candles = Candles.concat(fetch_chunks(fetch_candles, chunks), tz=SEC_TIMEZONE)
             # Check if the API response indicates the ticker is invalid
-            if "candles" not in data or not data["candles"]:
+            if not len(candles):
                 return {"error": f"No candle data returned for {ticker}"}
-            normalized = []
-            for c in data["candles"]:
-                normalized.append({
-                    "time": c["start"],          # or c["end"] if preferred
-                    "open": c["open"],
-                    "high": c["high"],
-                    "low": c["low"],
-                    "close": c["close"],
-                    "volume": c.get("volume", 0)
-                })
-            return {"prices": normalized}
+            return {"prices": candles}
+        except ValueError as e:  # malformed bars
+            return {"error": str(e), "status": 400}
         except requests.exceptions.RequestException as e:
-            print(f"API request failed: {str(e)}")
+            log.warning("API request failed: %s", e)
+            if upstream_throttled(e):
+                return {"error": "Data provider is busy. Please try again shortly.", "status": 429}
+            if isinstance(e, UpstreamUnavailable):
+                return {"error": "Data provider is unavailable right now. Please try again shortly.", "status": 503}
             # Check if the error indicates the ticker is invalid (e.g., 404 Not Found)
             if "404" in str(e) or "not found" in str(e).lower():
                 return {"error": f"Ticker {ticker if category == 'SEC' else ticker} data does not exist"}
@@ -1128,27 +2231,51 @@ def OHLC_PRICES(category, ticker, interval, interval_multiplier, start_date, end
     elif category == "CRYPTO":
         url = "https://api.financialdatasets.ai/crypto/prices"
         headers = {"X-API-KEY": FINANCIAL_API_KEY}
-        querystring = {
-            "limit": "5000",
-            "ticker": ticker,
-            "interval": interval,
-            "interval_multiplier": interval_multiplier,
-            "start_date": start_date,
-            "end_date": end_date
-        }
-        print(f"Calling API: {url} with params: {querystring}")
+
+        def fetch_prices(chunk_start, chunk_end):
+            responses = []
+            def fetch_page(start):
+                querystring = {
+                    "limit": str(CRYPTO_MAX_BARS),
+                    "ticker": ticker,
+                    "interval": interval,
+                    "interval_multiplier": interval_multiplier,
+                    "start_date": start,
+                    "end_date": chunk_end
+                }
+                log.debug("Calling API: %s with params: %s", url, querystring)
+                response = upstream_get(url, headers=headers, params=querystring)
+                response.raise_for_status()
+                log.debug("API response status: %s", response.status_code, extra={"upstream_status": response.status_code})
+                responses.append(response.json())
+                return Candles.from_records(responses[-1].get("prices") or [], tz="UTC")
+            candles, truncated_at = fetch_pages(fetch_page, chunk_start, CRYPTO_MAX_BARS, lambda start: iso_times([start], "UTC")[0])
+            return dict(responses[0], prices=candles, truncated_at=truncated_at)
+
+        chunks = plan_fetch_chunks(start_date, end_date, bar_seconds(category, interval, interval_multiplier), CRYPTO_MAX_BARS)
         try:
-            response = requests.get(url, headers=headers, params=querystring)
-            response.raise_for_status()
-            print(f"API response status: {response.status_code}")
-            data = response.json()
-            # print(f"API response: {data}")
+            pages = fetch_chunks(fetch_prices, chunks)
             # Check if the API response indicates the ticker is invalid
-            if "error" in data and "not found" in data["error"].lower():
-                return {"error": f"Ticker {ticker if category == 'CRYPTO' else ticker} data does not exist"}
+            for data in pages:
+                if "error" in data and "not found" in data["error"].lower():
+                    cache.set("missing", f"CRYPTO:{ticker}", True)
+                    return {"error": f"Ticker {ticker if category == 'CRYPTO' else ticker} data does not exist"}
+            data = dict(pages[0])
+            data["prices"] = Candles.concat([page["prices"] for page in pages], tz="UTC")
+            # truncated_at marks the first bars that could not be fetched, if any
+            truncated = [page["truncated_at"] for page in pages if page["truncated_at"] is not None]
+            data.pop("truncated_at")
+            if truncated:
+                data["truncated_at"] = truncated[0]
             return data
+        except ValueError as e:  # malformed bars
+            return {"error": str(e), "status": 400}
         except requests.exceptions.RequestException as e:
-            print(f"API request failed: {str(e)}")
+            log.warning("API request failed: %s", e)
+            if upstream_throttled(e):
+                return {"error": "Data provider is busy. Please try again shortly.", "status": 429}
+            if isinstance(e, UpstreamUnavailable):
+                return {"error": "Data provider is unavailable right now. Please try again shortly.", "status": 503}
             # Check if the error indicates the ticker is invalid (e.g., 404 Not Found)
             if "404" in str(e) or "not found" in str(e).lower():
                 return {"error": f"Ticker {ticker if category == 'CRYPTO' else ticker} data does not exist"}
@@ -1156,136 +2283,692 @@ def OHLC_PRICES(category, ticker, interval, interval_multiplier, start_date, end
     else:
         return {"error": "Invalid category"}
 
-# Helper function to calculate Bollinger Delta
-def BOLLINGER_DELTA(window, serial_data):
-    BOLLINGER_DELTA = []
-    i = 0
-    while i < len(serial_data):
-        BOLLINGER_DELTA.append(serial_data['BBU_10_2.0'][i] - serial_data['BBL_10_2.0'][i])
-        i += 1
-    serial_data['BOLLINGER_DELTA'] = BOLLINGER_DELTA
-    i = len(serial_data)
-    while i >= (len(serial_data) - np.count_nonzero(~np.isnan(serial_data['BOLLINGER_DELTA'])) + window):
-        if pd.notna(serial_data['BOLLINGER_DELTA'][i-1]):
-            serial_data.iloc[i-window:i, serial_data.columns.get_loc('BOLLINGER_DELTA_SQUARE')] = serial_data['BOLLINGER_DELTA'].iloc[i-window:i] ** 2
-            MAX_DELTA_SQUARE = serial_data['BOLLINGER_DELTA_SQUARE'].iloc[i-window:i].max()
-            MIN_DELTA_SQUARE = serial_data['BOLLINGER_DELTA_SQUARE'].iloc[i-window:i].min()
-            if (MAX_DELTA_SQUARE - MIN_DELTA_SQUARE) != 0:
-                K = 100 / (MAX_DELTA_SQUARE - MIN_DELTA_SQUARE)
-                serial_data.iloc[i-window:i, serial_data.columns.get_loc('BOLLINGER_DELTA_Indicator')] = (serial_data['BOLLINGER_DELTA_SQUARE'].iloc[i-window:i] - MIN_DELTA_SQUARE) * K
-            else:
-                serial_data.iloc[i-window:i, serial_data.columns.get_loc('BOLLINGER_DELTA_Indicator')] = (serial_data['BOLLINGER_DELTA_SQUARE'].iloc[i-window:i] - MIN_DELTA_SQUARE) * 0
-        i -= 1
-    return serial_data
+# Candle cache: one contiguous date segment of Candles per (category, ticker, interval).
+# Coarser intervals are derived locally from a cached finer one when it covers the range.
+CANDLE_CACHE_MAX_ENTRIES = int(os.getenv('CANDLE_CACHE_MAX_ENTRIES', '512'))
+CANDLE_CACHE_TTL = int(os.getenv('CANDLE_CACHE_TTL', '60'))   # seconds the still-open last day stays fresh
+SEC_TIMEZONE = "America/New_York"
+SEC_SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+_candle_cache = OrderedDict()
+_candle_cache_lock = Lock()
 
-def Signal_Buy_Sell(serial_data):
-    sigBuy = []
-    sigSell = []
-    sigClose = []
-    flag = 0
-    stop_loss_price = 0
-    sigBuy.append(np.nan)
-    sigSell.append(np.nan)
-    sigClose.append(np.nan)
-    serial_data = serial_data.set_index('time')
-    for i in list(serial_data.index)[1:] :
-        if np.isnan(serial_data['BOLLINGER_DELTA_Indicator'][i]):
-            sigBuy.append(np.nan)
-            sigSell.append(np.nan)
-            sigClose.append(np.nan)
-        else:
-            if (flag == 0 or flag == -1) and serial_data['BOLLINGER_DELTA_Indicator'][i] == 100 and serial_data['MACD_DIFF'][i] >= 0 and float(serial_data['close'][i]) > float(serial_data['open'][i]) and float(serial_data['open'][i]) > serial_data['EMA_20'][i]:
-                sigBuy.append(float(serial_data['low'][i]))
-                Buy_Signal_date = i
-                cost_price = float((serial_data['open'][i] + serial_data['close'][i])/2)
-                stop_loss_price = cost_price * 0.8
-                sigSell.append(np.nan)
-                sigClose.append(np.nan)
-                flag = 1
-            elif (flag == 0 or flag == 1) and serial_data['BOLLINGER_DELTA_Indicator'][i] == 100 and serial_data['MACD_DIFF'][i] <= 0 and float(serial_data['close'][i]) < float(serial_data['open'][i]) and float(serial_data['open'][i]) < serial_data['EMA_20'][i]:
-                sigSell.append(float(serial_data['high'][i]))
-                Sell_Signal_date = i
-                cost_price = float((serial_data['open'][i] + serial_data['close'][i])/2)
-                stop_loss_price = cost_price * (2 - 0.8)
-                sigBuy.append(np.nan)
-                sigClose.append(np.nan)
-                flag = -1
-            else:
-                if flag == 1 and float(serial_data['close'][i]) <= float(stop_loss_price):
-                    sigBuy.append(np.nan)
-                    sigSell.append(np.nan)
-                    sigClose.append(float(serial_data['high'][i]))
-                    flag = 0
-                elif flag == -1 and float(serial_data['close'][i]) >= float(stop_loss_price):
-                    sigBuy.append(np.nan)
-                    sigSell.append(np.nan)
-                    sigClose.append(float(serial_data['low'][i]))
-                    flag = 0
-                else:
-                    sigBuy.append(np.nan)
-                    sigSell.append(np.nan)
-                    sigClose.append(np.nan)
-    return(sigBuy, sigSell, sigClose)
+# Stale-while-revalidate: a cached candle segment (or snapshot) past its freshness but fetched
+# less than STALE_MAX_AGE seconds ago is served at once, tagged with its age, while a single
+# background refresh per key brings it up to date. Older data waits for the upstream as before.
+STALE_MAX_AGE = int(os.getenv('STALE_MAX_AGE', '600'))   # 0 disables
+REVALIDATE_WORKERS = int(os.getenv('REVALIDATE_WORKERS', '4'))
+_revalidating = set()
+_revalidate_lock = Lock()
+_revalidate_pool = ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix="revalidate")
 
-# Helper function to process OHLC data
-def process_ohlc_data(data, category, ticker, indicators, bollinger_delta_window):
-    if category == "CRYPTO":
-#        df = data.get("prices", {}).get("prices", [])
-        df = data.get("prices", [])
-    else:  # SEC
-        df = data.get("prices", [])
-    print(f"Extracted prices: {df[:2]}")
-    print(f"Number of price rows: {len(df)}")
-    if not df:
-        return None, {"error": f"Ticker {ticker} data does not exist"}
-    if len(df) < 10:
-        return None, {"error": f"Not enough data points for indicators (got {len(df)}, need at least 10)"}
-    # Convert to DataFrame
-    df = pd.DataFrame(df)
-    print(f"DataFrame columns: {df.columns.tolist()}")
-    print(f"Sample data (first 2 rows):\n{df.head(2)}")
-    # Handle different column names for closing price
-    possible_close_columns = ['close', 'price', 'last_price', 'close_price', 'value']
-    close_column = None
-    for col in possible_close_columns:
-        if col in df.columns:
-            close_column = col
+def revalidate(key, refresh, *args):
+    """Runs refresh(*args) in the background unless a refresh for key is already queued or running."""
+    with _revalidate_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+    request_id = request_id_var.get()
+    def run():
+        request_id_var.set(request_id)
+        upstream_background_var.set(True)   # refreshes queue behind interactive requests
+        try:
+            refresh(*args)
+        except Exception as e:
+            log.warning("Background refresh of %s failed: %s", key, e)
+        finally:
+            with _revalidate_lock:
+                _revalidating.discard(key)
+    _revalidate_pool.submit(run)
+
+# Interval as (unit, count); SEC names map onto the crypto units
+SEC_INTERVAL_UNITS = {
+    "OneMinute": ("minute", 1), "TwoMinutes": ("minute", 2), "ThreeMinutes": ("minute", 3),
+    "FourMinutes": ("minute", 4), "FiveMinutes": ("minute", 5), "TenMinutes": ("minute", 10),
+    "FifteenMinutes": ("minute", 15), "TwentyMinutes": ("minute", 20), "HalfHour": ("minute", 30),
+    "OneHour": ("minute", 60), "TwoHours": ("minute", 120), "FourHours": ("minute", 240),
+    "OneDay": ("day", 1), "OneWeek": ("week", 1), "OneMonth": ("month", 1), "OneYear": ("year", 1)
+}
+UNIT_SECONDS = {"second": 1, "minute": 60, "day": 86400, "week": 604800}
+
+def interval_unit(category, interval, interval_multiplier):
+    if category == "SEC":
+        return SEC_INTERVAL_UNITS.get(interval)
+    return (interval, int(interval_multiplier))
+
+def can_resample(source, target):
+    """True if bars of `target` (unit, count) are whole groups of `source` bars."""
+    if source is None or target is None or source == target:
+        return False
+    (su, sn), (du, dn) = source, target
+    intraday = ("second", "minute")
+    if du in intraday:
+        if su not in intraday:
+            return False
+        src, dst = sn * UNIT_SECONDS[su], dn * UNIT_SECONDS[du]
+        return dst > src and dst % src == 0
+    if su in intraday and 86400 % (sn * UNIT_SECONDS[su]) != 0:
+        return False
+    if du == "day":
+        return su in intraday or (su == "day" and dn % sn == 0 and dn > sn)
+    if dn != 1:
+        return False
+    if du in ("week", "month"):
+        return su in intraday or (su == "day" and sn == 1)
+    if du == "year":
+        return su in intraday or (su in ("day", "month") and sn == 1)
+    return False
+
+# Helper function to label each bar with the start of the target bar it falls into
+def bin_starts(local, unit, count, category):
+    if unit in ("second", "minute"):
+        step = pd.Timedelta(seconds=count * UNIT_SECONDS[unit])
+        if category == "SEC":  # intraday bars are anchored to the 9:30 open, like Questrade's
+            session_open = local.dt.normalize() + SEC_SESSION_OPEN
+            return session_open + ((local - session_open) // step) * step
+        return local.dt.floor(step)
+    if unit == "day":
+        day = local.dt.normalize()
+        if count == 1:
+            return day
+        epoch = pd.Timestamp("1970-01-01", tz=day.dt.tz)
+        return epoch + ((day - epoch) // pd.Timedelta(days=count)) * pd.Timedelta(days=count)
+    if unit == "week":
+        return local.dt.normalize() - pd.to_timedelta(local.dt.dayofweek, unit="D")
+    naive = local.dt.tz_localize(None)
+    period = naive.dt.to_period("M" if unit == "month" else "Y").dt.start_time
+    return period.dt.tz_localize(local.dt.tz)
+
+def resample_bars(candles, category, target):
+    """Aggregates Candles into `target` (unit, count) bars in the market's timezone."""
+    if not len(candles):
+        return candles
+    local = pd.Series(pd.to_datetime(candles.time, unit="s", utc=True).tz_convert(candles.tz))
+    grouped = candles.to_frame().groupby(bin_starts(local, target[0], target[1], category), sort=True)
+    out = grouped.agg({"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+    return Candles(to_epoch_seconds(out.index), out["open"], out["high"], out["low"], out["close"], out["volume"], tz=candles.tz)
+
+# Helper function to widen a range so the first target bar is complete
+def align_range_start(start_date, target):
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    unit = target[0] if target else None
+    if unit == "week":
+        start -= timedelta(days=start.weekday())
+    elif unit == "month":
+        start = start.replace(day=1)
+    elif unit == "year":
+        start = start.replace(month=1, day=1)
+    return start.strftime("%Y-%m-%d")
+
+def _fresh_end(entry):
+    # The last fetched day may still be trading; trust it only for CANDLE_CACHE_TTL
+    if time.time() - entry["fetched_at"] <= CANDLE_CACHE_TTL:
+        return entry["end"]
+    fetched_day = datetime.fromtimestamp(entry["fetched_at"]).strftime("%Y-%m-%d")
+    if entry["end"] < fetched_day:
+        return entry["end"]
+    return (datetime.strptime(fetched_day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+
+# Helper function to name a candle cache key in the shared cache
+def _shared_candle_key(key):
+    category, ticker, (unit, count) = key
+    return f"{category}:{ticker}:{count}{unit}"
+
+# Shared segments are stored as a small head ({"start", "end", "fetched_at", "parts"}) plus one
+# value per part: extending a segment writes only the new bars as another part, and the
+# segment is rewritten as a single part once it has CANDLE_SHARED_MAX_PARTS of them.
+CANDLE_SHARED_MAX_PARTS = int(os.getenv('CANDLE_SHARED_MAX_PARTS', '64'))
+
+def _shared_candle_entry(key):
+    head = cache.get("candles", _shared_candle_key(key), local=False)
+    if head is None:
+        return None
+    parts = [cache.get("candles", part, local=False) for part in head["parts"]]
+    if any(part is None for part in parts):
+        return None   # a part expired or was evicted before its head
+    # Later parts win on duplicate timestamps (a refetched, once still open, last day)
+    return dict(head, bars=Candles.concat(parts))
+
+def _share_candles(key, entry, appended=None):
+    shared = _shared_candle_key(key)
+    head = cache.get("candles", shared, local=False) if appended is not None else None
+    # The shared copy must already hold everything up to where the new bars start
+    if head and head["start"] == entry["start"] and head["end"] >= appended[0] and len(head["parts"]) < CANDLE_SHARED_MAX_PARTS:
+        parts, bars = list(head["parts"]), appended[1]
+    else:
+        parts, bars = [], entry["bars"]
+    # Unique part names: a concurrent writer's head never lists a part this one overwrote
+    parts.append(f"{shared}#{uuid.uuid4().hex[:12]}")
+    cache.set("candles", parts[-1], bars, local=False)
+    cache.set("candles", shared, {"start": entry["start"], "end": entry["end"], "fetched_at": entry["fetched_at"], "parts": parts}, local=False)
+
+def _candle_entry(key):
+    """The in-process entry for key, else the shared cache's copy (which then becomes the local entry)."""
+    with _candle_cache_lock:
+        entry = _candle_cache.get(key)
+    if entry is None:
+        entry = _shared_candle_entry(key)
+        if entry is not None:
+            _cache_store(key, entry["start"], entry["end"], entry["bars"], entry["fetched_at"], share=False)
+    return entry
+
+def _cache_covering(category, ticker, target, start_date, end_date):
+    # Exact interval first, then the coarsest cached interval that resamples into it
+    # (fewest rows to aggregate, and closest to the upstream's own aggregation)
+    exact = _candle_entry((category, ticker, target))
+    with _candle_cache_lock:
+        if exact and exact["start"] <= start_date and _fresh_end(exact) >= end_date:
+            if (category, ticker, target) in _candle_cache:
+                _candle_cache.move_to_end((category, ticker, target))
+            return target, exact["bars"]
+        aligned_start = align_range_start(start_date, target)
+        best = None
+        for (cat, tick, unit), entry in _candle_cache.items():
+            if (cat, tick) != (category, ticker) or not can_resample(unit, target):
+                continue
+            if entry["start"] <= aligned_start and _fresh_end(entry) >= end_date:
+                if best is None or can_resample(best[0], unit):
+                    best = (unit, entry["bars"])
+        return best or (None, None)
+
+# appended: (last day kept from the previous segment, bars fetched after it) when the segment
+# only grew at its end; then only those bars are written to the shared tiers
+def _cache_store(key, start_date, end_date, candles, fetched_at=None, share=True, appended=None):
+    entry = {"start": start_date, "end": end_date, "bars": candles, "fetched_at": fetched_at or time.time()}
+    with _candle_cache_lock:
+        _candle_cache[key] = entry
+        _candle_cache.move_to_end(key)
+        while len(_candle_cache) > CANDLE_CACHE_MAX_ENTRIES:
+            _candle_cache.popitem(last=False)
+    if share:  # other nodes pick the segment up from the disk/Redis tiers
+        _share_candles(key, entry, appended)
+
+# Crypto archive: append-only, memory-mapped column files per ticker and second/minute
+# interval (time.i8, open.f8, ...), sorted by time so ranges are found by binary search.
+# Only completed UTC days are archived; the still-open day always comes from upstream.
+CRYPTO_ARCHIVE_DIR = os.getenv('CRYPTO_ARCHIVE_DIR', 'crypto_archive')   # empty disables
+ARCHIVE_UNITS = ("second", "minute")
+ARCHIVE_DTYPES = {"time": "<i8", **{col: "<f8" for col in CANDLE_COLUMNS}}
+_archive_locks = {}
+_archive_locks_lock = Lock()
+
+class CandleArchive:
+    """One ticker/interval archive directory; see CRYPTO_ARCHIVE_DIR."""
+
+    def __init__(self, ticker, target):
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{ticker}_{target[1]}{target[0]}")
+        self.path = Path(CRYPTO_ARCHIVE_DIR) / name
+        with _archive_locks_lock:
+            self.lock = _archive_locks.setdefault(str(self.path), Lock())
+
+    def coverage(self):
+        """(first_date, last_date) of the archived days, or None."""
+        try:
+            meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+            return meta["start"], meta["end"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _length(self):
+        # A crash mid-append can leave some columns longer; only rows present in all count
+        sizes = [(self.path / f"{col}.col").stat().st_size // np.dtype(dtype).itemsize
+                 for col, dtype in ARCHIVE_DTYPES.items() if (self.path / f"{col}.col").exists()]
+        return min(sizes) if len(sizes) == len(ARCHIVE_DTYPES) else 0
+
+    def read(self, start_date, end_date):
+        """Candles for [start_date, end_date] as read-only views over the mapped files."""
+        length = self._length()
+        if not length:
+            return Candles.empty("UTC")
+        columns = {col: np.memmap(self.path / f"{col}.col", dtype=dtype, mode="r", shape=(length,))
+                   for col, dtype in ARCHIVE_DTYPES.items()}
+        return Candles(**columns, tz="UTC").slice_dates(start_date, end_date)
+
+    def append(self, candles, start_date, end_date):
+        """Appends bars newer than the archive's last bar and extends coverage to end_date."""
+        with self.lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            length = self._length()
+            last = np.memmap(self.path / "time.col", dtype=ARCHIVE_DTYPES["time"], mode="r", shape=(length,))[-1] if length else None
+            new = candles if last is None else candles.take(candles.time > last)
+            # Truncate any torn tail, then write the value columns before time
+            for col in list(CANDLE_COLUMNS) + ["time"]:
+                with open(self.path / f"{col}.col", "ab") as file:
+                    file.truncate(length * np.dtype(ARCHIVE_DTYPES[col]).itemsize)
+                    file.write(np.ascontiguousarray(getattr(new, col), dtype=ARCHIVE_DTYPES[col]).tobytes())
+                    file.flush()
+                    os.fsync(file.fileno())
+            coverage = self.coverage()
+            write_atomic(self.path / "meta.json", json.dumps({
+                "start": min(start_date, coverage[0]) if coverage else start_date,
+                "end": max(end_date, coverage[1]) if coverage else end_date
+            }))
+            return len(new)
+
+def archived_candles(ticker, interval, interval_multiplier, target, start_date, end_date):
+    """
+    Serves a crypto second/minute range from the archive, fetching and appending
+    the completed days it is missing. Returns None when the range starts before
+    the archive (append-only, so it cannot be extended backwards) or when the
+    upstream page limit cuts off its first missing day.
+    """
+    through = (datetime.now(timezone.utc).date() - timedelta(days=1)).strftime("%Y-%m-%d")
+    archive = CandleArchive(ticker, target)
+    coverage = archive.coverage()
+    if start_date > through or (coverage and start_date < coverage[0]):
+        return None
+    archive_end = min(end_date, through)
+    if not coverage or coverage[1] < archive_end:
+        gap_start = start_date if not coverage else (datetime.strptime(coverage[1], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        data = OHLC_PRICES("CRYPTO", ticker, interval, interval_multiplier, gap_start, archive_end)
+        if "error" in data and "No candle data" not in data["error"]:
+            return data
+        candles, covered = data.get("prices") or Candles.empty("UTC"), archive_end
+        if "truncated_at" in data:
+            # Archive the bars up to the gap and mark only the days before it covered, so the
+            # next request refetches from the day the gap starts in
+            candles = candles.take(candles.time <= data["truncated_at"])
+            covered = (datetime.fromtimestamp(data["truncated_at"], timezone.utc).date() - timedelta(days=1)).strftime("%Y-%m-%d")
+            if covered < gap_start:
+                return None   # not even one whole day fits in a page
+        appended = archive.append(candles, gap_start, covered)
+        log.info("Archived %s %s bars of %s through %s", appended, target, ticker, covered)
+    candles = archive.read(start_date, archive_end)
+    if end_date > through:
+        today = (datetime.strptime(through, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        live = get_candles("CRYPTO", ticker, interval, interval_multiplier, today, end_date)
+        if "error" in live:
+            return live
+        candles = Candles.concat([candles, live["prices"]], tz="UTC")
+    return {"prices": candles}
+
+def get_candles(category, ticker, interval, interval_multiplier, start_date, end_date, allow_stale=False):
+    """
+    OHLC_PRICES with a candle cache in front: serves cached bars, resamples a
+    cached finer interval, or fetches only the dates the cache is missing.
+    Crypto second/minute ranges are served from the memory-mapped archive.
+    Returns {"prices": Candles} or {"error": ...} like OHLC_PRICES; with
+    allow_stale, a stale segment may be returned with "stale": its age in seconds.
+    "truncated_at" (unix seconds) is set when the upstream cut the range off there.
+    """
+    target = interval_unit(category, interval, interval_multiplier)
+    if target is None:
+        return OHLC_PRICES(category, ticker, interval, interval_multiplier, start_date, end_date)
+    if category == "CRYPTO" and CRYPTO_ARCHIVE_DIR and target[0] in ARCHIVE_UNITS:
+        data = archived_candles(ticker, interval, interval_multiplier, target, start_date, end_date)
+        if data is not None:
+            return data
+    source, candles = _cache_covering(category, ticker, target, start_date, end_date)
+    if source == target:
+        return {"prices": candles.slice_dates(start_date, end_date)}
+    if source is not None:
+        log.debug("Resampling cached %s bars of %s to %s", source, ticker, target)
+        aligned_start = align_range_start(start_date, target)
+        resampled = resample_bars(candles.slice_dates(aligned_start, end_date), category, target)
+        return {"prices": resampled.slice_dates(start_date, end_date)}
+
+    # Fetch only what the cached segment for this interval lacks
+    key = (category, ticker, target)
+    entry = _candle_entry(key)
+    if allow_stale and entry and STALE_MAX_AGE:
+        age = time.time() - entry["fetched_at"]
+        fetched_day = datetime.fromtimestamp(entry["fetched_at"]).strftime("%Y-%m-%d")
+        # Covered up to when it was fetched; only bars since then are missing
+        if age <= STALE_MAX_AGE and entry["start"] <= start_date and entry["end"] >= min(end_date, fetched_day):
+            revalidate(("candles",) + key, refresh_candles, category, ticker, interval, interval_multiplier, start_date, end_date)
+            return {"prices": entry["bars"].slice_dates(start_date, end_date), "stale": age}
+    missing = [(start_date, end_date)]
+    # Overlapping or adjacent ranges extend the cached segment instead of replacing it
+    day_after = entry and (datetime.strptime(_fresh_end(entry), "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    if entry and entry["start"] <= end_date and start_date <= day_after:
+        fresh_end = _fresh_end(entry)
+        missing = []
+        if start_date < entry["start"]:
+            before = datetime.strptime(entry["start"], "%Y-%m-%d") - timedelta(days=1)
+            missing.append((start_date, before.strftime("%Y-%m-%d")))
+        if end_date > fresh_end:
+            after = datetime.strptime(fresh_end, "%Y-%m-%d") + timedelta(days=1)
+            missing.append((after.strftime("%Y-%m-%d"), end_date))
+    else:
+        entry = None
+    pages = [entry["bars"].slice_dates(entry["start"], _fresh_end(entry))] if entry else []
+    truncated_at = None
+    for gap_start, gap_end in missing:
+        data = OHLC_PRICES(category, ticker, interval, interval_multiplier, gap_start, gap_end)
+        if "error" in data:
+            if pages and "No candle data" in data["error"]:
+                continue  # nothing traded in the gap (weekend, holiday)
+            return data
+        pages.append(data["prices"])
+        if "truncated_at" in data:
+            truncated_at = data["truncated_at"]
             break
-    if close_column:
-        if close_column != 'close':
-            df.rename(columns={close_column: 'close'}, inplace=True)
-            print(f"Renamed '{close_column}' column to 'close'")
+    candles = Candles.concat(pages, tz=SEC_TIMEZONE if category == "SEC" else "UTC")
+    segment_start = min(start_date, entry["start"]) if entry else start_date
+    segment_end = max(end_date, _fresh_end(entry)) if entry else end_date
+    grew_at_end = bool(entry) and start_date >= entry["start"]
+    stored = candles
+    if truncated_at is not None:
+        # Cache only the whole days before the gap (as the archive does), so the next request
+        # refetches from the day it starts in; a gap before the cached bars is not cached at all
+        covered = (datetime.fromtimestamp(truncated_at, timezone.utc).date() - timedelta(days=1)).strftime("%Y-%m-%d")
+        segment_end = covered if (gap_start, gap_end) == missing[-1] else None
+        if segment_end is None or segment_end < segment_start or (grew_at_end and segment_end <= fresh_end):
+            segment_end = None
+        else:
+            stored = candles.slice_dates(segment_start, segment_end)
+    if segment_end is None:
+        log.info("Not caching the cut-off %s bars of %s:%s", target, category, ticker)
+    elif entry:
+        appended = Candles.concat(pages[1:], tz=candles.tz).slice_dates(day_after, segment_end) if grew_at_end else None
+        _cache_store(key, segment_start, segment_end, stored, appended=(fresh_end, appended) if grew_at_end else None)
     else:
-        return None, {"error": f"Missing closing price column. Expected one of {possible_close_columns}"}
-    # Ensure 'close' column is numeric
-    df['close'] = pd.to_numeric(df['close'], errors='coerce')
-    if df['close'].isna().all():
-        return None, {"error": "All 'close' values are invalid or missing"}
-    # Check for sufficient non-NaN values
-    if df['close'].dropna().count() < 10:
-        return None, {"error": f"Not enough valid 'close' values for indicators (got {df['close'].dropna().count()}, need at least 10)"}
-    # Calculate selected indicators
-    df.ta.bbands(close='close', length=10, std=2.0, append=True)
-    # Calculate Bollinger Delta if Bollinger Bands are selected
+        _cache_store(key, segment_start, segment_end, stored)
+    result = {"prices": candles.slice_dates(start_date, end_date)}
+    if truncated_at is not None:
+        result["truncated_at"] = truncated_at   # bars after it are missing from this range
+    return result
+
+def refresh_candles(category, ticker, interval, interval_multiplier, start_date, end_date):
+    data = get_candles(category, ticker, interval, interval_multiplier, start_date, end_date)
+    if "error" in data:
+        log.warning("Background refresh of %s:%s %sx%s failed: %s", category, ticker, interval, interval_multiplier, data["error"])
+
+# Helper function to scale a window of squared band widths to 0-100. The window maximum is
+# set to exactly 100, the value signal_step tests for, rather than (max-min)*(100/(max-min)),
+# which can round to 99.99999999999999; StreamingIndicators uses the same function.
+def scale_delta_squares(squares):
+    high, low = squares.max(), squares.min()
+    if high == low:
+        return (squares - low) * 0
+    scaled = (squares - low) * (100 / (high - low))
+    scaled[squares == high] = 100.0
+    return scaled
+
+# Helper function to calculate Bollinger Delta
+def BOLLINGER_DELTA(window, serial_data, upper='BBU_10_2.0', lower='BBL_10_2.0'):
+    BOLLINGER_DELTA = []
+    i = 0
+    while i < len(serial_data):
+        BOLLINGER_DELTA.append(serial_data[upper][i] - serial_data[lower][i])
+        i += 1
+    serial_data['BOLLINGER_DELTA'] = BOLLINGER_DELTA
+    i = len(serial_data)
+    while i >= (len(serial_data) - np.count_nonzero(~np.isnan(serial_data['BOLLINGER_DELTA'])) + window):
+        if pd.notna(serial_data['BOLLINGER_DELTA'][i-1]):
+            serial_data.iloc[i-window:i, serial_data.columns.get_loc('BOLLINGER_DELTA_SQUARE')] = serial_data['BOLLINGER_DELTA'].iloc[i-window:i] ** 2
+            DELTA_SQUARE = serial_data['BOLLINGER_DELTA_SQUARE'].iloc[i-window:i].to_numpy()
+            serial_data.iloc[i-window:i, serial_data.columns.get_loc('BOLLINGER_DELTA_Indicator')] = scale_delta_squares(DELTA_SQUARE)
+        i -= 1
+    return serial_data
+
+# Helper function for one bar of the signal engine: row maps column -> value (open, high, low,
+# close, EMA_20, MACD_DIFF, BOLLINGER_DELTA_Indicator), state holds the position flag and
+# stop-loss and is updated in place. Returns the (buy, sell, close) prices, NaN for no signal.
+def signal_step(row, state):
+    flag = state.get("flag", 0)
+    stop_loss_price = state.get("stop_loss_price", 0)
+    sigBuy = sigSell = sigClose = np.nan
+    if not np.isnan(row['BOLLINGER_DELTA_Indicator']):
+        if (flag == 0 or flag == -1) and row['BOLLINGER_DELTA_Indicator'] == 100 and row['MACD_DIFF'] >= 0 and float(row['close']) > float(row['open']) and float(row['open']) > row['EMA_20']:
+            sigBuy = float(row['low'])
+            cost_price = float((row['open'] + row['close'])/2)
+            stop_loss_price = cost_price * 0.8
+            flag = 1
+        elif (flag == 0 or flag == 1) and row['BOLLINGER_DELTA_Indicator'] == 100 and row['MACD_DIFF'] <= 0 and float(row['close']) < float(row['open']) and float(row['open']) < row['EMA_20']:
+            sigSell = float(row['high'])
+            cost_price = float((row['open'] + row['close'])/2)
+            stop_loss_price = cost_price * (2 - 0.8)
+            flag = -1
+        elif flag == 1 and float(row['close']) <= float(stop_loss_price):
+            sigClose = float(row['high'])
+            flag = 0
+        elif flag == -1 and float(row['close']) >= float(stop_loss_price):
+            sigClose = float(row['low'])
+            flag = 0
+    state.update(flag=flag, stop_loss_price=float(stop_loss_price))
+    return sigBuy, sigSell, sigClose
+
+# state (optional dict) carries the position flag and stop-loss between calls: it seeds
+# the first row and is updated in place, so a series can be evaluated a few bars at a time
+def Signal_Buy_Sell(serial_data, state=None):
+    sigBuy = [np.nan]
+    sigSell = [np.nan]
+    sigClose = [np.nan]
+    step_state = {"flag": state.get("flag", 0) if state else 0,
+                  "stop_loss_price": state.get("stop_loss_price", 0) if state else 0}
+    columns = ['open', 'high', 'low', 'close', 'EMA_20', 'MACD_DIFF', 'BOLLINGER_DELTA_Indicator']
+    for row in serial_data[columns].iloc[1:].to_dict('records'):
+        buy, sell, close = signal_step(row, step_state)
+        sigBuy.append(buy)
+        sigSell.append(sell)
+        sigClose.append(close)
+    if state is not None:
+        state.update(step_state)
+    return(sigBuy, sigSell, sigClose)
+
+# Indicator registry: name -> inputs, parameters, dependencies, warm-up bars and compute function.
+# compute(df, context, **params) appends its columns to df; context carries per-request
+# settings such as bollinger_delta_window.
+INDICATORS = {}
+
+# Always computed: the chart draws Bollinger Bands and MACD, Signal_Buy_Sell reads the rest
+BASE_INDICATORS = ["bbands", "macd", "bollinger_delta", "macd_diff", "EMA_20"]
+
+def indicator(name, inputs=("close",), deps=(), warmup=None, family=None, **params):
+    def register(compute):
+        INDICATORS[name] = {
+            "inputs": inputs,
+            "deps": deps,
+            "params": params,
+            "warmup": warmup or (lambda context, **p: 0),
+            "family": family,   # (family, length): computed with the rest of its family
+            "compute": compute
+        }
+        return compute
+    return register
+
+# Helper function to solve y[t] = decay * y[t-1] + u[t] (y[-1] = 0) for every column of u at once
+def linear_recurrence(u, decay, block=32):
+    """
+    u is T x L, decay has L factors. The series is cut into blocks: one batched
+    matmul gives every block's response from a zero start, and the value carried
+    into each block is the same recurrence over the block ends, solved recursively.
+    """
+    T, L = u.shape
+    nb = -(-T // block)
+    blocks = np.zeros((nb * block, L))
+    blocks[:T] = u
+    steps = np.arange(block)
+    lag = steps[:, None] - steps[None, :]
+    # weights[l, i, j] = decay_l ** (i - j) for j <= i
+    weights = np.where(lag >= 0, decay[:, None, None] ** np.maximum(lag, 0), 0.0)
+    local = (weights @ blocks.reshape(nb, block, L).transpose(2, 1, 0)).transpose(2, 1, 0)   # nb x block x L
+    if nb > 1:
+        carried = linear_recurrence(local[:-1, -1, :], decay ** block, block)
+        local[1:] += (decay[None, :] ** (steps[:, None] + 1))[None] * carried[:, None, :]
+    return local.reshape(nb * block, L)[:T]
+
+# Family kernels: close (T) -> T x len(lengths), same values as pandas_ta's ema/sma/rsi
+def ema_columns(close, lengths):
+    # Seeded with the SMA of the first `length` closes, like pandas_ta
+    alpha = 2.0 / (lengths + 1)
+    rows = np.arange(len(close))[:, None]
+    u = alpha[None, :] * close[:, None]
+    u[rows < lengths - 1] = 0.0
+    seeded = np.flatnonzero(lengths <= len(close))
+    u[lengths[seeded] - 1, seeded] = np.cumsum(close)[lengths[seeded] - 1] / lengths[seeded]
+    out = linear_recurrence(u, 1.0 - alpha)
+    out[rows < lengths - 1] = np.nan
+    return out
+
+def sma_columns(close, lengths):
+    cumsum = np.concatenate([[0.0], np.cumsum(close)])
+    rows = np.arange(len(close))[:, None]
+    out = (cumsum[rows + 1] - cumsum[np.maximum(rows + 1 - lengths, 0)]) / lengths
+    out[rows < lengths - 1] = np.nan
+    return out
+
+def rsi_columns(close, lengths):
+    # pandas_ta: 100 * rma(gains) / (rma(gains) + rma(losses)), rma = ewm(alpha=1/length, adjust=True);
+    # the ewm normalisation cancels, so the plain discounted sums are enough
+    diff = np.diff(close, prepend=close[:1])
+    decay = 1.0 - 1.0 / lengths
+    sums = linear_recurrence(np.column_stack([np.clip(diff, 0, None)] * len(lengths) + [np.clip(-diff, 0, None)] * len(lengths)),
+                             np.concatenate([decay, decay]))
+    gains, losses = sums[:, :len(lengths)], sums[:, len(lengths):]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = 100.0 * gains / (gains + losses)
+    out[np.arange(len(close))[:, None] < lengths] = np.nan
+    return out
+
+# Helper function for one family member the slow way (series with missing closes)
+def family_series(close, family, length):
+    if family == "ema":
+        seeded = close.copy()
+        seeded.iloc[:length - 1] = np.nan
+        seeded.iloc[length - 1:length] = close.iloc[:length].mean()
+        return seeded.ewm(span=length, adjust=False).mean()
+    if family == "sma":
+        return close.rolling(length, min_periods=length).mean()
+    diff = close.diff()
+    gains = diff.clip(lower=0).ewm(alpha=1.0 / length, min_periods=length).mean()
+    losses = (-diff.clip(upper=0)).ewm(alpha=1.0 / length, min_periods=length).mean()
+    return 100.0 * gains / (gains + losses)
+
+# Indicator families: every length of a family is one column of a single batched pass.
+# /prices takes them as query parameters, e.g. ema=5,8,13,21,34,55,89&rsi=7,14,21
+FAMILIES = {
+    "ema": {"column": "EMA_{}", "compute": ema_columns, "warmup": lambda length: length},
+    "sma": {"column": "SMA_{}", "compute": sma_columns, "warmup": lambda length: length},
+    "rsi": {"column": "RSI_{}", "compute": rsi_columns, "warmup": lambda length: length + 1}
+}
+FAMILY_MAX_LENGTH = int(os.getenv('FAMILY_MAX_LENGTH', '500'))
+FAMILY_MAX_LINES = int(os.getenv('FAMILY_MAX_LINES', '32'))
+
+def parse_families(args):
+    """{"ema": [5, 8, 13], ...} from family query parameters; raises ValueError on bad lengths."""
+    families = {}
+    for family in FAMILIES:
+        raw = args.get(family)
+        if not raw:
+            continue
+        lengths = sorted({int(part) for part in raw.split(",") if part.strip()})
+        if not lengths or lengths[0] < 2 or lengths[-1] > FAMILY_MAX_LENGTH or len(lengths) > FAMILY_MAX_LINES:
+            raise ValueError(f"{family} takes up to {FAMILY_MAX_LINES} lengths between 2 and {FAMILY_MAX_LENGTH}")
+        families[family] = lengths
+    return families
+
+def compute_family(df, family, lengths):
+    spec = FAMILIES[family]
+    close = df["close"].to_numpy(dtype=np.float64)
+    if np.isnan(close).any():
+        values = np.column_stack([family_series(df["close"], family, length).to_numpy() for length in lengths])
+    else:
+        values = spec["compute"](close, np.asarray(lengths, dtype=np.int64))
+    df[[spec["column"].format(length) for length in lengths]] = values
+
+@indicator("bbands", length=10, std=2.0, warmup=lambda context, length, std: length)
+def _bbands(df, context, length, std):
+    df.ta.bbands(close='close', length=length, std=std, append=True)
+
+# The steps below read the columns of their dependency, so they take its registered parameters
+@indicator("bollinger_delta", deps=("bbands",),
+           warmup=lambda context: INDICATORS["bbands"]["params"]["length"] + context["bollinger_delta_window"])
+def _bollinger_delta(df, context):
+    bb = INDICATORS["bbands"]["params"]
     df['BOLLINGER_DELTA_SQUARE'] = np.nan
     df['BOLLINGER_DELTA_Indicator'] = np.nan
-    df = BOLLINGER_DELTA(bollinger_delta_window, df)
-    df.ta.macd(close='close', fast=12, slow=26, signal=9, append=True)
-    df['MACD_DIFF'] = (ta_lib.trend.MACD(df['close'], window_slow=26, window_fast=12, window_sign=9, fillna=False)).macd_diff()
-    df.ta.ema(close='close', length=10, append=True)
-    df.ta.ema(close='close', length=20, append=True)
-    df.ta.ema(close='close', length=50, append=True)
-    # print(f"After BOLLINGER_DELTA:\n{df[['BOLLINGER_DELTA', 'BOLLINGER_DELTA_SQUARE', 'BOLLINGER_DELTA_Indicator']].head(2)}")
-    if 'rsi' in indicators:
-        df.ta.rsi(close='close', length=14, append=True)
-        # print(f"After RSI calculation:\n{df[['close', 'RSI_14']].head(2)}")
-    if 'sma' in indicators:
-        df.ta.sma(close='close', length=20, append=True)
-    if 'stoch' in indicators:
-        df.ta.stoch(high='high', low='low', close='close', append=True)
+    BOLLINGER_DELTA(context["bollinger_delta_window"], df, f"BBU_{bb['length']}_{bb['std']}", f"BBL_{bb['length']}_{bb['std']}")
+
+@indicator("macd", fast=12, slow=26, signal=9, warmup=lambda context, fast, slow, signal: slow + signal)
+def _macd(df, context, fast, slow, signal):
+    df.ta.macd(close='close', fast=fast, slow=slow, signal=signal, append=True)
+
+# MACD_DIFF (line - signal) is the histogram the macd step already produced
+@indicator("macd_diff", deps=("macd",),
+           warmup=lambda context: INDICATORS["macd"]["params"]["slow"] + INDICATORS["macd"]["params"]["signal"])
+def _macd_diff(df, context):
+    macd = INDICATORS["macd"]["params"]
+    df['MACD_DIFF'] = df[f"MACDh_{macd['fast']}_{macd['slow']}_{macd['signal']}"]
+
+for _length in (10, 20, 50):
+    indicator(f"EMA_{_length}", family=("ema", _length), length=_length, warmup=lambda context, length: length)(None)
+
+indicator("rsi", family=("rsi", 14), length=14, warmup=lambda context, length: length + 1)(None)
+
+indicator("sma", family=("sma", 20), length=20, warmup=lambda context, length: length)(None)
+
+@indicator("stoch", inputs=("high", "low", "close"), k=14, d=3, smooth_k=3,
+           warmup=lambda context, k, d, smooth_k: k + d + smooth_k)
+def _stoch(df, context, k, d, smooth_k):
+    df.ta.stoch(high='high', low='low', close='close', k=k, d=d, smooth_k=smooth_k, append=True)
+
+def resolve_indicators(requested):
+    """
+    Returns the requested indicators plus BASE_INDICATORS and all their
+    dependencies, each once, in an order where dependencies come first.
+    Unknown names are ignored.
+    """
+    order = []
+    def visit(name):
+        if name in order or name not in INDICATORS:
+            return
+        for dep in INDICATORS[name]["deps"]:
+            visit(dep)
+        order.append(name)
+    for name in BASE_INDICATORS + list(requested):
+        visit(name)
+    return order
+
+def compute_indicators(df, requested, context):
+    names = resolve_indicators(requested)
+    # Family members (EMA_10, rsi, ...) and context["families"] lengths: one pass per family
+    lengths = {}
+    for name in names:
+        if INDICATORS[name]["family"]:
+            family, length = INDICATORS[name]["family"]
+            lengths.setdefault(family, set()).add(length)
+    for family, extra in (context.get("families") or {}).items():
+        lengths.setdefault(family, set()).update(extra)
+    for family, family_lengths in lengths.items():
+        compute_family(df, family, sorted(family_lengths))
+    for name in names:
+        spec = INDICATORS[name]
+        if spec["family"]:
+            continue
+        missing = [col for col in spec["inputs"] if col not in df.columns]
+        if missing:
+            log.warning("Skipping %s: missing input columns %s", name, missing)
+            continue
+        spec["compute"](df, context, **spec["params"])
+    return df
+
+# Helper function to process OHLC data
+def process_ohlc_data(data, category, ticker, indicators, bollinger_delta_window, display_start=None, families=None):
+    candles = data.get("prices")
+    if isinstance(candles, list):  # plain JSON bars
+        try:
+            candles = Candles.from_records(candles, tz=SEC_TIMEZONE if category == "SEC" else "UTC")
+        except ValueError as e:
+            return None, {"error": str(e)}
+    log.debug("Number of price rows: %s", len(candles) if candles is not None else 0)
+    if candles is None or not len(candles):
+        return None, {"error": f"Ticker {ticker} data does not exist"}
+    if len(candles) < 10:
+        return None, {"error": f"Not enough data points for indicators (got {len(candles)}, need at least 10)"}
+    valid_close = int(np.count_nonzero(~np.isnan(candles.close)))
+    if valid_close == 0:
+        return None, {"error": "All 'close' values are invalid or missing"}
+    # Check for sufficient non-NaN values
+    if valid_close < 10:
+        return None, {"error": f"Not enough valid 'close' values for indicators (got {valid_close}, need at least 10)"}
+    # Columns go straight from the arrays into the frame; 'time' stays epoch seconds until output
+    df = candles.to_frame()
+    # Calculate the requested indicators plus what the chart and signal engine need
+    compute_indicators(df, indicators, {"bollinger_delta_window": bollinger_delta_window, "families": families})
     # Keep only rows with valid data
     # df = df.dropna(subset=['BBU_10_2.0', 'BBL_10_2.0'])
-    print(f"Rows after dropna: {len(df)}")
+    log.debug("Rows after dropna: %s", len(df))
     if len(df) == 0:
         return None, {"error": "No valid data after indicator calculations"}
     # Convert to JSON-serializable format
@@ -1293,8 +2976,677 @@ def process_ohlc_data(data, category, ticker, indicators, bollinger_delta_window
     df['Buy_Signal_Price'] = buy_sell[0]
     df['Sell_Signal_Price'] = buy_sell[1]
     df['Close_Signal_Price'] = buy_sell[2]
-    serial_data = df.replace({np.nan: None}).to_dict(orient="records")
-    return serial_data, None
+    # Drop the warm-up bars fetched ahead of the requested range
+    if display_start:
+        df = df[df['time'] >= candles.day_start(display_start)]
+        if len(df) == 0:
+            return None, {"error": f"No data for {ticker} in the requested date range"}
+    df['time'] = iso_times(df['time'].to_numpy(), candles.tz)
+    return df, None
+
+# Decimal places kept for floats in chart responses (crypto prices can be ~1e-5)
+JSON_FLOAT_PRECISION = int(os.getenv('JSON_FLOAT_PRECISION', '10'))
+
+def chart_json(df):
+    """
+    Encodes the processed frame as a JSON array of row objects with pandas' C
+    encoder: floats are written from the NumPy columns at JSON_FLOAT_PRECISION
+    decimal places and NaN/inf become null, without boxing every cell into a
+    Python object first.
+    """
+    return df.to_json(orient="records", double_precision=JSON_FLOAT_PRECISION)
+
+# Streaming: ticks (or finer bars) -> closed candles -> per-bar indicators -> signals, for live
+# high-frequency crypto. Each stage keeps only its own window (the forming bar, the last
+# Bollinger/Bollinger-delta values, a few EMA states), so memory does not grow with the stream.
+class CandleAggregator:
+    """
+    Folds ticks into bars of `bar_secs` seconds aligned to the unix epoch (UTC midnight
+    for day bars). A bar is emitted once a tick for a later bar arrives, or by expire()
+    once its end has passed; ticks for bars already emitted are counted in `late`.
+    """
+
+    def __init__(self, bar_secs):
+        self.bar_secs = int(bar_secs)
+        self.bar = None
+        self.closed_until = 0   # end of the last emitted bar
+        self.late = 0
+
+    def add(self, time, open, high, low, close, volume=0.0):
+        """Adds a tick (open = high = low = close = price) or a finer bar; returns the bar it closed, or None."""
+        start = int(time) // self.bar_secs * self.bar_secs
+        bar = self.bar
+        if bar is not None and start == bar["time"]:
+            bar["high"] = max(bar["high"], high)
+            bar["low"] = min(bar["low"], low)
+            bar["close"] = close
+            bar["volume"] += volume
+            return None
+        if start < (bar["time"] if bar is not None else self.closed_until):
+            self.late += 1
+            return None
+        self.bar = {"time": start, "open": open, "high": high, "low": low, "close": close, "volume": volume}
+        if bar is not None:
+            self.closed_until = bar["time"] + self.bar_secs
+        return bar
+
+    def expire(self, now):
+        """Emits the forming bar if its interval has ended by `now` (a quiet market sends no next tick)."""
+        if self.bar is None or self.bar["time"] + self.bar_secs > now:
+            return None
+        bar, self.bar = self.bar, None
+        self.closed_until = bar["time"] + self.bar_secs
+        return bar
+
+class StreamingEma:
+    """pandas_ta's EMA one value at a time: NaN until `length` values, seeded with their mean."""
+
+    def __init__(self, length):
+        self.length = length
+        self.alpha = 2.0 / (length + 1)
+        self.count = 0
+        self.value = 0.0
+
+    def update(self, x):
+        self.count += 1
+        if self.count < self.length:
+            self.value += x
+            return np.nan
+        if self.count == self.length:
+            self.value = (self.value + x) / self.length
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+class StreamingIndicators:
+    """
+    Per-bar versions of the BASE_INDICATORS columns the signal engine reads (Bollinger
+    Bands, BOLLINGER_DELTA*, MACD, MACD_DIFF, EMA_20), with the registry's parameters.
+    BOLLINGER_DELTA_Indicator of a bar is scaled over the window ending at that bar, as
+    BOLLINGER_DELTA leaves it for every bar after the first window.
+    """
+
+    def __init__(self, bollinger_delta_window):
+        bb, macd = INDICATORS["bbands"]["params"], INDICATORS["macd"]["params"]
+        self.bb_length, self.bb_std = bb["length"], bb["std"]
+        self.bb_suffix = f"{bb['length']}_{bb['std']}"
+        self.macd_suffix = f"{macd['fast']}_{macd['slow']}_{macd['signal']}"
+        self.closes = deque(maxlen=self.bb_length)
+        self.squares = deque(maxlen=bollinger_delta_window)
+        self.fast, self.slow = StreamingEma(macd["fast"]), StreamingEma(macd["slow"])
+        self.signal = StreamingEma(macd["signal"])
+        self.ema_20 = StreamingEma(20)
+
+    def update(self, bar):
+        """Returns `bar` extended with this bar's indicator values."""
+        close = bar["close"]
+        row = dict(bar)
+        self.closes.append(close)
+        lower = middle = upper = delta = square = scaled = np.nan
+        if len(self.closes) == self.bb_length:
+            window = np.fromiter(self.closes, dtype=np.float64, count=self.bb_length)
+            middle = window.mean()
+            deviation = window.std()
+            lower, upper = middle - self.bb_std * deviation, middle + self.bb_std * deviation
+            delta = upper - lower
+            square = delta ** 2
+            self.squares.append(square)
+            if len(self.squares) == self.squares.maxlen:
+                scaled = scale_delta_squares(np.fromiter(self.squares, dtype=np.float64, count=len(self.squares)))[-1]
+        row.update({f"BBL_{self.bb_suffix}": lower, f"BBM_{self.bb_suffix}": middle, f"BBU_{self.bb_suffix}": upper,
+                    "BOLLINGER_DELTA": delta, "BOLLINGER_DELTA_SQUARE": square, "BOLLINGER_DELTA_Indicator": scaled})
+        line = self.fast.update(close) - self.slow.update(close)
+        signal = self.signal.update(line) if not np.isnan(line) else np.nan
+        row.update({f"MACD_{self.macd_suffix}": line, f"MACDh_{self.macd_suffix}": line - signal,
+                    f"MACDs_{self.macd_suffix}": signal, "MACD_DIFF": line - signal})
+        row["EMA_20"] = self.ema_20.update(close)
+        return row
+
+class SignalStream:
+    """
+    One live instrument: add_tick()/add_bar() feed the aggregator and return the rows of the
+    bars they closed, each with its indicator values and Buy/Sell/Close_Signal_Price.
+    `state` is the signal engine's flag/stop-loss dict (as kept by the alert engine).
+    """
+
+    def __init__(self, bar_secs, bollinger_delta_window, state=None):
+        self.candles = CandleAggregator(bar_secs)
+        self.indicators = StreamingIndicators(bollinger_delta_window)
+        self.state = state if state is not None else {}
+        self.bars = 0
+
+    def push(self, bar):
+        """Runs one closed bar through the indicators and the signal engine."""
+        row = self.indicators.update(bar)
+        # Signal_Buy_Sell never signals on a series' first row
+        signals = signal_step(row, self.state) if self.bars else (np.nan, np.nan, np.nan)
+        row["Buy_Signal_Price"], row["Sell_Signal_Price"], row["Close_Signal_Price"] = signals
+        self.bars += 1
+        return row
+
+    def prime(self, bars, forming=None):
+        """
+        Warms the indicators and signal state up on closed history bars (signals are not
+        returned) and continues the still forming bar, if given, from the live ticks.
+        """
+        for bar in bars:
+            self.push(bar)
+            self.candles.closed_until = bar["time"] + self.candles.bar_secs
+        if forming is not None:
+            self.candles.bar = dict(forming)
+
+    def add_bar(self, time, open, high, low, close, volume=0.0):
+        closed = self.candles.add(time, open, high, low, close, volume)
+        return [self.push(closed)] if closed else []
+
+    def add_tick(self, time, price, volume=0.0):
+        return self.add_bar(time, price, price, price, price, volume)
+
+    def expire(self, now):
+        closed = self.candles.expire(now)
+        return [self.push(closed)] if closed else []
+
+# Helper function to run an iterable of ticks ({"time", "price", "volume"}) or finer bars
+# ({"time", "open", "high", "low", "close", "volume"}) through a SignalStream, yielding closed rows
+def stream_signals(ticks, bar_secs, bollinger_delta_window, state=None, stream=None):
+    stream = stream or SignalStream(bar_secs, bollinger_delta_window, state)
+    for tick in ticks:
+        time = tick["time"]
+        if isinstance(time, str):
+            time = to_epoch_seconds([time])[0]
+        close = float(tick["price"] if "price" in tick else tick["close"])
+        if not np.isfinite(close):
+            continue   # a missing price would poison every EMA after it
+        if "price" in tick:
+            rows = stream.add_tick(time, close, float(tick.get("volume") or 0))
+        else:
+            rows = stream.add_bar(time, float(tick["open"]), float(tick["high"]), float(tick["low"]),
+                                  close, float(tick.get("volume") or 0))
+        yield from rows
+
+# Snapshots: precomputed /prices output for a watch set, refreshed after each candle close.
+# SNAPSHOT_WATCHLIST is "SEC:AAPL,CRYPTO:BTC-USD,..." (or SNAPSHOT_WATCHLIST_FILE with
+# {"SEC": [...], "CRYPTO": [...]}); intervals use the page's codes, e.g. "1D,4h".
+SNAPSHOT_WATCHLIST = os.getenv('SNAPSHOT_WATCHLIST', '')
+SNAPSHOT_WATCHLIST_FILE = os.getenv('SNAPSHOT_WATCHLIST_FILE')
+SNAPSHOT_INTERVALS = os.getenv('SNAPSHOT_INTERVALS', '1D,4h').split(',')
+SNAPSHOT_BOLLINGER_WINDOW = int(os.getenv('SNAPSHOT_BOLLINGER_WINDOW', '10'))
+SNAPSHOT_DAYS = int(os.getenv('SNAPSHOT_DAYS', '366'))           # displayed history per snapshot
+SNAPSHOT_DELAY = int(os.getenv('SNAPSHOT_DELAY', '60'))          # seconds after close before recomputing
+SNAPSHOT_WORKERS = int(os.getenv('SNAPSHOT_WORKERS', '4'))
+# Every optional indicator, so one snapshot answers any indicator selection
+SNAPSHOT_INDICATORS = ["EMA_10", "EMA_50", "rsi", "sma", "stoch"]
+# Page interval codes -> (interval, interval_multiplier) per category, as OHLCprices() sends them
+INTERVAL_CODES = {
+    "SEC": {"1h": ("OneHour", 1), "4h": ("FourHours", 1), "1D": ("OneDay", 1), "1W": ("OneWeek", 1), "1M": ("OneMonth", 1)},
+    "CRYPTO": {"1h": ("minute", 60), "4h": ("minute", 240), "1D": ("day", 1), "1W": ("week", 1), "1M": ("month", 1)}
+}
+SEC_SESSION_CLOSE = pd.Timedelta(hours=16)
+_snapshots = {}                  # (category, ticker, interval, interval_multiplier) -> snapshot
+_snapshot_scheduler = None
+
+# Helper function to expand a "SEC:AAPL,..." list (and/or JSON file) into (category, ticker, interval, multiplier) targets
+def watchlist_targets(spec, path, interval_codes):
+    watch = {"SEC": [], "CRYPTO": []}
+    if path:
+        with open(path, encoding="utf-8") as file:
+            for category, tickers in json.load(file).items():
+                watch.setdefault(category, []).extend(tickers)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        category, _, ticker = item.partition(':')
+        watch.setdefault(category, []).append(ticker)
+    return [(category, ticker, *INTERVAL_CODES[category][code])
+            for category, tickers in watch.items() if category in INTERVAL_CODES
+            for ticker in tickers
+            for code in interval_codes if code in INTERVAL_CODES[category]]
+
+def snapshot_watchlist():
+    return watchlist_targets(SNAPSHOT_WATCHLIST, SNAPSHOT_WATCHLIST_FILE, SNAPSHOT_INTERVALS)
+
+def next_candle_close(category, interval, interval_multiplier, now):
+    """Unix time of the next bar close after `now` for this interval."""
+    unit, count = interval_unit(category, interval, interval_multiplier)
+    if category == "CRYPTO":
+        step = count * UNIT_SECONDS.get(unit, 86400)
+        return (int(now) // step + 1) * step
+    local = pd.Timestamp(now, unit="s", tz="UTC").tz_convert(SEC_TIMEZONE)
+    day = local.normalize()
+    for _ in range(8):
+        if day.dayofweek < 5:
+            closes = [day + SEC_SESSION_CLOSE]
+            if unit in ("second", "minute"):
+                step = pd.Timedelta(seconds=count * UNIT_SECONDS[unit])
+                open_ = day + SEC_SESSION_OPEN
+                closes = [open_ + step * k for k in range(1, int((SEC_SESSION_CLOSE - SEC_SESSION_OPEN) / step) + 1)] + closes
+            for close in closes:
+                if close > local:
+                    return close.timestamp()
+        day = (day + pd.Timedelta(days=1)).normalize()
+    return now + 86400
+
+def compute_snapshot(category, ticker, interval, interval_multiplier):
+    end = datetime.now().date()
+    display_start = (end - timedelta(days=SNAPSHOT_DAYS)).strftime("%Y-%m-%d")
+    lookback = warmup_days(category, interval, interval_multiplier, warmup_bars(SNAPSHOT_INDICATORS, SNAPSHOT_BOLLINGER_WINDOW))
+    fetch_start = (end - timedelta(days=SNAPSHOT_DAYS + lookback)).strftime("%Y-%m-%d")
+    data = get_candles(category, ticker, interval, interval_multiplier, fetch_start, end.strftime("%Y-%m-%d"))
+    if "error" in data:
+        log.warning("Snapshot %s:%s %sx%s skipped: %s", category, ticker, interval, interval_multiplier, data["error"])
+        return None
+    df, error = process_ohlc_data(data, category, ticker, SNAPSHOT_INDICATORS, SNAPSHOT_BOLLINGER_WINDOW, display_start)
+    if error:
+        log.warning("Snapshot %s:%s %sx%s skipped: %s", category, ticker, interval, interval_multiplier, error["error"])
+        return None
+    return {
+        "version": int(data["prices"].time[-1]),   # open time of the latest bar
+        "computed_at": time.time(),
+        "start": display_start,
+        "frame": df,
+        "body": chart_json(df)
+    }
+
+def refresh_snapshots(targets):
+    def refresh(target):
+        try:
+            snapshot = compute_snapshot(*target)
+        except Exception as e:
+            log.error("Snapshot %s failed: %s", target, e)
+            return
+        if snapshot:
+            _snapshots[target] = snapshot   # readers see the old or the new version, never a mix
+    with ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix="snapshot") as pool:
+        list(pool.map(refresh, targets))
+    log.info("Refreshed %s snapshots", len(targets))
+
+def snapshot_scheduler(targets):
+    refresh_snapshots(targets)
+    while True:
+        now = time.time()
+        due = {}
+        for target in targets:
+            due.setdefault(next_candle_close(target[0], target[2], target[3], now), []).append(target)
+        close = min(due)
+        time.sleep(max(close + SNAPSHOT_DELAY - time.time(), 0))
+        refresh_snapshots(due[close])
+
+def start_snapshot_scheduler():
+    global _snapshot_scheduler
+    targets = snapshot_watchlist()
+    if _snapshot_scheduler is None and targets:
+        _snapshot_scheduler = Thread(target=snapshot_scheduler, args=(targets,), name="snapshots", daemon=True)
+        _snapshot_scheduler.start()
+
+def find_snapshot(category, ticker, interval, interval_multiplier, bollinger_delta_window, start_date, end_date):
+    """
+    Returns (body, version, stale age or None) when a snapshot answers this request, else None.
+    Snapshots carry every indicator column, so the indicator selection never matters.
+    A snapshot whose scheduled refresh has not landed is served up to STALE_MAX_AGE
+    past that refresh, and refreshed in the background.
+    """
+    if bollinger_delta_window != SNAPSHOT_BOLLINGER_WINDOW:
+        return None
+    target = (category, ticker, interval, interval_multiplier)
+    snapshot = _snapshots.get(target)
+    if snapshot is None or start_date < snapshot["start"]:
+        return None
+    # Allow a minute past the scheduled refresh for it to be computed
+    now = time.time()
+    age = now - (next_candle_close(category, interval, interval_multiplier, snapshot["computed_at"]) + SNAPSHOT_DELAY + 60)
+    stale = None
+    if age > 0:
+        if age > STALE_MAX_AGE:
+            return None
+        stale = now - snapshot["computed_at"]
+        revalidate(("snapshot",) + target, refresh_snapshots, [target])
+    if start_date == snapshot["start"] and end_date >= datetime.now().strftime("%Y-%m-%d"):
+        return snapshot["body"], snapshot["version"], stale
+    dates = snapshot["frame"]["time"].str[:10]
+    return chart_json(snapshot["frame"][(dates >= start_date) & (dates <= end_date)]), snapshot["version"], stale
+
+# Cross-ticker comparison: closes aligned on one time index, then correlation,
+# relative strength and return rankings computed for all tickers at once
+COMPARE_MAX_TICKERS = int(os.getenv('COMPARE_MAX_TICKERS', '500'))
+COMPARE_JOB_MIN_TICKERS = int(os.getenv('COMPARE_JOB_MIN_TICKERS', '20'))   # larger comparisons run as jobs; 0 disables
+COMPARE_WORKERS = int(os.getenv('COMPARE_WORKERS', '8'))
+
+def align_closes(series, by_date):
+    """
+    Returns (keys, closes) where closes is a T x N matrix on the union of bar
+    times, forward-filled, starting at the first row where every ticker has a
+    price. Daily and longer bars are keyed by local date so SEC (New York) and
+    crypto (UTC) days line up.
+    """
+    keys = []
+    for candles in series:
+        if by_date:
+            local = pd.to_datetime(candles.time, unit="s", utc=True).tz_convert(candles.tz).tz_localize(None)
+            keys.append(to_epoch_seconds(local.normalize().tz_localize("UTC")))
+        else:
+            keys.append(candles.time)
+    index = np.unique(np.concatenate(keys))
+    closes = np.full((len(index), len(series)), np.nan)
+    for column, (key, candles) in enumerate(zip(keys, series)):
+        closes[np.searchsorted(index, key), column] = candles.close
+    # Forward-fill each column: carry the row index of the last observed price down
+    rows = np.where(~np.isnan(closes), np.arange(len(index))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    closes = closes[rows, np.arange(len(series))]
+    complete = np.flatnonzero(~np.isnan(closes).any(axis=1))
+    if not len(complete):
+        return index[:0], closes[:0]
+    return index[complete[0]:], closes[complete[0]:]
+
+def rolling_correlation(returns, benchmark, window):
+    """Correlation of every column with `benchmark` over each trailing window (T-window+1 x N)."""
+    def window_sums(values):
+        cumulative = np.cumsum(np.concatenate([np.zeros((1,) + values.shape[1:]), values]), axis=0)
+        return cumulative[window:] - cumulative[:-window]
+    y = benchmark[:, None]
+    sx, sy = window_sums(returns), window_sums(y)
+    cov = window_sums(returns * y) - sx * sy / window
+    var_x = window_sums(returns ** 2) - sx ** 2 / window
+    var_y = window_sums(y ** 2) - sy ** 2 / window
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return cov / np.sqrt(var_x * var_y)
+
+def compare_tickers(closes, window, benchmark):
+    """Correlation matrix over the last `window` returns plus per-ticker stats."""
+    returns = np.diff(np.log(closes), axis=0)
+    recent = returns[-window:]
+    centered = recent - recent.mean(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scaled = centered / np.sqrt((centered ** 2).sum(axis=0))
+        correlation = scaled.T @ scaled
+        total_return = closes[-1] / closes[0] - 1
+        window_return = closes[-1] / closes[-1 - window] - 1
+        rs_ratio = (closes[-1] / closes[0]) / (closes[-1, benchmark] / closes[0, benchmark])
+    rolling = rolling_correlation(returns, returns[:, benchmark], window)
+    rank = np.empty(closes.shape[1], dtype=np.int64)
+    rank[np.argsort(-np.nan_to_num(total_return, nan=-np.inf), kind="stable")] = np.arange(1, closes.shape[1] + 1)
+    stats = pd.DataFrame({
+        "total_return": total_return,
+        "window_return": window_return,
+        "volatility": recent.std(axis=0) * np.sqrt(window),
+        "rs_ratio": rs_ratio,
+        "corr_to_benchmark": rolling[-1],
+        "rank": rank
+    })
+    return correlation, rolling, stats
+
+# Signal alerts: the Buy/Sell/Close engine runs over a watch set after every candle close and
+# new signals are POSTed in batches to ALERT_WEBHOOKS as {"alerts": [...]}. Each target keeps
+# its signal state (position flag, stop-loss, last evaluated bar) and a SignalStream, so a
+# close only runs the indicators and signal engine over the bars since the previous run.
+# The stream is primed once per process from ALERT_HISTORY_BARS bars of history.
+# ALERT_WATCHLIST / ALERT_WATCHLIST_FILE / ALERT_INTERVALS use the snapshot formats.
+ALERT_WATCHLIST = os.getenv('ALERT_WATCHLIST', '')
+ALERT_WATCHLIST_FILE = os.getenv('ALERT_WATCHLIST_FILE')
+ALERT_INTERVALS = os.getenv('ALERT_INTERVALS', '1D,4h').split(',')
+ALERT_WEBHOOKS = [url.strip() for url in os.getenv('ALERT_WEBHOOKS', '').split(',') if url.strip()]
+ALERT_BOLLINGER_WINDOW = int(os.getenv('ALERT_BOLLINGER_WINDOW', '10'))
+ALERT_HISTORY_BARS = int(os.getenv('ALERT_HISTORY_BARS', '150'))  # indicator history before the new bars
+ALERT_DELAY = int(os.getenv('ALERT_DELAY', '30'))                 # seconds after close before evaluating
+ALERT_WORKERS = int(os.getenv('ALERT_WORKERS', '8'))
+ALERT_BATCH_SIZE = int(os.getenv('ALERT_BATCH_SIZE', '100'))
+ALERT_BATCH_WAIT = float(os.getenv('ALERT_BATCH_WAIT', '2'))     # seconds to gather a batch
+ALERT_MAX_RETRIES = int(os.getenv('ALERT_MAX_RETRIES', '5'))
+ALERT_STATE_FILE = os.getenv('ALERT_STATE_FILE', '.alert_state.json')
+ALERT_RECEIVER = os.getenv('ALERT_RECEIVER', '') == '1'          # enables POST /alerts/receiver for local testing
+ALERT_SIGNALS = (("BUY", 0), ("SELL", 1), ("CLOSE", 2))           # name, position in Signal_Buy_Sell's result
+_alert_state = {}                # "category|ticker|interval|multiplier" -> {"last_time", "flag", "stop_loss_price"}
+_alert_streams = {}              # same keys -> SignalStream with the target's indicator state (not saved)
+_alert_state_lock = Lock()
+_alert_queue = Queue()
+_alert_seen = OrderedDict()      # recent alert ids, so a signal is queued once
+_alert_recent = deque(maxlen=200)
+_alert_received = deque(maxlen=1000)
+_alert_stats = {"evaluated": 0, "errors": 0, "alerts": 0, "duplicates": 0, "delivered": 0, "failed": 0}
+_alert_threads = None
+
+def alert_watchlist():
+    return watchlist_targets(ALERT_WATCHLIST, ALERT_WATCHLIST_FILE, ALERT_INTERVALS)
+
+def alert_key(target):
+    return "|".join(map(str, target))
+
+def load_alert_state():
+    try:
+        with open(ALERT_STATE_FILE, encoding="utf-8") as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return
+    with _alert_state_lock:
+        _alert_state.update(state)
+
+def save_alert_state():
+    with _alert_state_lock:
+        text = json.dumps(_alert_state)
+    try:
+        write_atomic(ALERT_STATE_FILE, text)
+    except OSError as e:
+        log.error("Could not save alert state: %s", e)
+
+def bar_closed(category, interval, interval_multiplier, bar_time, tz, now):
+    """True if the bar opened at `bar_time` has closed by `now`."""
+    unit, count = interval_unit(category, interval, interval_multiplier)
+    if unit in ("week", "month", "year"):
+        start = pd.Timestamp(bar_time, unit="s", tz="UTC").tz_convert(tz)
+        return (start + pd.DateOffset(**{f"{unit}s": count})).timestamp() <= now
+    return next_candle_close(category, interval, interval_multiplier, bar_time) <= now
+
+def evaluate_alerts(target, now):
+    """
+    Runs the signal engine over the closed bars of `target` that are newer than its
+    saved state and returns their signals as alerts. The target's SignalStream carries
+    its indicators from bar to bar, so they match a chart over the same history; the
+    first evaluation in a process primes it from recent history (and, without saved
+    state, the signal state as the chart computes it) and alerts nothing.
+    """
+    category, ticker, interval, interval_multiplier = target
+    key = alert_key(target)
+    with _alert_state_lock:
+        saved = dict(_alert_state.get(key, {}))
+        stream = _alert_streams.get(key)
+    primed = "last_time" in saved
+    since = datetime.fromtimestamp(saved.get("last_time", now))
+    if stream is None:
+        history = max(ALERT_HISTORY_BARS, warmup_bars([], ALERT_BOLLINGER_WINDOW))
+        since -= timedelta(days=warmup_days(category, interval, interval_multiplier, history))
+    data = get_candles(category, ticker, interval, interval_multiplier,
+                       since.strftime("%Y-%m-%d"), datetime.fromtimestamp(now).strftime("%Y-%m-%d"))
+    if "error" in data:
+        raise RuntimeError(data["error"])
+    candles = data["prices"]
+    closed = len(candles)
+    if closed and not bar_closed(category, interval, interval_multiplier, candles.time[-1], candles.tz, now):
+        closed -= 1   # the last bar is still forming
+    # A missing close would poison every EMA after it
+    candles = candles.take(np.flatnonzero(np.isfinite(candles.close[:closed])))
+    bars = [{"time": int(candles.time[i]), **{col: float(getattr(candles, col)[i]) for col in CANDLE_COLUMNS}}
+            for i in range(len(candles))]
+    if len(bars) < 2 or bars[-1]["time"] <= saved.get("last_time", 0):
+        return []
+    if stream is None:
+        stream = SignalStream(bar_seconds(category, interval, interval_multiplier), ALERT_BOLLINGER_WINDOW)
+        if primed:
+            # The saved signal state covers the bars up to last_time; only the indicators need history
+            history = [bar for bar in bars if bar["time"] <= saved["last_time"]]
+        else:
+            history = bars
+            df = candles.to_frame()
+            compute_indicators(df, [], {"bollinger_delta_window": ALERT_BOLLINGER_WINDOW})
+            Signal_Buy_Sell(df, saved)
+            saved["last_time"] = history[-1]["time"]
+        stream.prime(history)
+        stream.state = saved
+        with _alert_state_lock:
+            _alert_streams[key] = stream
+    alerts = []
+    for bar in bars:
+        if bar["time"] <= stream.state["last_time"]:
+            continue
+        row = stream.push(bar)
+        stream.state["last_time"] = bar["time"]
+        for name, _ in ALERT_SIGNALS:
+            price = row[f"{name.capitalize()}_Signal_Price"]
+            if np.isnan(price):
+                continue
+            alerts.append({
+                "id": f"{key}|{bar['time']}|{name}",
+                "category": category,
+                "ticker": ticker,
+                "interval": interval,
+                "interval_multiplier": interval_multiplier,
+                "signal": name,
+                "price": float(price),
+                "close": bar["close"],
+                "bar_time": iso_times([bar["time"]], candles.tz)[0]
+            })
+    with _alert_state_lock:
+        _alert_state[key] = dict(stream.state)
+    return alerts
+
+def queue_alerts(alerts):
+    for alert in alerts:
+        with _alert_state_lock:
+            if alert["id"] in _alert_seen:
+                _alert_stats["duplicates"] += 1
+                continue
+            _alert_seen[alert["id"]] = True
+            if len(_alert_seen) > 100000:
+                _alert_seen.popitem(last=False)
+            _alert_stats["alerts"] += 1
+        _alert_recent.append(alert)
+        log.info("Alert: %s %s:%s %sx%s at %s", alert["signal"], alert["category"], alert["ticker"], alert["interval"], alert["interval_multiplier"], alert["bar_time"])
+        _alert_queue.put(alert)
+
+def run_alerts(targets, now=None):
+    now = now or time.time()
+    def evaluate(target):
+        try:
+            alerts = evaluate_alerts(target, now)
+        except Exception as e:
+            log.error("Alert check %s failed: %s", target, e)
+            with _alert_state_lock:
+                _alert_stats["errors"] += 1
+            return
+        with _alert_state_lock:
+            _alert_stats["evaluated"] += 1
+        queue_alerts(alerts)
+    with ThreadPoolExecutor(max_workers=ALERT_WORKERS, thread_name_prefix="alert") as pool:
+        list(pool.map(evaluate, targets))
+    save_alert_state()
+
+def alert_scheduler(targets):
+    run_alerts(targets)
+    while True:
+        now = time.time()
+        due = {}
+        for target in targets:
+            due.setdefault(next_candle_close(target[0], target[2], target[3], now), []).append(target)
+        close = min(due)
+        time.sleep(max(close + ALERT_DELAY - time.time(), 0))
+        run_alerts(due[close])
+
+# Helper function to POST one batch to a webhook, retrying with exponential backoff
+def deliver_alerts(url, batch):
+    for attempt in range(ALERT_MAX_RETRIES + 1):
+        try:
+            response = upstream_post(url, json={"alerts": batch}, timeout=10)
+            if response.status_code < 300:
+                return True
+            error = f"HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        if attempt < ALERT_MAX_RETRIES:
+            delay = min(2 ** attempt, 60)
+            log.warning("Alert webhook %s failed (%s); retrying in %ss", url, error, delay)
+            time.sleep(delay)
+    log.error("Alert webhook %s gave up on %s alerts: %s", url, len(batch), error)
+    return False
+
+def alert_dispatcher():
+    while True:
+        batch = [_alert_queue.get()]
+        deadline = time.monotonic() + ALERT_BATCH_WAIT
+        while len(batch) < ALERT_BATCH_SIZE:
+            try:
+                batch.append(_alert_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except Empty:
+                break
+        for url in ALERT_WEBHOOKS:
+            delivered = deliver_alerts(url, batch)
+            with _alert_state_lock:
+                _alert_stats["delivered" if delivered else "failed"] += len(batch)
+
+def start_alerts():
+    global _alert_threads
+    targets = alert_watchlist()
+    if _alert_threads is None and targets:
+        load_alert_state()
+        _alert_threads = [
+            Thread(target=alert_scheduler, args=(targets,), name="alerts", daemon=True),
+            Thread(target=alert_dispatcher, name="alert-webhooks", daemon=True)
+        ]
+        for thread in _alert_threads:
+            thread.start()
+        log.info("Watching %s targets for signal alerts, delivering to %s webhooks", len(targets), len(ALERT_WEBHOOKS))
+
+# Request IDs: taken from an incoming X-Request-ID (or generated), attached to every log
+# record of the request and echoed back; one access line per request with its duration
+@app.before_request
+def start_request_log():
+    request_id_var.set(request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex[:16])
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_log(response):
+    response.headers["X-Request-ID"] = request_id_var.get()
+    duration_ms = round((time.perf_counter() - g.get("request_started", time.perf_counter())) * 1000, 1)
+    log.info("%s %s %s %sms", request.method, request.path, response.status_code, duration_ms,
+             extra={"status": response.status_code, "duration_ms": duration_ms})
+    return response
+
+@app.teardown_request
+def clear_request_id(error=None):
+    request_id_var.set("-")
+
+# On-demand profiling: a request carrying PROFILE_SECRET in the X-Profile header (or the
+# `profile` query parameter) runs under cProfile. The pstats dump is written to PROFILE_DIR
+# and named in the X-Profile-File response header; with profile_output=text the response
+# body is replaced by the top PROFILE_TOP functions by cumulative time. cProfile sees the
+# request thread only, so time spent in fetch_chunks' pool shows up as waiting there, and
+# streamed (SSE) bodies are not covered.
+# Without PROFILE_SECRET the hooks return immediately.
+PROFILE_SECRET = os.getenv('PROFILE_SECRET', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_TOP = int(os.getenv('PROFILE_TOP', '60'))
+
+@app.before_request
+def start_profile():
+    if not PROFILE_SECRET:
+        return
+    supplied = request.headers.get("X-Profile") or request.args.get("profile") or ""
+    if hmac.compare_digest(supplied.encode(), PROFILE_SECRET.encode()):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_profile(response):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{request.endpoint}-{os.getpid()}.prof"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    log.info("Profiled %s -> %s", request.path, os.path.join(PROFILE_DIR, name))  # the query may carry the secret
+    if request.args.get("profile_output") == "text":
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        response = Response(report.getvalue(), mimetype="text/plain")
+    response.headers["X-Profile-File"] = name
+    return response
 
 # Serve the HTML page
 @app.route("/")
@@ -1302,6 +3654,26 @@ def index():
     return render_template("index.html")
 
 
+# Grok AI settings shared by the buffered and streamed endpoints
+XAI_CHAT_URL = "https://api.x.ai/v1/chat/completions"
+GROK_MODEL = "grok-4-1-fast-reasoning"   # ← This is key for speed
+
+def grok_prompt(ticker, category_name):
+    return f"""
+    You are Grok, a maximally truth-seeking AI built by xAI.
+    Analyze the {category_name.lower()} with ticker '{ticker}' as of late 2025.
+    Provide:
+    1. A brief overview of what this asset is.
+    2. Current market sentiment and key recent trends.
+    3. Potential risks.
+    4. A clear recommendation: Buy, Hold, or Sell — with concise reasoning.
+    Be professional and insightful. Provide as much detail as needed for a complete analysis.
+    """
+
+# Helper function to format one server-sent event
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
 # Grok AI Analysis endpoint
 @app.route("/analyze_ai", methods=["POST"])
 def analyze_ai():
@@ -1316,23 +3688,18 @@ def analyze_ai():
         return jsonify({"error": "Ticker and category required"}), 400
 
     category_name = "Stock" if category == "SEC" else "Cryptocurrency"
+
+    cached = cache.get("grok", f"{category}:{ticker}")
+    if cached is not None:
+        return jsonify({"ticker": ticker, "category": category_name, "analysis": cached})
     
-    model = "grok-4-1-fast-reasoning"   # ← This is key for speed
+    model = GROK_MODEL
     
-    prompt = f"""
-    You are Grok, a maximally truth-seeking AI built by xAI.
-    Analyze the {category_name.lower()} with ticker '{ticker}' as of late 2025.
-    Provide:
-    1. A brief overview of what this asset is.
-    2. Current market sentiment and key recent trends.
-    3. Potential risks.
-    4. A clear recommendation: Buy, Hold, or Sell — with concise reasoning.
-    Be professional and insightful. Provide as much detail as needed for a complete analysis.
-    """
+    prompt = grok_prompt(ticker, category_name)
 
     try:
-        response = requests.post(
-            "https://api.x.ai/v1/chat/completions",
+        response = upstream_post(
+            XAI_CHAT_URL,
             headers={
                 "Authorization": f"Bearer {XAI_API_KEY}",
                 "Content-Type": "application/json"
@@ -1346,8 +3713,8 @@ def analyze_ai():
             timeout=60
         )
         # Log for debugging
-        print(f"Grok API status: {response.status_code}")
-        print(f"Grok API raw response: {response.text[:500]}...")  # First 500 chars for safety
+        log.info("Grok API status: %s", response.status_code)
+        log.debug("Grok API raw response: %s...", response.text[:500])  # First 500 chars for safety
         
         if response.status_code == 403:
             return jsonify({"error": "Invalid or unauthorized API key"}), 500
@@ -1360,6 +3727,7 @@ def analyze_ai():
         result = response.json()
         
         full_text = result["choices"][0]["message"]["content"].strip()
+        cache.set("grok", f"{category}:{ticker}", full_text)
 
         return jsonify({
             "ticker": ticker,
@@ -1370,16 +3738,401 @@ def analyze_ai():
     except requests.exceptions.Timeout:
         return jsonify({"error": "Grok is taking too long to respond. Please try again in a few seconds."}), 504
     except requests.exceptions.RequestException as e:
-        print(f"Grok network error: {e}")
+        log.error("Grok network error: %s", e)
         return jsonify({"error": "Cannot reach Grok AI right now: {str(e)}. Please try again."}), 503
     except ValueError:  # Invalid JSON
-        print(f"Invalid response from Grok: {response.text}")
+        log.error("Invalid response from Grok: %s", response.text)
         return jsonify({"error": "Grok returned invalid data. Try again."}), 500
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        log.exception("Unexpected error: %s", e)
         return jsonify({"error": "Analysis failed. Please try again."}), 500
 
 
+# Grok AI Analysis endpoint (token streamed as server-sent events)
+@app.route("/analyze_ai/stream", methods=["POST"])
+def analyze_ai_stream():
+    if not XAI_API_KEY:
+        return jsonify({"error": "Grok API key not configured"}), 500
+
+    data = request.json
+    ticker = data.get('ticker')
+    category = data.get('category')
+
+    if not ticker or not category:
+        return jsonify({"error": "Ticker and category required"}), 400
+
+    category_name = "Stock" if category == "SEC" else "Cryptocurrency"
+
+    cached = cache.get("grok", f"{category}:{ticker}")
+    if cached is not None:
+        events = [{"type": "meta", "ticker": ticker, "category": category_name},
+                  {"type": "delta", "text": cached}, {"type": "done"}]
+        return Response("".join(map(sse_event, events)), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+
+    try:
+        response = upstream_post(
+            XAI_CHAT_URL,
+            headers={
+                "Authorization": f"Bearer {XAI_API_KEY}",
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream"
+            },
+            json={
+                "model": GROK_MODEL,
+                "messages": [{"role": "user", "content": grok_prompt(ticker, category_name)}],
+                "temperature": 0.7,
+                "max_tokens": 2048,
+                "stream": True
+            },
+            stream=True,
+            timeout=(10, 60)  # connect, and max gap between tokens
+        )
+        log.info("Grok stream status: %s", response.status_code)
+        if response.status_code >= 400:
+            response.close()   # the error body is not relayed; free the upstream slot
+
+        if response.status_code == 403:
+            return jsonify({"error": "Invalid or unauthorized API key"}), 500
+        if response.status_code == 429:
+            return jsonify({"error": "Rate limited. Please wait a moment and try again."}), 429
+        if response.status_code == 404:
+            return jsonify({"error": f"Model '{GROK_MODEL}' not found. Check available models at x.ai/api"}), 500
+
+        response.raise_for_status()
+    except requests.exceptions.Timeout:
+        return jsonify({"error": "Grok is taking too long to respond. Please try again in a few seconds."}), 504
+    except requests.exceptions.RequestException as e:
+        log.error("Grok network error: %s", e)
+        return jsonify({"error": f"Cannot reach Grok AI right now: {str(e)}. Please try again."}), 503
+
+    # SSE is always UTF-8; without a charset requests would decode text/* as ISO-8859-1
+    response.encoding = "utf-8"
+
+    def relay():
+        # x.ai streams OpenAI-style chunks: "data: {json}" lines ending with "data: [DONE]"
+        parts = []
+        try:
+            yield sse_event({"type": "meta", "ticker": ticker, "category": category_name})
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(chunk)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError):
+                    log.warning("Invalid stream chunk from Grok: %s", chunk[:200])
+                    continue
+                if delta:
+                    parts.append(delta)
+                    yield sse_event({"type": "delta", "text": delta})
+            if parts:
+                cache.set("grok", f"{category}:{ticker}", "".join(parts).strip())
+            yield sse_event({"type": "done"})
+        except requests.exceptions.RequestException as e:
+            log.error("Grok stream interrupted: %s", e)
+            yield sse_event({"type": "error", "error": "Grok stream was interrupted. Please try again."})
+        finally:
+            response.close()
+
+    streamed = Response(
+        stream_with_context(relay()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # A client that disconnects before the first chunk never runs relay()'s finally
+    streamed.call_on_close(response.close)
+    return streamed
+
+
+# Per-host upstream limiter state (queue depth, wait times, adaptive concurrency)
+@app.route("/upstream/stats", methods=["GET"])
+def upstream_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return jsonify({limiter.host: limiter.snapshot() for limiter in limiters})
+
+# Alert engine status and the most recent alerts
+@app.route("/alerts", methods=["GET"])
+def alerts_status():
+    with _alert_state_lock:
+        stats = dict(_alert_stats, targets=len(_alert_state))
+    return jsonify({"stats": stats, "queued": _alert_queue.qsize(), "recent": list(_alert_recent)})
+
+# Local webhook receiver for testing ALERT_WEBHOOKS (set ALERT_RECEIVER=1)
+@app.route("/alerts/receiver", methods=["GET", "POST"])
+def alerts_receiver():
+    if not ALERT_RECEIVER:
+        return jsonify({"error": "Alert receiver is disabled"}), 404
+    if request.method == "POST":
+        batch = (request.get_json(silent=True) or {}).get("alerts", [])
+        _alert_received.extend(batch)
+        return jsonify({"received": len(batch)})
+    return jsonify(list(_alert_received))
+
+# Shared cache hit/miss counters per tier
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({"tiers": [tier.name for tier in cache.tiers], **cache.stats})
+
+# Correlation, relative strength and return ranking across several tickers
+@app.route("/compare", methods=["GET"])
+def compare():
+    category = request.args.get("category", "SEC")
+    interval_code = request.args.get("interval", "1D")
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date") or datetime.now().strftime("%Y-%m-%d")
+    requested = [t.strip() for t in request.args.get("tickers", "").split(",") if t.strip()]
+    # "SEC:AAPL" / "CRYPTO:BTC-USD" override the category per ticker
+    targets = [tuple(t.split(":", 1)) if ":" in t else (category, t) for t in requested]
+    if len(targets) < 2:
+        return jsonify({"error": "At least two tickers are required"}), 400
+    if len(targets) > COMPARE_MAX_TICKERS:
+        return jsonify({"error": f"At most {COMPARE_MAX_TICKERS} tickers per request"}), 400
+    if any(cat not in INTERVAL_CODES or interval_code not in INTERVAL_CODES[cat] for cat, _ in targets):
+        return jsonify({"error": f"Invalid category or interval. Intervals: {list(INTERVAL_CODES['SEC'])}"}), 400
+    unknown = [error for error in (unknown_ticker_error(cat, ticker) for cat, ticker in targets) if error]
+    if unknown:
+        return jsonify({"error": unknown[0], "unknown": unknown}), 400
+    try:
+        window = int(request.args.get("window", "20"))
+        datetime.strptime(start_date or "", "%Y-%m-%d")
+        datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "window must be an integer and dates YYYY-MM-DD"}), 400
+    if window < 2:
+        return jsonify({"error": "window must be at least 2"}), 400
+
+    params = {"targets": [list(target) for target in targets], "interval_code": interval_code, "start_date": start_date,
+              "end_date": end_date, "window": window, "benchmark_name": request.args.get("benchmark"),
+              "series": request.args.get("series") == "1"}
+    # Many tickers means many fetches: run them as a job, like a large chart
+    mode = request.args.get("async")
+    if mode == "1" or (mode != "0" and COMPARE_JOB_MIN_TICKERS and len(targets) > COMPARE_JOB_MIN_TICKERS):
+        return submit_chart_job(params, build_compare)
+    body, status, _ = build_compare(**params)
+    if status != 200:
+        return jsonify(body), status
+    return Response(body, mimetype="application/json")
+
+# Helper function to build a /compare response from validated parameters; returns
+# (JSON text, 200, None) or (error dict, status, None) like build_chart
+def build_compare(targets, interval_code, start_date, end_date, window, benchmark_name, series):
+    targets = [tuple(target) for target in targets]
+    job, request_id, background = job_var.get(), request_id_var.get(), upstream_background_var.get()
+    def load(target):
+        request_id_var.set(request_id)  # pool threads log under the calling request's ID
+        upstream_background_var.set(background)
+        cat, ticker = target
+        interval, interval_multiplier = INTERVAL_CODES[cat][interval_code]
+        data = get_candles(cat, ticker, interval, interval_multiplier, start_date, end_date)
+        job_progress(job, chunks_done=1)
+        return data
+
+    job_progress(job, chunks=len(targets))
+    with ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix="compare") as pool:
+        results = list(pool.map(load, targets))
+    loaded = [(target, data["prices"]) for target, data in zip(targets, results)
+              if "error" not in data and len(data["prices"])]
+    missing = [f"{cat}:{ticker}" for (cat, ticker), data in zip(targets, results)
+               if "error" in data or not len(data["prices"])]
+    if len(loaded) < 2:
+        return {"error": "Not enough tickers with data", "missing": missing}, 400, None
+
+    job_progress(stage="computing")
+    first_category = loaded[0][0][0]
+    unit = interval_unit(first_category, *INTERVAL_CODES[first_category][interval_code])[0]
+    index, closes = align_closes([candles for _, candles in loaded], by_date=unit not in ("second", "minute"))
+    if len(closes) <= window + 1:
+        return {"error": f"Only {len(closes)} aligned bars; need more than window + 1 ({window + 1})", "missing": missing}, 400, None
+    names = [f"{cat}:{ticker}" for (cat, ticker), _ in loaded]
+    benchmark_name = benchmark_name or names[0]
+    benchmark = names.index(benchmark_name) if benchmark_name in names else 0
+    correlation, rolling, stats = compare_tickers(closes, window, benchmark)
+    stats.insert(0, "ticker", names)
+    body = {
+        "benchmark": names[benchmark],
+        "window": window,
+        "bars": len(closes),
+        "start": iso_times(index[:1], "UTC")[0],
+        "end": iso_times(index[-1:], "UTC")[0],
+        "missing": missing
+    }
+    parts = [json.dumps(body)[:-1],
+             '"stats":' + stats.to_json(orient="records", double_precision=6),
+             '"correlation":' + pd.DataFrame(correlation).to_json(orient="values", double_precision=4)]
+    if series:
+        parts.append('"time":' + json.dumps(iso_times(index[window:], "UTC")))
+        parts.append('"rolling_correlation":' + pd.DataFrame(rolling.T).to_json(orient="values", double_precision=4))
+    return ", ".join(parts) + "}", 200, None
+
+# Helper function to build a /prices chart from validated parameters; returns (chart JSON
+# text, 200, notes) or (error dict, status, None), notes holding "stale" (age in seconds)
+# and "truncated_at" (unix seconds after which the upstream returned no bars) when set
+def build_chart(category, ticker, interval, interval_multiplier, start_date, end_date, indicators,
+                bollinger_delta_window, families, allow_stale=False):
+    # Fetch just enough history before start_date for the indicators to warm up
+    display_start = start_date
+    lookback_days = warmup_days(category, interval, interval_multiplier, warmup_bars(indicators, bollinger_delta_window, families))
+    start_date = (datetime.strptime(start_date, "%Y-%m-%d") - timedelta(days=lookback_days)).strftime("%Y-%m-%d")
+    log.debug("Fetching from %s (%s days of indicator warm-up)", start_date, lookback_days)
+
+    # Fetch data from API
+    data = get_candles(category, ticker, interval, interval_multiplier, start_date, end_date, allow_stale)
+    if "error" in data:
+        return {"error": data["error"]}, data.get("status", 400 if "data does not exist" in data["error"] else 500), None
+
+    # Process the data with selected indicators
+    job_progress(stage="computing")
+    df, error = process_ohlc_data(data, category, ticker, indicators, bollinger_delta_window, display_start, families)
+    if error:
+        return error, 400, None
+    notes = {key: data[key] for key in ("stale", "truncated_at") if data.get(key) is not None}
+    job_progress(stage="encoding", **notes)
+    return chart_json(df), 200, notes
+
+# Helper function for the headers that tag a stale or cut-off chart (the page shows both)
+def chart_headers(notes):
+    headers = {}
+    if notes.get("stale") is not None:
+        headers.update({"Age": str(int(notes["stale"])), "X-Stale": "revalidating"})
+    if notes.get("truncated_at") is not None:
+        headers["X-Truncated-At"] = iso_times([notes["truncated_at"]], "UTC")[0]
+    return headers
+
+# Chart jobs: /prices requests estimated above JOB_MIN_BARS bars, /compare requests over
+# COMPARE_JOB_MIN_TICKERS tickers (or either with async=1) run on a small pool of
+# JOB_WORKERS threads instead of the serving thread. The client gets 202 with a
+# job ID and polls GET /jobs/<id>; the chart itself is kept in the shared cache ("jobs"
+# namespace), so /jobs/<id>/result and a repeat of the same request are served from there.
+# Job fetches yield upstream slots to interactive requests (see HostLimiter).
+JOB_MIN_BARS = int(os.getenv('JOB_MIN_BARS', '20000'))        # 0 disables job mode
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '20'))     # queued + running jobs
+JOB_KEEP = int(os.getenv('JOB_KEEP', '500'))                  # finished job records kept for polling
+
+_jobs = OrderedDict()            # job id -> {"id", "status", "stage", "chunks", "chunks_done", ...}
+_jobs_lock = Lock()
+_job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+job_var = ContextVar("job", default=None)
+
+def chart_job_id(params, build=None):
+    """Same parameters, same job: repeats of a request share its job and cached result."""
+    if "indicators" in params:
+        params = dict(params, indicators=sorted(set(params["indicators"])))
+    if build is not None and build is not build_chart:
+        params = dict(params, build=build.__name__)
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+
+# Helper function to update the current thread's job record, if it runs one
+def job_progress(job=None, chunks=0, chunks_done=0, **fields):
+    job = job or job_var.get()
+    if job is None:
+        return
+    with _jobs_lock:
+        job["chunks"] += chunks
+        job["chunks_done"] += chunks_done
+        job.update(fields)
+
+def job_view(job):
+    with _jobs_lock:
+        view = {key: job[key] for key in ("id", "status", "stage", "chunks", "chunks_done", "created", "finished", "error")}
+        if job.get("truncated_at") is not None:
+            view["truncated_at"] = iso_times([job["truncated_at"]], "UTC")[0]
+    view["poll"] = url_for("job_status", job_id=job["id"])
+    view["result"] = url_for("job_result", job_id=job["id"])   # 202 until the chart is ready
+    return view
+
+def run_chart_job(job, params, build=None):
+    job_var.set(job)
+    request_id_var.set(job["request_id"])
+    upstream_background_var.set(True)
+    job_progress(job, status="running", stage="fetching")
+    started = time.time()
+    try:
+        body, status, _ = (build or build_chart)(**params)
+    except Exception as e:
+        log.exception("Chart job %s failed", job["id"])
+        body, status = {"error": str(e)}, 500
+    if status == 200:
+        cache.set("jobs", job["id"], body)
+        job_progress(job, status="done", stage="done", finished=time.time())
+    else:
+        job_progress(job, status="failed", stage="done", finished=time.time(), error=body["error"], error_status=status)
+    log.info("Chart job %s %s in %.1fs", job["id"], job["status"], time.time() - started)
+
+# Helper function for a finished job's chart; the job record, while kept, says if it was cut off
+def job_result_response(job_id, body):
+    with _jobs_lock:
+        job = _jobs.get(job_id) or {}
+    return Response(body, mimetype="application/json",
+                    headers={"X-Series-Order": "ascending", "X-Job-Id": job_id, **chart_headers({"truncated_at": job.get("truncated_at")})})
+
+# build (build_chart unless given) turns params into (JSON text, 200, _) or (error dict, status, _)
+def submit_chart_job(params, build=None):
+    job_id = chart_job_id(params, build)
+    cached = cache.get("jobs", job_id)
+    if cached is not None:
+        return job_result_response(job_id, cached)
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] in ("done", "failed"):   # a done job whose result expired runs again
+            if sum(1 for other in _jobs.values() if other["status"] in ("queued", "running")) >= JOB_MAX_PENDING:
+                return jsonify({"error": "Too many chart jobs in progress, try again shortly"}), 503, {"Retry-After": "30"}
+            job = {"id": job_id, "status": "queued", "stage": "queued", "chunks": 0, "chunks_done": 0,
+                   "created": time.time(), "finished": None, "error": None, "request_id": request_id_var.get()}
+            _jobs[job_id] = job
+            _jobs.move_to_end(job_id)
+            while len(_jobs) > JOB_KEEP and next(iter(_jobs.values()))["status"] in ("done", "failed"):
+                _jobs.popitem(last=False)
+            _job_pool.submit(run_chart_job, job, params, build)
+            if build is None:
+                log.info("Queued chart job %s for %s:%s %sx%s %s..%s", job_id, params["category"], params["ticker"],
+                         params["interval"], params["interval_multiplier"], params["start_date"], params["end_date"])
+            else:
+                log.info("Queued %s job %s", build.__name__, job_id)
+    view = job_view(job)
+    return jsonify(view), 202, {"Location": view["poll"], "Retry-After": "2"}
+
+# Chart job status: progress while it runs, the result URL once it is done
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return jsonify(job_view(job))
+    # Finished on another node (or before a restart): the shared cache still has the chart
+    if cache.get("jobs", job_id) is not None:
+        return jsonify({"id": job_id, "status": "done", "poll": url_for("job_status", job_id=job_id),
+                        "result": url_for("job_result", job_id=job_id)})
+    return jsonify({"error": "Unknown or expired job"}), 404
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    body = cache.get("jobs", job_id)
+    if body is not None:
+        return job_result_response(job_id, body)
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        status, error, error_status = (job["status"], job["error"], job.get("error_status")) if job else (None, None, None)
+    if status == "failed":
+        return jsonify({"error": error}), error_status or 500
+    if status in ("queued", "running"):
+        view = job_view(job)
+        return jsonify(view), 202, {"Location": view["poll"], "Retry-After": "2"}
+    return jsonify({"error": "Unknown or expired job"}), 404
+
+# Helper function to reject a ticker that is not in the category's list, or that the
+# upstream already reported missing, without an upstream round trip
+def unknown_ticker_error(category, ticker):
+    if KNOWN_TICKERS[category] and ticker not in KNOWN_TICKERS[category]:
+        return f"Unknown {category} ticker '{ticker}'"
+    if cache.get("missing", f"{category}:{ticker}"):
+        return f"Ticker {ticker} data does not exist"
+    return None
+
 # API route to get OHLC prices (for both SEC and CRYPTO)
 @app.route("/prices", methods=["GET"])
 @app.route("/crypto/prices", methods=["GET"])
@@ -1390,7 +4143,7 @@ def get_ohlc_prices():
     interval_multiplier = request.args.get("interval_multiplier")
     start_date = request.args.get("start_date")
     end_date = request.args.get("end_date")
-    bollinger_delta_window = int(request.args.get("bollinger_delta_window"))
+    bollinger_delta_window = request.args.get("bollinger_delta_window", "10")
     indicators = request.args.get("indicators", "").split(",") if request.args.get("indicators") else []
 
     # Validate query parameters
@@ -1401,11 +4154,32 @@ def get_ohlc_prices():
     if category not in ["SEC", "CRYPTO"]:
         return jsonify({"error": "Invalid category. Must be 'SEC' or 'CRYPTO'"}), 400
 
+    # Validate ticker without an upstream round trip
+    error = unknown_ticker_error(category, ticker)
+    if error:
+        return jsonify({"error": error}), 400
+
     # Validate interval
     if category == "CRYPTO":
         valid_intervals = ["second", "minute", "day", "week", "month", "year"]
         if interval not in valid_intervals:
             return jsonify({"error": f"Invalid interval. Must be one of {valid_intervals}"}), 400
+    elif interval not in QUESTRADE_INTERVAL_SECONDS:
+        return jsonify({"error": f"Invalid interval. Must be one of {list(QUESTRADE_INTERVAL_SECONDS)}"}), 400
+
+    # Validate Bollinger Delta window
+    try:
+        bollinger_delta_window = int(bollinger_delta_window)
+        if bollinger_delta_window < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "Bollinger delta window must be a positive integer"}), 400
+
+    # Validate indicator families (ema=5,8,13&rsi=7,14 ...)
+    try:
+        families = parse_families(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid indicator family: {e}"}), 400
 
     # Validate interval multiplier
     try:
@@ -1430,25 +4204,28 @@ def get_ohlc_prices():
     end_dt_date = end_dt.date()
     if end_dt_date > current_date:
         end_date = current_date.strftime("%Y-%m-%d")
-        print(f"Adjusted end_date to current date: {end_date}")
-
-    # Ensure at least 30 days of data to get enough points
-    date_range_days = (end_dt - start_dt).days
-    if date_range_days < 30:
-        start_date = (end_dt - timedelta(days=30)).strftime("%Y-%m-%d")
-        print(f"Adjusted start_date to ensure enough data: {start_date}")
+        log.debug("Adjusted end_date to current date: %s", end_date)
 
-    # Fetch data from API
-    data = OHLC_PRICES(category, ticker, interval, interval_multiplier, start_date, end_date)
-    if "error" in data:
-        return jsonify({"error": data["error"]}), 400 if "data does not exist" in data["error"] else 500
+    # Serve a precomputed snapshot when one covers this request (snapshots carry no family columns)
+    snapshot = None if families else find_snapshot(category, ticker, interval, interval_multiplier, bollinger_delta_window, start_date, end_date)
+    if snapshot:
+        body, version, stale = snapshot
+        return Response(body, mimetype="application/json",
+                        headers={"X-Snapshot-Version": str(version), "X-Series-Order": "ascending", **chart_headers({"stale": stale})})
 
-    # Process the data with selected indicators
-    serial_data, error = process_ohlc_data(data, category, ticker, indicators, bollinger_delta_window)
-    if error:
-        return jsonify(error), 400
+    # Heavy requests become background jobs: 202 now, the chart from /jobs/<id>/result later
+    params = {"category": category, "ticker": ticker, "interval": interval, "interval_multiplier": interval_multiplier,
+              "start_date": start_date, "end_date": end_date, "indicators": indicators,
+              "bollinger_delta_window": bollinger_delta_window, "families": families}
+    mode = request.args.get("async")
+    if mode == "1" or (mode != "0" and JOB_MIN_BARS and estimate_bars(category, interval, interval_multiplier, start_dt, end_dt) > JOB_MIN_BARS):
+        return submit_chart_job(params)
 
-    return jsonify(serial_data)
+    body, status, notes = build_chart(**params, allow_stale=True)
+    if status != 200:
+        return jsonify(body), status
+    # Rows come out of Candles in time order; the page can skip its own sort
+    return Response(body, mimetype="application/json", headers={"X-Series-Order": "ascending", **chart_headers(notes)})
 
 # Function to start ngrok
 #def start_ngrok():
@@ -1466,8 +4243,17 @@ def get_ohlc_prices():
 #        return None
 
 if __name__ == "__main__":
+    debug = True
+    # With debug on, the reloader runs this file again in a child process that serves the
+    # requests; start the background threads there only, not in the watching parent too
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_app()
+        # Keep the Questrade token fresh off the request path
+        start_questrade_token_refresher()
+        start_snapshot_scheduler()
+        start_alerts()
     #serve(app, host="127.0.0.1", port=5000)                   # DEV mode
-    app.run(host="0.0.0.0", port=5000, debug=True)           # PROD mode
+    app.run(host="0.0.0.0", port=5000, debug=debug)           # PROD mode
     # webhook_url = start_ngrok()
     # if webhook_url:
     #     from waitress import serve
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Bulk historical backfill: walks tickers x intervals and loads their history through
+# get_candles() (the OHLC_PRICES path, behind the per-host upstream limiter) so the shared
+# cache tiers (CACHE_TIERS=disk and/or redis) and the crypto archive are warm before a
+# node takes traffic.
+#
+# Usage: python3 backfill.py [--category SEC|CRYPTO ...] [--tickers AAPL,MSFT | --tickers-file FILE]
+#        [--intervals 1D,4h] [--start 2015-01-01] [--end YYYY-MM-DD] [--workers 4]
+#        [--checkpoint backfill_checkpoint.json] [--ttl-days 30]
+#
+# Without --tickers the SEC_URL / CRYPTO_URL ticker lists are used. Each (ticker, interval)
+# is fetched oldest first in segments of FETCH_CONCURRENCY upstream pages; the checkpoint
+# records the last finished day per job, so a restarted run resumes where it stopped.
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+import app
+
+MAX_SEGMENT_RETRIES = 3
+
+class Checkpoint:
+    """
+    Job key -> {"done_through", "status", "bars", "error"}. The file is rewritten
+    atomically at most every FLUSH_SECONDS, and whenever a job finishes or fails.
+    """
+    FLUSH_SECONDS = 5
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.flushed = 0
+        try:
+            with open(path, encoding="utf-8") as file:
+                self.jobs = json.load(file)
+        except (OSError, ValueError):
+            self.jobs = {}
+
+    def get(self, key):
+        with self.lock:
+            return dict(self.jobs.get(key, {}))
+
+    def update(self, key, flush=False, **fields):
+        with self.lock:
+            self.jobs.setdefault(key, {}).update(fields)
+            if flush or time.time() - self.flushed >= self.FLUSH_SECONDS:
+                app.write_atomic(self.path, json.dumps(self.jobs, indent=1))
+                self.flushed = time.time()
+
+class Progress:
+    def __init__(self, segments):
+        self.total = segments
+        self.done = 0
+        self.bars = 0
+        self.started = time.time()
+        self.reported = 0
+        self.lock = Lock()
+
+    def add(self, bars, segments=1, force=False):
+        with self.lock:
+            self.done += segments
+            self.bars += bars
+            now = time.time()
+            if not force and now - self.reported < 10:
+                return
+            self.reported = now
+            elapsed = max(now - self.started, 1e-9)
+            rate = self.done / elapsed
+            eta = (self.total - self.done) / rate if rate else float("inf")
+            print(f"[{self.done}/{self.total} segments] {self.bars} bars, {self.bars / elapsed:.0f} bars/s, "
+                  f"{rate * 60:.1f} segments/min, ETA {timedelta(seconds=int(eta)) if eta != float('inf') else '?'}",
+                  flush=True)
+
+def job_key(job):
+    return "|".join(map(str, job))
+
+def job_segments(category, interval, interval_multiplier, start, end):
+    max_bars = app.QUESTRADE_MAX_CANDLES if category == "SEC" else app.CRYPTO_MAX_BARS
+    bar_secs = app.bar_seconds(category, interval, interval_multiplier)
+    return app.plan_fetch_chunks(start, end, bar_secs, max_bars * app.FETCH_CONCURRENCY)
+
+def run_job(job, segments, checkpoint, progress):
+    category, ticker, interval, interval_multiplier = job
+    key = job_key(job)
+    bars = checkpoint.get(key).get("bars", 0)
+    for segment_start, segment_end in segments:
+        for attempt in range(MAX_SEGMENT_RETRIES + 1):
+            data = app.get_candles(category, ticker, interval, interval_multiplier, segment_start, segment_end)
+            if "error" not in data or "No candle data" in data["error"]:
+                break
+            if attempt == MAX_SEGMENT_RETRIES or "does not exist" in data["error"]:
+                checkpoint.update(key, flush=True, status="failed", error=data["error"])
+                print(f"{key}: failed at {segment_start}: {data['error']}", file=sys.stderr, flush=True)
+                progress.add(0, segments=len(segments) - segments.index((segment_start, segment_end)))
+                return False
+            time.sleep(min(2 ** attempt * 5, 60))
+        count = len(data.get("prices") or [])
+        bars += count
+        checkpoint.update(key, done_through=segment_end, status="running", bars=bars, error=None)
+        progress.add(count)
+    checkpoint.update(key, flush=True, status="done")
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill candle history into the shared cache and crypto archive.")
+    parser.add_argument("--category", action="append", choices=["SEC", "CRYPTO"],
+                        help="categories to backfill (default: both)")
+    parser.add_argument("--tickers", help="comma separated tickers (default: the category's ticker list)")
+    parser.add_argument("--tickers-file", help="JSON file {\"SEC\": [...], \"CRYPTO\": [...]}")
+    parser.add_argument("--intervals", default="1D,4h,1h", help="page interval codes (default: 1D,4h,1h)")
+    parser.add_argument("--start", default="2015-01-01")
+    parser.add_argument("--end", default=(datetime.now().date() - timedelta(days=1)).strftime("%Y-%m-%d"),
+                        help="last day to fetch (default: yesterday)")
+    parser.add_argument("--workers", type=int, default=4, help="jobs fetched in parallel")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json")
+    parser.add_argument("--ttl-days", type=float, default=30, help="shared cache TTL for backfilled candles")
+    args = parser.parse_args(argv)
+
+    if not any(tier.name != "memory" for tier in app.cache.tiers) and not app.CRYPTO_ARCHIVE_DIR:
+        print("Warning: CACHE_TIERS has no disk or redis tier, so backfilled candles are not kept", file=sys.stderr)
+    app.CACHE_TTLS["candles"] = int(args.ttl_days * 86400)
+
+    categories = args.category or ["SEC", "CRYPTO"]
+    if args.tickers_file:
+        with open(args.tickers_file, encoding="utf-8") as file:
+            watch = json.load(file)
+    elif args.tickers:
+        watch = {category: args.tickers.split(",") for category in categories}
+    else:
+        app.load_tickers()
+        watch = {"SEC": app.SEC_tickers, "CRYPTO": app.CRYPTO_tickers}
+    spec = ",".join(f"{category}:{ticker}" for category in categories for ticker in watch.get(category, []))
+    jobs = app.watchlist_targets(spec, None, args.intervals.split(","))
+
+    checkpoint = Checkpoint(args.checkpoint)
+    plans = []
+    for job in jobs:
+        state = checkpoint.get(job_key(job))
+        if state.get("status") == "done" and state.get("done_through", "") >= args.end:
+            continue
+        start = args.start
+        if state.get("done_through"):
+            start = max(start, (datetime.strptime(state["done_through"], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d"))
+        if start <= args.end:
+            plans.append((job, job_segments(job[0], job[2], job[3], start, args.end)))
+    print(f"{len(plans)} of {len(jobs)} jobs to run ({len(jobs) - len(plans)} already done)", flush=True)
+
+    progress = Progress(sum(len(segments) for _, segments in plans))
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="backfill") as pool:
+        results = list(pool.map(lambda plan: run_job(plan[0], plan[1], checkpoint, progress), plans))
+    progress.add(0, segments=0, force=True)
+    failed = results.count(False)
+    print(f"Backfill finished: {len(results) - failed} jobs done, {failed} failed", flush=True)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
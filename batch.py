@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Offline batch mode: run the app's indicator and Buy/Sell/Close signal logic
+# (process_ohlc_data, BOLLINGER_DELTA, Signal_Buy_Sell) over archived OHLCV files.
+#
+# Usage: python3 batch.py DIR_OR_FILE [...] --out OUT_DIR [--format csv|parquet]
+#        [--indicators EMA_10,EMA_50,rsi,sma,stoch] [--bollinger-delta-window 10]
+#        [--tz UTC] [--workers N]
+#
+# Input files are *.csv / *.parquet with a time column and open/high/low/close/volume.
+# One output file per input is written under OUT_DIR, mirroring the input layout.
+# Files are discovered lazily and at most 2 x workers are in flight, so memory stays
+# flat regardless of how many files are given.
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+import pandas as pd
+from app import Candles, process_ohlc_data
+
+INPUT_SUFFIXES = {".csv", ".parquet"}
+
+def iter_input_files(paths):
+    for path in map(Path, paths):
+        if path.is_file():
+            yield path, Path(path.name)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file = Path(root) / name
+                if file.suffix.lower() in INPUT_SUFFIXES:
+                    yield file, file.relative_to(path)
+
+def read_ohlc(path):
+    if path.suffix.lower() == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def process_file(path, relative, out_dir, out_format, indicators, bollinger_delta_window, tz):
+    """Runs in a worker process; returns (input path, rows written, error or None)."""
+    try:
+        candles = Candles.from_frame(read_ohlc(path), tz=tz)
+        df, error = process_ohlc_data({"prices": candles}, None, path.stem, indicators, bollinger_delta_window)
+        if error:
+            return str(path), 0, error["error"]
+        target = (Path(out_dir) / relative).with_suffix(f".{out_format}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if out_format == "parquet":
+            df.to_parquet(target, index=False)
+        else:
+            df.to_csv(target, index=False)
+        return str(path), len(df), None
+    except Exception as e:
+        return str(path), 0, str(e)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute indicators and Buy/Sell/Close signals for OHLCV files.")
+    parser.add_argument("inputs", nargs="+", help="directories (searched recursively) or CSV/Parquet files")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="output format (default: csv)")
+    parser.add_argument("--indicators", default="EMA_10,EMA_50,rsi,sma,stoch",
+                        help="optional indicators, comma separated (default: all)")
+    parser.add_argument("--bollinger-delta-window", type=int, default=10)
+    parser.add_argument("--tz", default="UTC", help="timezone of naive timestamps (default: UTC)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    indicators = [name for name in args.indicators.split(",") if name]
+
+    started = time.time()
+    done = rows = failed = 0
+    files = iter_input_files(args.inputs)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        pending = set()
+        while True:
+            # Keep the queue short so only a bounded number of files is ever loaded
+            for path, relative in files:
+                pending.add(pool.submit(process_file, path, relative, args.out, args.format,
+                                        indicators, args.bollinger_delta_window, args.tz))
+                if len(pending) >= 2 * args.workers:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, count, error = future.result()
+                done += 1
+                rows += count
+                if error:
+                    failed += 1
+                    print(f"{path}: {error}", file=sys.stderr)
+    print(f"Processed {done} files ({failed} failed), {rows} rows in {time.time() - started:.1f}s")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark: /prices response serialization
+# Compares the old path (df.replace({np.nan: None}).to_dict("records") + jsonify)
+# with chart_json() on synthetic frames shaped like process_ohlc_data output.
+#
+# Usage: python3 bench_json.py [rows ...]      (default: 10000 100000)
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from flask import jsonify
+from app import app, chart_json
+
+# Columns produced by process_ohlc_data with every indicator selected
+FLOAT_COLUMNS = [
+    "open", "high", "low", "close", "volume",
+    "BBL_10_2.0", "BBM_10_2.0", "BBU_10_2.0", "BBB_10_2.0", "BBP_10_2.0",
+    "BOLLINGER_DELTA", "BOLLINGER_DELTA_SQUARE", "BOLLINGER_DELTA_Indicator",
+    "MACD_12_26_9", "MACDh_12_26_9", "MACDs_12_26_9", "MACD_DIFF",
+    "EMA_10", "EMA_20", "EMA_50", "RSI_14", "SMA_20", "STOCHk_14_3_3", "STOCHd_14_3_3",
+    "Buy_Signal_Price", "Sell_Signal_Price", "Close_Signal_Price"
+]
+
+def make_frame(rows):
+    rng = np.random.default_rng(0)
+    times = pd.date_range("2015-01-01", periods=rows, freq="h", tz="America/New_York")
+    df = pd.DataFrame({"time": [t.isoformat() for t in times]})
+    for col in FLOAT_COLUMNS:
+        values = 100 + rng.standard_normal(rows).cumsum()
+        values[:50] = np.nan  # indicator warm-up
+        if col.endswith("_Signal_Price"):
+            values[rng.random(rows) > 0.01] = np.nan  # signals are sparse
+        df[col] = values
+    return df
+
+def old_path(df):
+    with app.app_context():
+        return jsonify(df.replace({np.nan: None}).to_dict(orient="records")).get_data()
+
+def new_path(df):
+    return chart_json(df).encode("utf-8")
+
+def best_of(fn, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'rows':>8} {'old (s)':>10} {'new (s)':>10} {'speedup':>8} {'old MB':>8} {'new MB':>8}")
+    for rows in sizes:
+        df = make_frame(rows)
+        repeat = 5 if rows <= 10000 else 2
+        old_t, new_t = best_of(old_path, df, repeat), best_of(new_path, df, repeat)
+        old_mb, new_mb = len(old_path(df)) / 1e6, len(new_path(df)) / 1e6
+        print(f"{rows:>8} {old_t:>10.3f} {new_t:>10.3f} {old_t / new_t:>7.1f}x {old_mb:>8.1f} {new_mb:>8.1f}")
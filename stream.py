@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Live signal stream: aggregates a tick (or second-bar) feed into candles as it arrives and
+# runs the app's indicators and Buy/Sell/Close signal logic on each closed candle
+# (SignalStream), without buffering the feed.
+#
+# Usage: some-feed | python3 stream.py --ticker BTC-USD --interval second --multiplier 15
+#        [--bollinger-delta-window 10] [--prime] [--signals-only] [--alerts]
+#
+# Input is one JSON object per line: a tick {"time", "price", "volume"} or a finer bar
+# {"time", "open", "high", "low", "close", "volume"}; time is unix seconds or ISO-8601.
+# Every closed candle is written to stdout as one JSON line. --prime warms the indicators
+# up from the ticker's recent history (get_candles), so signals are valid from the first
+# live candle; --alerts also queues signals to ALERT_WEBHOOKS like the alert engine.
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from queue import Empty, Queue
+from threading import Thread
+import numpy as np
+import app
+
+def read_lines(source, lines):
+    for line in source:
+        if line.strip():
+            lines.put(line)
+    lines.put(None)
+
+def prime_stream(stream, ticker, interval, interval_multiplier, bollinger_delta_window):
+    """Feeds recent closed history into `stream`; returns the number of bars used."""
+    bars = app.warmup_bars([], bollinger_delta_window) + 1
+    now = time.time()
+    start = datetime.fromtimestamp(now) - timedelta(days=app.warmup_days("CRYPTO", interval, interval_multiplier, bars))
+    data = app.get_candles("CRYPTO", ticker, interval, interval_multiplier,
+                           start.strftime("%Y-%m-%d"), datetime.fromtimestamp(now).strftime("%Y-%m-%d"))
+    if "error" in data:
+        raise RuntimeError(data["error"])
+    candles = data["prices"]
+    rows = [{"time": int(candles.time[i]), **{col: float(getattr(candles, col)[i]) for col in app.CANDLE_COLUMNS}}
+            for i in range(len(candles)) if np.isfinite(candles.close[i])]
+    forming = None
+    if rows and not app.bar_closed("CRYPTO", interval, interval_multiplier, rows[-1]["time"], candles.tz, now):
+        forming = rows.pop()
+    stream.prime(rows, forming)
+    return len(rows)
+
+def emit(row, ticker, interval, interval_multiplier, alerts):
+    bar_time = app.iso_times([row["time"]], "UTC")[0]
+    if alerts:
+        app.queue_alerts([{
+            "id": f"{app.alert_key(('CRYPTO', ticker, interval, interval_multiplier))}|{row['time']}|{name}",
+            "category": "CRYPTO",
+            "ticker": ticker,
+            "interval": interval,
+            "interval_multiplier": interval_multiplier,
+            "signal": name,
+            "price": row[f"{name.capitalize()}_Signal_Price"],
+            "close": row["close"],
+            "bar_time": bar_time
+        } for name, _ in app.ALERT_SIGNALS if not np.isnan(row[f"{name.capitalize()}_Signal_Price"])])
+    out = {key: (None if isinstance(value, float) and np.isnan(value) else value) for key, value in row.items()}
+    out["time"] = bar_time
+    print(json.dumps(out), flush=True)
+
+def wait_for_delivery(timeout):
+    """Gives the webhook dispatcher up to `timeout` seconds to finish the queued alerts."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with app._alert_state_lock:
+            stats = dict(app._alert_stats)
+        if stats["delivered"] + stats["failed"] >= stats["alerts"] * len(app.ALERT_WEBHOOKS):
+            return
+        time.sleep(0.2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate a live tick feed into candles and run the signal engine on each close.")
+    parser.add_argument("--ticker", required=True, help="crypto ticker, used for --prime and in alerts")
+    parser.add_argument("--interval", default="second", choices=["second", "minute", "day"])
+    parser.add_argument("--multiplier", type=int, default=1, help="candle length in intervals")
+    parser.add_argument("--bollinger-delta-window", type=int, default=10)
+    parser.add_argument("--input", help="read ticks from this file instead of stdin")
+    parser.add_argument("--prime", action="store_true", help="warm indicators up from recent history")
+    parser.add_argument("--signals-only", action="store_true", help="only write candles with a signal")
+    parser.add_argument("--alerts", action="store_true", help="also deliver signals to ALERT_WEBHOOKS")
+    args = parser.parse_args(argv)
+    if args.multiplier < 1:
+        parser.error("--multiplier must be a positive integer")
+
+    bar_secs = app.bar_seconds("CRYPTO", args.interval, args.multiplier)
+    stream = app.SignalStream(bar_secs, args.bollinger_delta_window)
+    if args.prime:
+        primed = prime_stream(stream, args.ticker, args.interval, args.multiplier, args.bollinger_delta_window)
+        print(f"Primed with {primed} bars", file=sys.stderr, flush=True)
+    if args.alerts:
+        if not app.ALERT_WEBHOOKS:
+            print("Warning: --alerts without ALERT_WEBHOOKS, signals are only logged", file=sys.stderr)
+        Thread(target=app.alert_dispatcher, name="alert-webhooks", daemon=True).start()
+
+    # Ticks are read on their own thread, so a quiet feed still closes candles on time
+    lines = Queue(maxsize=10000)
+    source = open(args.input, encoding="utf-8") if args.input else sys.stdin
+    Thread(target=read_lines, args=(source, lines), name="ticks", daemon=True).start()
+    candles = signals = 0
+    ended = False
+    while not ended:
+        try:
+            line = lines.get(timeout=1)
+        except Empty:
+            line = ""
+        if not line:
+            # Idle (or end of input): close the forming candle once its end has passed
+            ended = line is None
+            rows = stream.expire(time.time())
+        else:
+            try:
+                rows = list(app.stream_signals([json.loads(line)], bar_secs, args.bollinger_delta_window, stream=stream))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping bad tick {line.strip()[:200]}: {e}", file=sys.stderr, flush=True)
+                continue
+        for row in rows:
+            candles += 1
+            has_signal = any(not np.isnan(row[col]) for col in ("Buy_Signal_Price", "Sell_Signal_Price", "Close_Signal_Price"))
+            signals += has_signal
+            if has_signal or not args.signals_only:
+                emit(row, args.ticker, args.interval, args.multiplier, args.alerts)
+    print(f"Stream ended: {candles} candles, {signals} with signals, {stream.candles.late} late ticks dropped",
+          file=sys.stderr, flush=True)
+    if args.alerts:
+        wait_for_delivery(60)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Keep the tests off the network and out of the working directory: no ticker lists,
+# memory-only cache, no crypto archive on disk
+os.environ.setdefault("SEC_URL", "")
+os.environ.setdefault("CRYPTO_URL", "")
+os.environ.setdefault("CACHE_TIERS", "memory")
+os.environ.setdefault("CRYPTO_ARCHIVE_DIR", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def candle_series():
+    """Hook for `client`: (ticker, start_date) -> the Candles its get_candles stand-in returns."""
+    import app
+    def series(ticker, start_date):
+        rng = np.random.default_rng(0)
+        close = 100 + np.cumsum(rng.normal(size=400))
+        times = app.to_epoch_seconds([f"{start_date}T00:00:00Z"])[0] + np.arange(400) * 3600
+        return app.Candles(times, close, close + 1, close - 1, close, np.ones(400))
+    return series
+
+@pytest.fixture
+def client(monkeypatch, candle_series):
+    """Flask test client over candle_series instead of upstream; client.calls records each
+    fetch as (ticker, whether it ran at background priority)."""
+    import app
+    monkeypatch.setattr(app, "_started", True)   # no ticker download or index.html
+    calls = []
+    def fake_candles(category, ticker, interval, interval_multiplier, start_date, end_date, allow_stale=False):
+        calls.append((ticker, app.upstream_background_var.get()))
+        return {"prices": candle_series(ticker, start_date)}
+    monkeypatch.setattr(app, "get_candles", fake_candles)
+    client = app.app.test_client()
+    client.calls = calls
+    return client
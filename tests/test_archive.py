@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+def fake_crypto_prices(calls, day_bounds=False):
+    """
+    Upstream stand-in: one bar per interval in [start_date, end_date], at most `limit` of them.
+    With day_bounds it only reads the date of start_date, like an upstream that cannot page.
+    """
+    def get(url, params=None, **kwargs):
+        calls.append(dict(params))
+        start = pd.Timestamp(params["start_date"][:10] if day_bounds else params["start_date"])
+        start = start.tz_localize("UTC") if start.tzinfo is None else start.tz_convert("UTC")
+        end = pd.Timestamp(params["end_date"], tz="UTC")
+        if len(params["end_date"]) == 10:
+            end += pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+        step = pd.Timedelta(seconds=app.bar_seconds("CRYPTO", params["interval"], params["interval_multiplier"]))
+        times = pd.date_range(start.ceil(step), end, freq=step)[:int(params["limit"])]
+        return FakeResponse({"ticker": params["ticker"], "prices": [
+            {"time": t.isoformat(), "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 1.0} for t in times]})
+    return get
+
+def day(days_ago):
+    return (datetime.now(timezone.utc).date() - timedelta(days=days_ago)).strftime("%Y-%m-%d")
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "CRYPTO_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "_candle_cache", app.OrderedDict())
+    return tmp_path
+
+def archived_days(archive):
+    coverage = archive.coverage()
+    if coverage is None:
+        return {}
+    candles = archive.read(*coverage)
+    days = pd.to_datetime(candles.time, unit="s", utc=True).strftime("%Y-%m-%d")
+    return dict(zip(*np.unique(days, return_counts=True)))
+
+def test_archive_coverage_complete_days(archive_dir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, "upstream_get", fake_crypto_prices(calls))
+    data = app.get_candles("CRYPTO", "BTC-USD", "minute", 15, day(5), day(2))
+    assert len(data["prices"]) == 4 * 96
+    archive = app.CandleArchive("BTC-USD", ("minute", 15))
+    assert archive.coverage() == (day(5), day(2))
+    assert archived_days(archive) == {day(n): 96 for n in range(2, 6)}
+    fetched = len(calls)
+    assert len(app.get_candles("CRYPTO", "BTC-USD", "minute", 15, day(4), day(3))["prices"]) == 2 * 96
+    assert len(calls) == fetched
+
+def test_days_larger_than_a_page_are_paged(archive_dir, monkeypatch):
+    # 1440 one-minute bars a day do not fit a 1000 bar page
+    monkeypatch.setattr(app, "CRYPTO_MAX_BARS", 1000)
+    calls = []
+    monkeypatch.setattr(app, "upstream_get", fake_crypto_prices(calls))
+    data = app.get_candles("CRYPTO", "BTC-USD", "minute", 1, day(4), day(2))
+    assert len(data["prices"]) == 3 * 1440
+    assert np.all(np.diff(data["prices"].time) == 60)
+    assert len(calls) == 6
+    archive = app.CandleArchive("BTC-USD", ("minute", 1))
+    assert archive.coverage() == (day(4), day(2))
+    assert archived_days(archive) == {day(n): 1440 for n in range(2, 5)}
+
+def test_archive_does_not_cover_truncated_days(archive_dir, monkeypatch):
+    monkeypatch.setattr(app, "CRYPTO_MAX_BARS", 1000)
+    monkeypatch.setattr(app, "upstream_get", fake_crypto_prices([], day_bounds=True))
+    data = app.OHLC_PRICES("CRYPTO", "BTC-USD", "minute", 1, day(4), day(2))
+    assert data["truncated_at"] == data["prices"].time[999]
+    app.get_candles("CRYPTO", "BTC-USD", "minute", 1, day(4), day(2))
+    archive = app.CandleArchive("BTC-USD", ("minute", 1))
+    for counted in archived_days(archive).values():
+        assert counted == 1440
+
+def test_cut_off_range_is_not_cached_as_covered(monkeypatch):
+    monkeypatch.setattr(app, "CRYPTO_ARCHIVE_DIR", "")
+    monkeypatch.setattr(app, "_candle_cache", app.OrderedDict())
+    calls = []
+    monkeypatch.setattr(app, "upstream_get", fake_crypto_prices(calls, day_bounds=True))
+    key = ("CRYPTO", "BTC-USD", ("minute", 1))
+    app.get_candles("CRYPTO", "BTC-USD", "minute", 1, day(6), day(5))
+    assert app._candle_entry(key)["end"] == day(5)
+
+    # The extension is cut off within its first day: no whole day to add, nothing cached
+    monkeypatch.setattr(app, "CRYPTO_MAX_BARS", 1000)
+    data = app.get_candles("CRYPTO", "BTC-USD", "minute", 1, day(6), day(3))
+    assert data["truncated_at"] == app.to_epoch_seconds([f"{day(4)}T16:39:00Z"])[0]
+    assert app._candle_entry(key)["end"] == day(5)
+    # So a later request fetches the missing days again instead of serving the short series
+    monkeypatch.setattr(app, "CRYPTO_MAX_BARS", 2000)
+    fetched = len(calls)
+    data = app.get_candles("CRYPTO", "BTC-USD", "minute", 1, day(6), day(3))
+    assert "truncated_at" not in data
+    assert len(calls) > fetched
+    assert len(data["prices"]) == 4 * 1440
+    assert app._candle_entry(key)["end"] == day(3)
+
+def test_cut_off_chart_is_flagged(monkeypatch):
+    monkeypatch.setattr(app, "CRYPTO_ARCHIVE_DIR", "")
+    monkeypatch.setattr(app, "_candle_cache", app.OrderedDict())
+    monkeypatch.setattr(app, "_started", True)
+    monkeypatch.setattr(app, "CRYPTO_MAX_BARS", 1000)
+    monkeypatch.setattr(app, "upstream_get", fake_crypto_prices([], day_bounds=True))
+    response = app.app.test_client().get("/prices", query_string=dict(
+        ticker="CUT-USD", category="CRYPTO", interval="minute", interval_multiplier=1,
+        start_date=day(3), end_date=day(2), bollinger_delta_window=10, **{"async": "0"}))
+    assert response.status_code == 200
+    # The first cut-off day is in the indicator warm-up fetched before start_date
+    assert response.headers["X-Truncated-At"].endswith("T16:39:00+00:00")
+    assert response.headers["X-Truncated-At"] < day(3)
+    assert app._candle_entry(("CRYPTO", "CUT-USD", ("minute", 1))) is None
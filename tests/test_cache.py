@@ -0,0 +1,108 @@
+import socket
+from threading import Thread
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app
+
+class CountingDiskTier(app.DiskTier):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.written = 0
+
+    def set(self, key, blob, expires_at):
+        self.written += len(blob)
+        super().set(key, blob, expires_at)
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    disk = CountingDiskTier(str(tmp_path))
+    monkeypatch.setattr(app, "cache", app.TieredCache([disk]))
+    monkeypatch.setattr(app, "_candle_cache", app.OrderedDict())
+    return disk
+
+def daily_bars(start, count):
+    times = app.to_epoch_seconds([f"{start}T00:00:00Z"])[0] + np.arange(count) * 86400
+    close = np.arange(count, dtype=np.float64) + 100
+    return app.Candles(times, close, close, close, close, np.ones(count))
+
+def test_cache_value_round_trip():
+    candles = daily_bars("2024-01-01", 5)
+    decoded = app.decode_cache_value(app.encode_cache_value({"bars": candles, "n": 3}))
+    assert decoded["n"] == 3
+    for col in ("time",) + app.CANDLE_COLUMNS:
+        np.testing.assert_array_equal(getattr(decoded["bars"], col), getattr(candles, col))
+
+def test_extending_a_segment_writes_only_the_new_bars(shared_cache, monkeypatch):
+    def fake_prices(category, ticker, interval, interval_multiplier, start_date, end_date):
+        days = (np.datetime64(end_date) - np.datetime64(start_date)).astype(int) + 1
+        return {"prices": daily_bars(start_date, days)}
+    monkeypatch.setattr(app, "OHLC_PRICES", fake_prices)
+    key = ("CRYPTO", "BTC-USD", ("day", 1))
+
+    app.get_candles("CRYPTO", "BTC-USD", "day", 1, "2020-01-01", "2020-12-31")
+    first = shared_cache.written
+    writes = []
+    for month in range(1, 13):
+        before = shared_cache.written
+        app.get_candles("CRYPTO", "BTC-USD", "day", 1, "2020-01-01", f"2021-{month:02d}-28")
+        writes.append(shared_cache.written - before)
+    # Each month appends about 30 bars: the writes stay far below the first year's
+    assert max(writes) < first / 4
+
+    # Another node assembles the same segment from the parts
+    local = app._candle_entry(key)
+    monkeypatch.setattr(app, "_candle_cache", app.OrderedDict())
+    entry = app._candle_entry(key)
+    assert (entry["start"], entry["end"]) == ("2020-01-01", "2021-12-28")
+    np.testing.assert_array_equal(entry["bars"].time, daily_bars("2020-01-01", 366 + 362).time)
+    for col in ("time",) + app.CANDLE_COLUMNS:
+        np.testing.assert_array_equal(getattr(entry["bars"], col), getattr(local["bars"], col))
+
+def test_extending_backwards_rewrites_the_segment(shared_cache, monkeypatch):
+    monkeypatch.setattr(app, "OHLC_PRICES", lambda *args: {"prices": daily_bars(args[4], 10)})
+    app.get_candles("CRYPTO", "ETH-USD", "day", 1, "2020-01-11", "2020-01-20")
+    app.get_candles("CRYPTO", "ETH-USD", "day", 1, "2020-01-01", "2020-01-20")
+    head = app.cache.get("candles", "CRYPTO:ETH-USD:1day", local=False)
+    assert head["start"] == "2020-01-01" and len(head["parts"]) == 1
+
+def error_reply_server():
+    """Local server answering every RESP command with an error reply; counts connections."""
+    server = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+    def serve():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            accepted.append(conn)
+            Thread(target=reply_errors, args=(conn,), daemon=True).start()
+    def reply_errors(conn):
+        with conn, conn.makefile("rb") as reader:
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                count = int(line[1:])
+                for _ in range(count):
+                    size = int(reader.readline()[1:])
+                    reader.read(size + 2)
+                conn.sendall(b"-WRONGTYPE Operation against a key holding the wrong kind of value\r\n")
+    Thread(target=serve, daemon=True).start()
+    return server, accepted
+
+def test_redis_error_reply_keeps_connection():
+    server, accepted = error_reply_server()
+    try:
+        tier = app.RedisTier(f"redis://127.0.0.1:{server.getsockname()[1]}")
+        for _ in range(3):
+            with pytest.raises(app.CacheUnavailable, match="WRONGTYPE"):
+                tier.get("key")
+        assert len(accepted) == 1
+        assert tier.idle.qsize() == 1
+        assert tier.down_until == 0   # an error reply is not an outage
+    finally:
+        server.close()
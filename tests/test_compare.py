@@ -0,0 +1,53 @@
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app
+
+@pytest.fixture
+def candle_series():
+    def series(ticker, start_date):
+        rng = np.random.default_rng(int(ticker[1:]))
+        close = 100 * np.exp(np.cumsum(rng.normal(scale=0.01, size=60)))
+        times = 1_704_204_000 + np.arange(60) * 86400
+        return app.Candles(times, close, close, close, close, np.ones(60), tz=app.SEC_TIMEZONE)
+    return series
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setitem(app.KNOWN_TICKERS, "SEC", frozenset(f"T{i}" for i in range(40)))
+    monkeypatch.setattr(app, "COMPARE_JOB_MIN_TICKERS", 5)
+    return client
+
+def compare(client, tickers, **params):
+    return client.get("/compare", query_string=dict(tickers=",".join(tickers), start_date="2024-01-01", end_date="2024-03-31", **params))
+
+def test_compare_rejects_unknown_tickers_before_fetching(client):
+    response = compare(client, ["T1", "NOPE"])
+    assert response.status_code == 400
+    assert response.get_json()["unknown"] == ["Unknown SEC ticker 'NOPE'"]
+    assert client.calls == []
+
+def test_small_compare_answers_directly(client):
+    response = compare(client, ["T1", "T2", "T3"])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [row["ticker"] for row in body["stats"]] == ["SEC:T1", "SEC:T2", "SEC:T3"]
+    assert np.allclose(np.diag(body["correlation"]), 1)
+
+def test_large_compare_runs_as_job(client):
+    tickers = [f"T{i}" for i in range(10)]
+    response = compare(client, tickers)
+    assert response.status_code == 202
+    job = response.get_json()
+    for _ in range(100):
+        result = client.get(job["result"])
+        if result.status_code != 202:
+            break
+        time.sleep(0.05)
+    assert result.status_code == 200
+    direct = compare(client, tickers, **{"async": "0"})
+    assert result.get_json() == direct.get_json()
+    assert client.get(job["poll"]).get_json()["chunks_done"] == 10
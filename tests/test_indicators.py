@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app
+
+def random_frame(n, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=n))
+    return app.Candles(1_700_000_000 + np.arange(n) * 60, close, close + 1, close - 1, close, np.ones(n)).to_frame()
+
+def test_bollinger_delta_follows_bbands_params(monkeypatch):
+    monkeypatch.setitem(app.INDICATORS["bbands"], "params", {"length": 20, "std": 2.5})
+    monkeypatch.setitem(app.INDICATORS["macd"], "params", {"fast": 8, "slow": 21, "signal": 5})
+    assert app.warmup_bars(["bollinger_delta"], 10) == 30
+    assert app.warmup_bars(["macd_diff"], 0) == 26
+    df = random_frame(200, 1)
+    app.compute_indicators(df, [], {"bollinger_delta_window": 10})
+    np.testing.assert_allclose(df["BOLLINGER_DELTA"], df["BBU_20_2.5"] - df["BBL_20_2.5"], equal_nan=True)
+    assert df["BOLLINGER_DELTA_Indicator"].first_valid_index() == 19
+    np.testing.assert_array_equal(df["MACD_DIFF"], df["MACDh_8_21_5"])
+
+@pytest.mark.parametrize("rows", [1, 5, 31, 32, 33, 130, 2000])
+@pytest.mark.parametrize("family", ["ema", "sma", "rsi"])
+def test_family_kernels_match_pandas(family, rows):
+    close = random_frame(rows, rows)["close"]
+    lengths = [2, 5, 8, 13, 21, 55, 200]
+    values = app.FAMILIES[family]["compute"](close.to_numpy(), np.array(lengths))
+    for column, length in enumerate(lengths):
+        expected = app.family_series(close, family, length).to_numpy()
+        np.testing.assert_allclose(values[:, column], expected, rtol=1e-7, atol=1e-9, equal_nan=True, err_msg=f"{family} {length}")
+
+@pytest.mark.parametrize("family", ["ema", "sma", "rsi"])
+def test_family_columns_match_pandas_ta(family):
+    df = random_frame(600, 7)
+    app.compute_family(df, family, [5, 14, 50])
+    for length in (5, 14, 50):
+        reference = getattr(df.ta, family)(close="close", length=length, append=False)
+        np.testing.assert_allclose(df[f"{family.upper()}_{length}"], reference, rtol=1e-6, atol=1e-8, equal_nan=True)
+
+def test_family_with_missing_closes_falls_back_to_pandas():
+    df = random_frame(100, 3)
+    df.loc[40, "close"] = np.nan
+    app.compute_family(df, "ema", [5, 10])
+    np.testing.assert_allclose(df["EMA_10"], app.family_series(df["close"], "ema", 10), equal_nan=True)
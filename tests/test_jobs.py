@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+pytest.importorskip("pandas_ta")
+
+def prices(client, **params):
+    query = dict(ticker="JOB-USD", category="CRYPTO", interval="minute", interval_multiplier=60,
+                 start_date="2024-01-01", end_date="2024-01-10", bollinger_delta_window=10)
+    query.update(params)
+    return client.get("/prices", query_string=query)
+
+def test_async_chart_job_matches_direct_response(client):
+    response = prices(client, **{"async": "1"})
+    assert response.status_code == 202
+    job = response.get_json()
+    for _ in range(200):
+        result = client.get(job["result"])
+        if result.status_code != 202:
+            break
+        time.sleep(0.05)
+    assert result.status_code == 200
+    assert client.get(job["poll"]).get_json()["status"] == "done"
+    # The job's fetch ran at background priority, the direct one does not
+    assert client.calls[0][1] is True
+    direct = prices(client, **{"async": "0"})
+    assert direct.status_code == 200
+    assert client.calls[-1][1] is False
+    assert result.get_data() == direct.get_data()
+    # A repeat of the job request is answered from the cached result
+    assert prices(client, **{"async": "1"}).status_code == 200
+
+def test_unknown_job_is_404(client):
+    assert client.get("/jobs/doesnotexist").status_code == 404
+    assert client.get("/jobs/doesnotexist/result").status_code == 404
@@ -0,0 +1,26 @@
+import json
+import logging
+import sys
+from queue import Queue
+
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app
+
+def queued_record():
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.LogRecord("app", logging.ERROR, __file__, 1, "Chart %s failed", ("AAPL",), sys.exc_info())
+    return app.DroppingQueueHandler(Queue()).prepare(record)
+
+def test_json_log_keeps_traceback_through_queue():
+    entry = json.loads(app.JsonFormatter().format(queued_record()))
+    assert entry["msg"] == "Chart AAPL failed"
+    assert "ZeroDivisionError" in entry["exc"]
+
+def test_text_log_keeps_traceback_through_queue():
+    text = logging.Formatter("%(levelname)s %(message)s").format(queued_record())
+    assert text.startswith("ERROR Chart AAPL failed\nTraceback")
+    assert text.count("ZeroDivisionError") == 1
@@ -0,0 +1,40 @@
+import time
+from threading import Thread
+
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app
+
+@pytest.fixture
+def no_token(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "QUESTRADE_TOKEN_STATE", str(tmp_path / "token.json"))
+    monkeypatch.setattr(app, "_token", (None, None, 0))
+    monkeypatch.setattr(app, "_token_error", None)
+    monkeypatch.setattr(app, "start_questrade_token_refresher", lambda: None)
+    app._token_wakeup.clear()
+
+def test_waiters_fail_fast_while_refresher_backs_off(no_token, monkeypatch):
+    monkeypatch.setattr(app, "_token_error", ("HTTP 503", time.time() + 60))
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="HTTP 503"):
+        app.questrade_token(timeout=5)
+    assert time.monotonic() - started < 1
+    assert not app._token_wakeup.is_set()
+
+def test_waiter_wakes_refresher_once(no_token):
+    wakeups = []
+    def refresher():
+        # Count wake-ups for a while, then fail the refresh
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            if app._token_wakeup.wait(0.05):
+                wakeups.append(time.monotonic())
+                app._token_wakeup.clear()
+        app._token_error = ("refresh token rejected", time.time() + 5)
+    thread = Thread(target=refresher)
+    thread.start()
+    with pytest.raises(RuntimeError, match="refresh token rejected"):
+        app.questrade_token(timeout=5)
+    thread.join()
+    assert len(wakeups) == 1
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas_ta")
+import app
+
+WINDOW = 10
+SIGNAL_COLUMNS = ["Buy_Signal_Price", "Sell_Signal_Price", "Close_Signal_Price"]
+
+def random_candles(n, seed, bar_secs=60):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=n)) * 0.5
+    open_ = close + rng.normal(size=n) * 0.3
+    return app.Candles(1_700_000_040 + np.arange(n) * bar_secs, open_, np.maximum(open_, close) + 0.2,
+                       np.minimum(open_, close) - 0.2, close, np.ones(n))
+
+def bar(candles, i):
+    return {"time": int(candles.time[i]), **{col: float(getattr(candles, col)[i]) for col in app.CANDLE_COLUMNS}}
+
+def test_scale_delta_squares_pins_window_maximum():
+    # (max-min) * (100/(max-min)) is 99.99999999999999 for this window
+    squares = np.array([0.3, 0.5, 0.9, 0.4])
+    assert (0.9 - 0.3) * (100 / (0.9 - 0.3)) != 100
+    scaled = app.scale_delta_squares(squares)
+    assert scaled[2] == 100
+    assert scaled[0] == 0
+    assert (app.scale_delta_squares(np.full(4, 0.5)) == 0).all()
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_streaming_signals_match_chart(seed):
+    candles = random_candles(3000, seed)
+    df, error = app.process_ohlc_data({"prices": candles}, "CRYPTO", "BTC-USD", [], WINDOW)
+    assert error is None
+
+    # Within the first window the chart scales every bar against that whole window, which a
+    # stream cannot see yet; from the first full window on both use the window ending at the bar
+    first = app.INDICATORS["bbands"]["params"]["length"] - 1 + WINDOW - 1
+    state = {}
+    app.Signal_Buy_Sell(df.iloc[:first], state)
+    stream = app.SignalStream(60, WINDOW)
+    rows = []
+    for i in range(len(candles)):
+        if i == first:
+            stream.state.update(state)
+        rows.append(stream.push(bar(candles, i)))
+
+    for col in ["BBL_10_2.0", "BBU_10_2.0", "MACD_DIFF", "EMA_20"]:
+        np.testing.assert_allclose([row[col] for row in rows], df[col].to_numpy(), rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col)
+    np.testing.assert_allclose([row["BOLLINGER_DELTA_Indicator"] for row in rows[first:]],
+                               df["BOLLINGER_DELTA_Indicator"].to_numpy()[first:], rtol=1e-9, atol=1e-9)
+    for col in SIGNAL_COLUMNS:
+        streamed = np.array([row[col] for row in rows[first:]], dtype=np.float64)
+        np.testing.assert_array_equal(streamed, df[col].to_numpy()[first:], err_msg=col)
+    assert np.count_nonzero(~np.isnan(df["Buy_Signal_Price"].to_numpy()[first:])) > 0
+
+def test_alerts_match_chart_signals(monkeypatch):
+    candles = random_candles(2000, 4)
+    df, error = app.process_ohlc_data({"prices": candles}, "CRYPTO", "BTC-USD", [], app.ALERT_BOLLINGER_WINDOW)
+    assert error is None
+    visible = {"bars": 0}
+    # The feed shows the series up to the current bar, which is still forming
+    monkeypatch.setattr(app, "get_candles", lambda *args, **kwargs: {"prices": candles.take(slice(0, visible["bars"] + 1))})
+    monkeypatch.setattr(app, "_alert_state", {})
+    monkeypatch.setattr(app, "_alert_streams", {})
+    # Evaluations after the first must not depend on how much trailing history is refetched
+    monkeypatch.setattr(app, "ALERT_HISTORY_BARS", 0)
+    target = ("CRYPTO", "BTC-USD", "minute", 1)
+
+    primed = 200
+    fired = []
+    rng = np.random.default_rng(5)
+    bars = primed
+    while bars < len(candles):
+        visible["bars"] = bars
+        alerts = app.evaluate_alerts(target, float(candles.time[bars - 1]) + 60)
+        assert bars > primed or alerts == []
+        fired += alerts
+        bars += int(rng.integers(1, 8))
+
+    expected = []
+    times = df["time"].to_numpy()
+    for name, _ in app.ALERT_SIGNALS:
+        prices = df[f"{name.capitalize()}_Signal_Price"].to_numpy()
+        for row in np.flatnonzero(~np.isnan(prices)):
+            if primed <= row < visible["bars"]:
+                expected.append((times[row], name, prices[row]))
+    assert len(expected) > 0
+    assert sorted((alert["bar_time"], alert["signal"], alert["price"]) for alert in fired) == sorted(expected)
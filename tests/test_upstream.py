@@ -0,0 +1,60 @@
+import io
+import json
+
+import pytest
+import requests
+
+pytest.importorskip("pandas_ta")
+import app
+
+class FakeResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+def test_streamed_response_holds_slot_until_closed(monkeypatch):
+    monkeypatch.setattr(app.requests, "request", lambda method, url, **kwargs: FakeResponse())
+    url = "https://stream.example.test/v1/chat"
+    limiter = app.host_limiter(url)
+    response = app.upstream_post(url, stream=True)
+    assert limiter.in_flight == 1
+    response.close()
+    response.close()
+    assert limiter.in_flight == 0
+    app.upstream_get(url)
+    assert limiter.in_flight == 0
+
+def test_breaker_opens_after_repeated_errors(monkeypatch):
+    def refuse(method, url, **kwargs):
+        raise requests.exceptions.ConnectionError("refused")
+    monkeypatch.setattr(app.requests, "request", refuse)
+    url = "https://breaker.example.test/prices"
+    for _ in range(app.BREAKER_FAILURES):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            app.upstream_get(url)
+    with pytest.raises(app.UpstreamUnavailable):
+        app.upstream_get(url)
+    assert app.host_limiter(url).breaker() == "open"
+
+def test_ai_stream_relays_utf8_tokens(client, monkeypatch):
+    text = "Buy — strong 📈"
+    chunks = [text[:5], text[5:]]
+    body = "".join(f"data: {json.dumps({'choices': [{'delta': {'content': part}}]}, ensure_ascii=False)}\n\n"
+                   for part in chunks) + "data: [DONE]\n\n"
+    upstream = requests.Response()
+    upstream.status_code = 200
+    upstream.raw = io.BytesIO(body.encode("utf-8"))
+    # No charset, so requests alone would pick ISO-8859-1
+    upstream.headers["Content-Type"] = "text/event-stream"
+    upstream.encoding = requests.utils.get_encoding_from_headers(upstream.headers)
+    monkeypatch.setattr(app, "XAI_API_KEY", "test-key")
+    monkeypatch.setattr(app, "upstream_post", lambda url, **kwargs: upstream)
+    response = client.post("/analyze_ai/stream", json={"ticker": "UTF8-USD", "category": "CRYPTO"})
+    events = [json.loads(line[5:]) for line in response.get_data(as_text=True).splitlines() if line.startswith("data:")]
+    assert [event["text"] for event in events if event["type"] == "delta"] == chunks
+    assert events[-1]["type"] == "done"
+    assert app.cache.get("grok", "CRYPTO:UTF8-USD") == text